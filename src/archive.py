@@ -0,0 +1,187 @@
+"""Archival of closed jobs to cold storage.
+
+Jobs that have been closed for longer than ARCHIVE_AFTER_DAYS are moved out of the database together with their applications, interviews and scorecards, so the hot tables and their indexes only hold jobs that are still being worked on.
+Each job is written to a gzipped JSON file under ARCHIVE_DIR and recorded in the archived_jobs table, and is then deleted.
+Jobs are archived ARCHIVE_BATCH_SIZE at a time, each batch in its own short transaction, so locks are only held on a few jobs at once.
+Run the `flask db archive-jobs` command, or enqueue the archive_closed_jobs task, which re-enqueues itself until there is nothing left to archive.
+"""
+
+from main import db
+from models.jobs import Job
+from models.applications import Application
+from models.interviews import Interview
+from models.scorecards import Scorecard
+from models.archived_jobs import ArchivedJob
+from audit import json_value
+import change_feed
+from tasks import task, enqueue
+
+from flask import current_app
+from sqlalchemy import inspect
+from sqlalchemy.orm import selectinload
+from datetime import datetime, timedelta
+import gzip
+import json
+import os
+
+
+def record_fields(record):
+    """Returns every column of a record as a dict that can be serialised to JSON."""
+    return {
+        attribute.key: json_value(getattr(record, attribute.key))
+        for attribute in inspect(record).mapper.column_attrs
+    }
+
+
+def job_document(job):
+    """Returns a job with its applications, their interviews and the interviews' scorecards nested inside it."""
+    return {
+        **record_fields(job),
+        "applications": [
+            {
+                **record_fields(application),
+                "interviews": [
+                    {
+                        **record_fields(interview),
+                        "scorecards": [record_fields(scorecard) for scorecard in interview.scorecards],
+                    }
+                    for interview in application.interviews
+                ],
+            }
+            for application in job.applications
+        ],
+    }
+
+
+def archive_path(job_id):
+    """Returns the archive file for a job relative to ARCHIVE_DIR, in subdirectories of 1000 jobs each."""
+    return os.path.join("jobs", f"{job_id // 1000:06d}", f"{job_id}.json.gz")
+
+
+def write_archive(path, document):
+    """Writes a document to an archive file, which is only renamed into place once it is safely on disk."""
+    full_path = os.path.join(current_app.config["ARCHIVE_DIR"], path)
+    directory = os.path.dirname(full_path)
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{full_path}.tmp"
+    with open(temp_path, "wb") as file:
+        with gzip.GzipFile(fileobj=file, mode="wb") as gzip_file:
+            gzip_file.write(json.dumps(document).encode())
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, full_path)
+    directory_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(directory_fd)
+    finally:
+        os.close(directory_fd)
+
+
+def read_archive(path):
+    """Reads a document back from an archive file."""
+    with gzip.open(os.path.join(current_app.config["ARCHIVE_DIR"], path), "rt") as file:
+        return json.load(file)
+
+
+def archive_batch(days=None, batch_size=None):
+    """Archives one batch of the jobs that have been closed the longest, and commits it.
+
+    The files are written before the transaction commits, so a job is only ever deleted once its archive is on disk.
+    If the commit fails the job is archived again by the next batch, overwriting its file.
+    The deletes are bulk deletes, so they aren't recorded in the audit log, as the archive file holds the deleted records.
+    They are added to the change feed, so synced clients drop the archived jobs, applications and interviews.
+
+    Args:
+        days: How long a job must have been closed for, defaulting to ARCHIVE_AFTER_DAYS.
+        batch_size: The maximum number of jobs to archive, defaulting to ARCHIVE_BATCH_SIZE.
+
+    Returns:
+        The number of jobs archived.
+    """
+    config = current_app.config
+    days = config["ARCHIVE_AFTER_DAYS"] if days is None else days
+    batch_size = batch_size or config["ARCHIVE_BATCH_SIZE"]
+    now = datetime.now()
+    # jobs closed before closed_at was recorded start their wait from now:
+    db.session.execute(
+        db.update(Job).where(Job.status == "Closed", Job.closed_at.is_(None)).values(closed_at=now)
+    )
+    # skips jobs locked by another archiver, or by a request updating them:
+    job_ids = db.session.scalars(
+        db.select(Job.id)
+        .where(Job.status == "Closed", Job.closed_at < now - timedelta(days=days))
+        .order_by(Job.closed_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not job_ids:
+        db.session.commit()
+        return 0
+    query = (
+        db.select(Job)
+        .where(Job.id.in_(job_ids))
+        .options(
+            selectinload(Job.applications)
+            .selectinload(Application.interviews)
+            .selectinload(Interview.scorecards)
+        )
+    )
+    archived_jobs = db.session.scalars(query).all()
+    for job in archived_jobs:
+        path = archive_path(job.id)
+        write_archive(path, job_document(job))
+        db.session.add(
+            ArchivedJob(
+                job_id=job.id,
+                title=job.title,
+                department=job.department,
+                closed_at=job.closed_at,
+                archived_at=now,
+                application_count=len(job.applications),
+                path=path,
+            )
+        )
+    application_ids = [application.id for job in archived_jobs for application in job.applications]
+    interview_ids = [
+        interview.id
+        for job in archived_jobs
+        for application in job.applications
+        for interview in application.interviews
+    ]
+    for job in archived_jobs:
+        change_feed.record(db.session, job, "delete")
+        for application in job.applications:
+            change_feed.record(db.session, application, "delete")
+            for interview in application.interviews:
+                change_feed.record(db.session, interview, "delete")
+    # children first, as the foreign keys don't cascade in the database:
+    for statement in (
+        db.delete(Scorecard).where(Scorecard.interview_id.in_(interview_ids)),
+        db.delete(Interview).where(Interview.id.in_(interview_ids)),
+        db.delete(Application).where(Application.id.in_(application_ids)),
+        db.delete(Job).where(Job.id.in_(job_ids)),
+    ):
+        db.session.execute(statement.execution_options(synchronize_session=False))
+    db.session.commit()
+    return len(archived_jobs)
+
+
+def archive_closed_jobs(days=None, batch_size=None):
+    """Archives batches of closed jobs until none are left to archive.
+
+    Returns:
+        The total number of jobs archived.
+    """
+    total = 0
+    while True:
+        archived = archive_batch(days, batch_size)
+        total += archived
+        if archived < (batch_size or current_app.config["ARCHIVE_BATCH_SIZE"]):
+            return total
+
+
+@task("archive_closed_jobs")
+def archive_closed_jobs_task(days=None):
+    """Archives one batch of closed jobs, and enqueues the next batch if there may be more to archive."""
+    if archive_batch(days) == current_app.config["ARCHIVE_BATCH_SIZE"]:
+        enqueue("archive_closed_jobs", days=days)
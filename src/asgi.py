@@ -0,0 +1,298 @@
+"""Async serving mode for the read-heavy job board and interview routes.
+
+Run with an ASGI server, after installing the packages in requirements-async.txt:
+    uvicorn asgi:app --workers 4
+
+GET requests for the job board and interviews are served by async views that query Postgres through asyncpg, so a worker can hold many slow requests open at once without a thread for each.
+Every other route is passed through to the Flask app unchanged, so both modes return the same responses.
+
+GET /events/ streams live events to the authenticated user as Server-Sent Events, and is only served in this mode (see events.py).
+"""
+
+from main import create_app
+from models.jobs import Job
+from models.staff import Staff
+from models.candidates import Candidate
+from models.interviews import Interview, interviews_staff_view_schema, interviews_view_schema
+from controllers.jobs_controller import jobs_schema_for_staff
+from controllers.interviews_controller import INTERVIEW_FILTERS, INTERVIEW_SORTS
+from compression import choose_encoding, compress_body
+from fieldsets import fieldset_schema, load_options, requested_fields
+from filters import filter_and_sort
+from events import EventHub, format_event, subscriber_keys
+from staff_cache import CACHED_COLUMNS, referenced_staff_ids, staff_cache
+from job_board_cache import cache_key, job_board_cache
+
+from a2wsgi import WSGIMiddleware
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from marshmallow.exceptions import ValidationError
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_accept_header
+import asyncio
+
+flask_app = create_app()
+config = flask_app.config
+
+engine = create_async_engine(
+    make_url(config["SQLALCHEMY_DATABASE_URI"]).set(drivername="postgresql+asyncpg"),
+    pool_size=config["ASYNC_POOL_SIZE"],
+    max_overflow=config["ASYNC_MAX_OVERFLOW"],
+)
+Session = async_sessionmaker(engine, expire_on_commit=False)
+# the LISTEN connection is opened outside the pool, with the same connection settings:
+event_hub = EventHub(
+    engine.dialect.create_connect_args(engine.url)[1], config["EVENTS_CHANNEL"], config["EVENTS_QUEUE_SIZE"]
+)
+
+
+class AuthError(Exception):
+    """Carries the Flask response for a missing, invalid or revoked JWT."""
+
+    def __init__(self, response):
+        self.response = response
+
+
+def _verify_jwt(authorization, optional):
+    """Checks a JWT with the Flask app's JWT settings, error responses and revocation checks."""
+    headers = {"Authorization": authorization} if authorization else {}
+    with flask_app.test_request_context(headers=headers):
+        try:
+            verify_jwt_in_request(optional=optional)
+        except Exception as err:
+            response = flask_app.make_response(flask_app.handle_user_exception(err))
+            raise AuthError(
+                Response(response.get_data(), response.status_code, media_type=response.mimetype)
+            )
+        return get_jwt_identity()
+
+
+async def jwt_identity(request, optional=False):
+    """Returns the identity from the request's JWT, or None if optional and no JWT was provided.
+
+    The revocation check can hit the database through Flask-SQLAlchemy, so it is run in the threadpool.
+    """
+    return await run_in_threadpool(_verify_jwt, request.headers.get("Authorization"), optional)
+
+
+def fieldset(model, schema, args):
+    """Applies the ?fields= query parameter to a schema, and returns the loader options for it.
+
+    Relationships can't be lazy loaded by an async session, so everything the schema serialises is loaded up front, whether or not fields were requested.
+    """
+    only = requested_fields(schema, args)
+    options = load_options(model, schema, only or tuple(schema.dump_fields))
+    return options, schema if only is None else fieldset_schema(schema, only)
+
+
+async def dump(session, schema, records):
+    """Serialises records with a schema, first loading the Staff members its StaffReference fields need into the staff cache with the async session.
+
+    The fields look up anything still missing through Flask-SQLAlchemy, such as an entry that expired in between, so the dump has an app context.
+    """
+    missing = staff_cache.missing(referenced_staff_ids(schema, records if schema.many else [records]))
+    if missing:
+        staff_cache.put(await session.execute(select(*CACHED_COLUMNS).where(Staff.id.in_(missing))))
+    with flask_app.app_context():
+        return schema.dump(records)
+
+
+def accepted_encoding(request):
+    """Picks the encoding to compress the response with from the Accept-Encoding header, as the Compress extension does."""
+    return choose_encoding(parse_accept_header(request.headers.get("Accept-Encoding")))
+
+
+def json_response(request, data, status_code=200, headers=None):
+    """Serialises data the same way as the Flask app, compressing it as the Compress extension would."""
+    body = flask_app.json.response(data).get_data()
+    headers = dict(headers or {})
+    if 200 <= status_code < 300:
+        headers["Vary"] = "Accept-Encoding"
+        encoding = accepted_encoding(request)
+        if encoding and len(body) >= config["COMPRESS_MIN_SIZE"]:
+            body = compress_body(body, encoding, config)
+            headers["Content-Encoding"] = encoding
+    return Response(body, status_code, headers, media_type="application/json")
+
+
+async def staff_for_jobs(session, user_id):
+    """Looks up the Staff record used to select the Jobs schema, as jobs_schema_for_user does."""
+    if user_id is None:
+        return None
+    return await session.scalar(select(Staff).filter_by(id=int(user_id)))
+
+
+def build_open_jobs(schema, options):
+    """Builds the body of the open jobs through Flask-SQLAlchemy, for a job board cache miss."""
+    with flask_app.app_context():
+        query = Job.query.filter_by(status="Open").order_by(Job.id).options(*options)
+        return flask_app.json.response(schema.dump(query.all())).get_data(as_text=True)
+
+
+async def get_open_jobs(request):
+    """Async version of jobs_controller.get_open_jobs.
+
+    The job board cache is shared with the Flask routes, and a miss is rebuilt in the threadpool, so that the requests that miss at the same time
+    wait for one rebuild through single_flight like the Flask routes do, rather than each running the query.
+    """
+    user_id = await jwt_identity(request, optional=True)
+    async with Session() as session:
+        schema = jobs_schema_for_staff(await staff_for_jobs(session, user_id), many=True)
+        options, schema = fieldset(Job, schema, request.query_params)
+        if config["JOB_BOARD_CACHE_SECONDS"] <= 0:
+            query = select(Job).filter_by(status="Open").order_by(Job.id).options(*options)
+            jobs = (await session.scalars(query)).all()
+            return json_response(request, await dump(session, schema, jobs))
+    key = cache_key("open", schema)
+    encoding = accepted_encoding(request)
+    cached = job_board_cache.peek(key, encoding)
+    if cached is None:
+        cached = await run_in_threadpool(job_board_cache.get, key, lambda: build_open_jobs(schema, options), encoding)
+    body, content_encoding = cached
+    headers = {"Vary": "Accept-Encoding"}
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return Response(body, 200, headers, media_type="application/json")
+
+
+async def get_all_jobs(request):
+    """Async version of jobs_controller.get_all_jobs."""
+    user_id = await jwt_identity(request, optional=True)
+    async with Session() as session:
+        schema = jobs_schema_for_staff(await staff_for_jobs(session, user_id), many=True)
+        options, schema = fieldset(Job, schema, request.query_params)
+        jobs = (await session.scalars(select(Job).order_by(Job.id).options(*options))).all()
+        result = await dump(session, schema, jobs)
+    return json_response(request, result)
+
+
+async def get_one_job(request):
+    """Async version of jobs_controller.get_one_job."""
+    id = request.path_params["id"]
+    user_id = await jwt_identity(request, optional=True)
+    async with Session() as session:
+        schema = jobs_schema_for_staff(await staff_for_jobs(session, user_id), many=False)
+        options, schema = fieldset(Job, schema, request.query_params)
+        job = await session.scalar(select(Job).filter_by(id=id).options(*options))
+        result = await dump(session, schema, job) if job else None
+    if job:
+        # the same ETag as versioning.with_etag:
+        return json_response(request, result, headers={"ETag": f'"{job.version}"'})
+    else:
+        return json_response(request, {"Error": f"Job not found with id {id}"}, 404)
+
+
+async def get_all_interviews(request):
+    """Async version of interviews_controller.get_all_interviews, including the authorise_as_admin check."""
+    user_id = await jwt_identity(request)
+    async with Session() as session:
+        user = await session.scalar(select(Staff).filter_by(user_id=int(user_id)))
+        if not user or not user.admin:
+            return json_response(request, {"error": "Not authorised to perform this action"}, 403)
+        query = filter_and_sort(
+            select(Interview),
+            INTERVIEW_FILTERS,
+            INTERVIEW_SORTS,
+            default_sort=[Interview.interview_datetime],
+            args=request.query_params,
+        )
+        options, schema = fieldset(Interview, interviews_staff_view_schema, request.query_params)
+        interview_list = (await session.scalars(query.options(*options))).all()
+        result = await dump(session, schema, interview_list)
+    return json_response(request, result)
+
+
+async def get_my_interviews(request):
+    """Async version of interviews_controller.get_my_interviews."""
+    user_id = int(await jwt_identity(request))
+    async with Session() as session:
+        # checks for user in Staff, then in Candidates:
+        user = await session.scalar(select(Staff).filter_by(user_id=user_id))
+        if user:
+            query = select(Interview).filter_by(interviewer_id=user.id)
+            schema = interviews_staff_view_schema
+        else:
+            user = await session.scalar(select(Candidate).filter_by(user_id=user_id))
+            query = select(Interview).filter_by(candidate_id=user.id) if user else None
+            schema = interviews_view_schema
+        if query is not None:
+            options, schema = fieldset(Interview, schema, request.query_params)
+            query = query.order_by(Interview.interview_datetime).options(*options)
+            result = await dump(session, schema, (await session.scalars(query)).all())
+            if len(result) > 0:
+                return json_response(request, result)
+    return json_response(request, {"message": "You have no scheduled interviews."})
+
+
+async def stream_events(request):
+    """Streams events for the authenticated user's applications, interviews and scorecards as Server-Sent Events.
+
+    A GET request opens a text/event-stream response that stays open. Requires a JWT in the Authorization header.
+    Candidates receive events for their own applications and interviews, staff for the jobs they manage and the interviews they run, and admins receive every event.
+    Each event has a type, such as application.updated, interview.created, interview.updated or scorecard.created, and JSON data with the ids of the record to fetch.
+    A comment is sent every EVENTS_HEARTBEAT_SECONDS to keep the connection open through proxies. The stream is ended if the client falls too far behind,
+    in which case it should reconnect and refresh anything it has shown.
+
+    Errors:
+        401: Displayed if no JWT is provided.
+        403: Displayed if the user has no Staff or Candidate record.
+    """
+    user_id = int(await jwt_identity(request))
+    async with Session() as session:
+        staff_member = await session.scalar(select(Staff).filter_by(user_id=user_id))
+        candidate = None if staff_member else await session.scalar(select(Candidate).filter_by(user_id=user_id))
+    keys = subscriber_keys(staff_member, candidate)
+    if not keys:
+        return json_response(request, {"error": "Not authorised to perform this action"}, 403)
+    queue = await event_hub.subscribe(keys)
+
+    async def events():
+        try:
+            yield f"retry: {config['EVENTS_RETRY_MS']}\n\n" + format_event("ready", {})
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), config["EVENTS_HEARTBEAT_SECONDS"])
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            event_hub.unsubscribe(queue, keys)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # stops proxies such as nginx from buffering the stream:
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def auth_error(request, err):
+    return err.response
+
+
+async def validation_error(request, err):
+    return json_response(request, {"error": err.messages}, 400)
+
+
+app = Starlette(
+    routes=[
+        Route("/jobs/", get_open_jobs, methods=["GET"]),
+        Route("/jobs/all/", get_all_jobs, methods=["GET"]),
+        Route("/jobs/{id:int}/", get_one_job, methods=["GET"]),
+        Route("/interviews/all", get_all_interviews, methods=["GET"]),
+        Route("/interviews/", get_my_interviews, methods=["GET"]),
+        Route("/events/", stream_events, methods=["GET"]),
+        # any other method or path falls through to the Flask app:
+        Mount("/", app=WSGIMiddleware(flask_app, workers=config["ASYNC_WSGI_THREADS"])),
+    ],
+    exception_handlers={AuthError: auth_error, ValidationError: validation_error},
+    on_shutdown=[event_hub.close, engine.dispose],
+)
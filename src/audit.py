@@ -0,0 +1,173 @@
+"""Write-behind audit trail of changes to Applications, Interviews and Scorecards.
+
+Changes are captured from the ORM session when it flushes, so the controllers don't need to record them, and are held on the session until it commits (or dropped if it rolls back).
+Committed changes are added to a buffer in each worker process, and a background thread writes the buffer to the audit_log table in batched multi-row inserts,
+every AUDIT_FLUSH_SECONDS or as soon as AUDIT_BATCH_SIZE changes are waiting, whichever comes first.
+A worker that crashes can lose at most the changes from the last AUDIT_FLUSH_SECONDS, and the buffer is also flushed when the process exits normally.
+"""
+
+from main import db
+from models.applications import Application
+from models.interviews import Interview
+from models.scorecards import Scorecard
+from models.audit_log import AuditLog
+
+from flask import has_request_context
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import SQLAlchemyError
+from datetime import date, datetime, time
+import atexit
+import os
+import threading
+
+AUDITED_MODELS = (Application, Interview, Scorecard)
+
+
+def json_value(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return value
+
+
+def record_changes(record, action):
+    """Returns the changed fields of a record as a dict of field names to [before, after] pairs.
+
+    Inserts list every field with an empty before value, and deletes list every field with an empty after value.
+    """
+    state = inspect(record)
+    changes = {}
+    for attribute in state.mapper.column_attrs:
+        if action == "update":
+            history = state.attrs[attribute.key].history
+            if not history.added and not history.deleted:
+                continue
+            before = json_value(history.deleted[0]) if history.deleted else None
+            after = json_value(history.added[0]) if history.added else None
+            if before != after:
+                changes[attribute.key] = [before, after]
+        else:
+            value = json_value(getattr(record, attribute.key))
+            changes[attribute.key] = [None, value] if action == "insert" else [value, None]
+    return changes
+
+
+def current_user_id():
+    """Returns the id of the authenticated user, or None outside of a request with a JWT."""
+    if not has_request_context():
+        return None
+    try:
+        user_id = get_jwt_identity()
+    except RuntimeError:
+        return None
+    return int(user_id) if user_id is not None else None
+
+
+class AuditBuffer:
+    """The per-worker buffer of committed changes waiting to be written to the audit_log table."""
+
+    def __init__(self):
+        self.app = None
+        self.rows = []
+        self.lock = threading.Lock()
+        # held while rows taken from the buffer are written, so a flush returns only once any write in progress has finished:
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        # a forked worker must start its own thread, and must not write the changes buffered by its parent:
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.rows = []
+        self.lock = threading.Lock()
+        # held while rows taken from the buffer are written, so a flush returns only once any write in progress has finished:
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+
+    def init_app(self, app):
+        self.app = app
+        self.config = app.config
+        for name in ("after_flush", "after_commit", "after_rollback"):
+            if not event.contains(Session, name, getattr(self, name)):
+                event.listen(Session, name, getattr(self, name))
+
+    def after_flush(self, session, flush_context):
+        """Captures the changes to audited records in this flush, and holds them on the session until it commits."""
+        pending = session.info.setdefault("audit_pending", [])
+        user_id = current_user_id()
+        changed_at = datetime.now()
+        for action, records in (("insert", session.new), ("update", session.dirty), ("delete", session.deleted)):
+            for record in records:
+                if not isinstance(record, AUDITED_MODELS):
+                    continue
+                changes = record_changes(record, action)
+                if changes:
+                    pending.append(
+                        {
+                            "changed_at": changed_at,
+                            "user_id": user_id,
+                            "table_name": record.__tablename__,
+                            "record_id": record.id,
+                            "action": action,
+                            "changes": changes,
+                        }
+                    )
+
+    def after_commit(self, session):
+        rows = session.info.pop("audit_pending", None)
+        if rows:
+            self.add(rows)
+
+    def after_rollback(self, session):
+        session.info.pop("audit_pending", None)
+
+    def add(self, rows):
+        """Adds committed changes to the buffer, writing them straight away if AUDIT_WRITE_BEHIND is turned off."""
+        if not self.config["AUDIT_WRITE_BEHIND"]:
+            self.write(rows)
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="audit-flush", daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+            self.rows.extend(rows)
+            overflow = len(self.rows) - self.config["AUDIT_MAX_BUFFER"]
+            if overflow > 0:
+                # only reached if the database has been unavailable for a while, so the oldest changes are dropped to bound memory:
+                del self.rows[:overflow]
+                self.app.logger.error(f"Audit buffer full, dropped {overflow} changes")
+            if len(self.rows) >= self.config["AUDIT_BATCH_SIZE"]:
+                self.wake.set()
+
+    def run(self):
+        while True:
+            self.wake.wait(self.config["AUDIT_FLUSH_SECONDS"])
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Writes every buffered change, putting them back in the buffer if the write fails."""
+        with self.flush_lock:
+            with self.lock:
+                rows, self.rows = self.rows, []
+            if not rows:
+                return
+            try:
+                self.write(rows)
+            except SQLAlchemyError as err:
+                self.app.logger.error(f"Audit flush of {len(rows)} changes failed: {err}")
+                with self.lock:
+                    self.rows[:0] = rows
+
+    def write(self, rows):
+        """Inserts changes into the audit_log table on a separate connection, AUDIT_BATCH_SIZE rows per INSERT statement."""
+        batch_size = self.config["AUDIT_BATCH_SIZE"]
+        with self.app.app_context(), db.engine.begin() as connection:
+            for i in range(0, len(rows), batch_size):
+                connection.execute(db.insert(AuditLog), rows[i : i + batch_size])
+
+
+audit_buffer = AuditBuffer()
@@ -0,0 +1,115 @@
+"""Change feed of inserts, updates and deletes to Jobs, Applications and Interviews, for clients that sync incrementally.
+
+Changes are captured from the ORM session when it flushes, like the audit log, and are written to the changes table just before the transaction commits.
+Their seq numbers come from a sequence, and sequence numbers are handed out when a row is inserted rather than when it commits,
+so two transactions could otherwise commit their changes out of order and a client reading past the later one would never see the earlier one.
+To prevent this, the changes are inserted while holding a transaction-level advisory lock, so change rows become visible strictly in seq order.
+The lock is only held from the insert to the commit, so it adds very little wait to concurrent writes.
+
+Bulk deletes that bypass the ORM, such as the archive module's, record their changes with record() before committing.
+
+Clients are given an opaque cursor for the last change they have read, and pass it back to read the changes after it.
+"""
+
+from main import db
+from models.jobs import Job
+from models.applications import Application
+from models.interviews import Interview
+from models.changes import Change
+
+from flask_sqlalchemy.session import Session
+from marshmallow.exceptions import ValidationError
+from sqlalchemy import event, inspect
+from datetime import datetime
+import base64
+
+TRACKED_MODELS = (Job, Application, Interview)
+VISIBILITY_FIELDS = ("candidate_id", "interviewer_id")
+# an arbitrary key shared by every writer of the change feed:
+CHANGE_FEED_LOCK = 4405764001
+
+
+def change_row(record, action, **overrides):
+    row = {
+        "table_name": record.__tablename__,
+        "record_id": record.id,
+        "action": action,
+        "candidate_id": getattr(record, "candidate_id", None),
+        "interviewer_id": getattr(record, "interviewer_id", None),
+    }
+    row.update(overrides)
+    return row
+
+
+def record(session, changed, action):
+    """Adds a change for a record that was changed outside of a flush, such as by a bulk delete, to be written when the session commits."""
+    session.info.setdefault("change_feed_pending", []).append(change_row(changed, action))
+
+
+class ChangeFeed:
+    """Captures changes from the session and writes them to the changes table in commit order."""
+
+    def init_app(self, app):
+        for name in ("after_flush", "before_commit", "after_rollback"):
+            if not event.contains(Session, name, getattr(self, name)):
+                event.listen(Session, name, getattr(self, name))
+
+    def after_flush(self, session, flush_context):
+        """Captures the changes to tracked records in this flush, and holds them on the session until it commits.
+
+        If an update moves a record to another candidate or interviewer, a delete is added for the previous one first, so they drop the record.
+        """
+        pending = session.info.setdefault("change_feed_pending", [])
+        for action, records in (("insert", session.new), ("update", session.dirty), ("delete", session.deleted)):
+            for changed in records:
+                if not isinstance(changed, TRACKED_MODELS):
+                    continue
+                if action == "update":
+                    if not session.is_modified(changed, include_collections=False):
+                        continue
+                    state = inspect(changed)
+                    for field in VISIBILITY_FIELDS:
+                        if field in state.attrs and state.attrs[field].history.deleted:
+                            previous = state.attrs[field].history.deleted[0]
+                            if previous is not None and previous != getattr(changed, field):
+                                pending.append(change_row(changed, "delete", **{field: previous}))
+                pending.append(change_row(changed, action))
+
+    def before_commit(self, session):
+        """Writes the pending changes under the change feed lock, which is held until the commit completes."""
+        # the commit's own flush happens after this hook, so it is done here to capture its changes:
+        session.flush()
+        pending = session.info.pop("change_feed_pending", None)
+        if not pending:
+            return
+        session.execute(db.select(db.func.pg_advisory_xact_lock(CHANGE_FEED_LOCK)))
+        changed_at = datetime.now()
+        session.execute(
+            db.insert(Change.__table__), [dict(row, changed_at=changed_at) for row in pending]
+        )
+
+    def after_rollback(self, session):
+        session.info.pop("change_feed_pending", None)
+
+
+change_feed = ChangeFeed()
+
+
+def encode_cursor(seq):
+    """Encodes a position in the change feed as an opaque cursor for clients."""
+    return base64.urlsafe_b64encode(f"v1:{seq}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Decodes a cursor from encode_cursor back to a position in the change feed.
+
+    Errors:
+        Raises a ValidationError, which is returned as a 400 error, if the cursor isn't one returned by the change feed.
+    """
+    try:
+        version, _, seq = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().partition(":")
+        if version == "v1" and seq.isdigit():
+            return int(seq)
+    except (ValueError, UnicodeDecodeError):
+        pass
+    raise ValidationError({"cursor": ["Invalid cursor."]})
@@ -0,0 +1,83 @@
+"""Response compression negotiated from the Accept-Encoding header.
+
+JSON responses over COMPRESS_MIN_SIZE bytes are compressed with brotli (when the optional brotli package is installed) or gzip.
+Streamed responses are compressed chunk by chunk as they are sent, so the full body is never buffered.
+"""
+
+from flask import request
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def choose_encoding(accept_encodings):
+    """Picks the best supported encoding from the client's Accept-Encoding header, or None to send the response uncompressed."""
+    offered = ["br", "gzip"] if brotli else ["gzip"]
+    return accept_encodings.best_match(offered)
+
+
+def compress_body(data, encoding, config):
+    """Compresses a complete response body with the given encoding."""
+    if encoding == "br":
+        return brotli.compress(data, quality=config["COMPRESS_BR_LEVEL"])
+    return gzip.compress(data, compresslevel=config["COMPRESS_LEVEL"])
+
+
+def compress_stream(chunks, encoding, config):
+    """Compresses a streamed response body one chunk at a time.
+
+    Each chunk is flushed as it is compressed, so the client can start decoding before the stream ends.
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=config["COMPRESS_BR_LEVEL"])
+        for chunk in chunks:
+            data = compressor.process(chunk if isinstance(chunk, bytes) else chunk.encode("utf-8"))
+            data += compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        # a wbits value of 31 writes a gzip header and trailer around the deflate stream:
+        compressor = zlib.compressobj(config["COMPRESS_LEVEL"], zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk if isinstance(chunk, bytes) else chunk.encode("utf-8"))
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class Compress:
+    """Flask extension that compresses responses in an after_request hook."""
+
+    def init_app(self, app):
+        self.config = app.config
+        app.after_request(self.after_request)
+
+    def after_request(self, response):
+        if (
+            response.mimetype not in self.config["COMPRESS_MIMETYPES"]
+            or not 200 <= response.status_code < 300
+            or response.status_code == 204
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = choose_encoding(request.accept_encodings)
+        if not encoding:
+            return response
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding, self.config)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < self.config["COMPRESS_MIN_SIZE"]:
+                return response
+            response.set_data(compress_body(data, encoding, self.config))
+        response.headers["Content-Encoding"] = encoding
+        return response
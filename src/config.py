@@ -5,6 +5,78 @@ class Config(object):
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     JWT_SECRET_KEY = os.environ.get("SECRET_KEY")
     JSON_SORT_KEYS = False
+    TASK_MAX_ATTEMPTS = int(os.environ.get("TASK_MAX_ATTEMPTS", 5))
+    TASK_RETRY_BACKOFF = int(os.environ.get("TASK_RETRY_BACKOFF", 30))
+    TASK_VISIBILITY_TIMEOUT = int(os.environ.get("TASK_VISIBILITY_TIMEOUT", 300))
+    WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", 1))
+    WORKER_THREADS = int(os.environ.get("WORKER_THREADS", 4))
+    DENYLIST_REFRESH_SECONDS = int(os.environ.get("DENYLIST_REFRESH_SECONDS", 5))
+    DENYLIST_CAPACITY = int(os.environ.get("DENYLIST_CAPACITY", 100000))
+    DENYLIST_ERROR_RATE = float(os.environ.get("DENYLIST_ERROR_RATE", 0.001))
+    LOGIN_THROTTLE_ENABLED = os.environ.get("LOGIN_THROTTLE_ENABLED", "true").lower() == "true"
+    LOGIN_THROTTLE_PATH = os.environ.get("LOGIN_THROTTLE_PATH", "/tmp/ats_login_throttle.sqlite3")
+    LOGIN_IP_BURST = int(os.environ.get("LOGIN_IP_BURST", 20))
+    LOGIN_IP_PER_MINUTE = int(os.environ.get("LOGIN_IP_PER_MINUTE", 30))
+    LOGIN_EMAIL_BURST = int(os.environ.get("LOGIN_EMAIL_BURST", 5))
+    LOGIN_EMAIL_PER_MINUTE = int(os.environ.get("LOGIN_EMAIL_PER_MINUTE", 5))
+    # the number of reverse proxies in front of the app, whose X-Forwarded-For entries are trusted for the client's address:
+    TRUSTED_PROXY_COUNT = int(os.environ.get("TRUSTED_PROXY_COUNT", 0))
+    COMPRESS_MIMETYPES = ["application/json"]
+    COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+    COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", 6))
+    COMPRESS_BR_LEVEL = int(os.environ.get("COMPRESS_BR_LEVEL", 4))
+    ASYNC_POOL_SIZE = int(os.environ.get("ASYNC_POOL_SIZE", 20))
+    ASYNC_MAX_OVERFLOW = int(os.environ.get("ASYNC_MAX_OVERFLOW", 10))
+    ASYNC_WSGI_THREADS = int(os.environ.get("ASYNC_WSGI_THREADS", 10))
+    AUDIT_WRITE_BEHIND = True
+    AUDIT_FLUSH_SECONDS = float(os.environ.get("AUDIT_FLUSH_SECONDS", 2))
+    AUDIT_BATCH_SIZE = int(os.environ.get("AUDIT_BATCH_SIZE", 500))
+    AUDIT_MAX_BUFFER = int(os.environ.get("AUDIT_MAX_BUFFER", 50000))
+    PARTITION_MONTHS_AHEAD = int(os.environ.get("PARTITION_MONTHS_AHEAD", 3))
+    # a comma-separated list, from applications and interviews:
+    PARTITIONED_TABLES = [name for name in os.environ.get("PARTITIONED_TABLES", "").split(",") if name]
+    # comma-separated table=months pairs, such as "applications=36,audit_log=84":
+    PARTITION_RETENTION_MONTHS = {
+        table: int(months)
+        for table, _, months in (
+            pair.partition("=") for pair in os.environ.get("PARTITION_RETENTION_MONTHS", "").split(",") if pair
+        )
+    }
+    REQUIRE_IF_MATCH = os.environ.get("REQUIRE_IF_MATCH", "false").lower() == "true"
+    IDEMPOTENCY_KEY_TTL_HOURS = int(os.environ.get("IDEMPOTENCY_KEY_TTL_HOURS", 24))
+    TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", 0))
+    TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH", "/tmp/ats_traces.jsonl")
+    TRACE_SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "ats-api")
+    STAFF_CACHE_SIZE = int(os.environ.get("STAFF_CACHE_SIZE", 1000))
+    STAFF_CACHE_TTL_SECONDS = float(os.environ.get("STAFF_CACHE_TTL_SECONDS", 60))
+    JOB_BOARD_CACHE_SECONDS = float(os.environ.get("JOB_BOARD_CACHE_SECONDS", 10))
+    JOB_BOARD_CACHE_SIZE = int(os.environ.get("JOB_BOARD_CACHE_SIZE", 100))
+    SINGLE_FLIGHT_TIMEOUT_SECONDS = float(os.environ.get("SINGLE_FLIGHT_TIMEOUT_SECONDS", 5))
+    SINGLE_FLIGHT_ADVISORY_LOCK = os.environ.get("SINGLE_FLIGHT_ADVISORY_LOCK", "false").lower() == "true"
+    DASHBOARD_NEWEST_APPLICANTS = int(os.environ.get("DASHBOARD_NEWEST_APPLICANTS", 5))
+    DASHBOARD_UPCOMING_INTERVIEWS = int(os.environ.get("DASHBOARD_UPCOMING_INTERVIEWS", 10))
+    ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", os.path.join(os.path.dirname(__file__), "job_archive"))
+    ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 180))
+    ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", 50))
+    DEDUPE_PHONE_DIGITS = int(os.environ.get("DEDUPE_PHONE_DIGITS", 9))
+    DEDUPE_NAME_THRESHOLD = float(os.environ.get("DEDUPE_NAME_THRESHOLD", 0.85))
+    DEDUPE_PHONE_NAME_THRESHOLD = float(os.environ.get("DEDUPE_PHONE_NAME_THRESHOLD", 0.5))
+    DEDUPE_MAX_BLOCK_SIZE = int(os.environ.get("DEDUPE_MAX_BLOCK_SIZE", 50))
+    DEDUPE_INSERT_BATCH_SIZE = int(os.environ.get("DEDUPE_INSERT_BATCH_SIZE", 1000))
+    EVENTS_CHANNEL = os.environ.get("EVENTS_CHANNEL", "ats_events")
+    EVENTS_QUEUE_SIZE = int(os.environ.get("EVENTS_QUEUE_SIZE", 100))
+    EVENTS_HEARTBEAT_SECONDS = float(os.environ.get("EVENTS_HEARTBEAT_SECONDS", 15))
+    EVENTS_RETRY_MS = int(os.environ.get("EVENTS_RETRY_MS", 3000))
+    SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", os.path.join(os.path.dirname(__file__), "db_snapshot"))
+    SNAPSHOT_WORKERS = int(os.environ.get("SNAPSHOT_WORKERS", 4))
+    SNAPSHOT_MAINTENANCE_WORK_MEM = os.environ.get("SNAPSHOT_MAINTENANCE_WORK_MEM", "256MB")
+    CHANGE_FEED_RETENTION_DAYS = int(os.environ.get("CHANGE_FEED_RETENTION_DAYS", 30))
+    CHANGE_FEED_DEFAULT_LIMIT = int(os.environ.get("CHANGE_FEED_DEFAULT_LIMIT", 100))
+    CHANGE_FEED_MAX_LIMIT = int(os.environ.get("CHANGE_FEED_MAX_LIMIT", 1000))
+    PLAN_LARGE_TABLE_ROWS = int(os.environ.get("PLAN_LARGE_TABLE_ROWS", 10000))
+    PLAN_SNAPSHOT_DIR = os.environ.get(
+        "PLAN_SNAPSHOT_DIR", os.path.join(os.path.dirname(__file__), "plan_snapshots")
+    )
 
     @property
     def SQLALCHEMY_DATABASE_URI(self):
@@ -26,6 +98,10 @@ class ProductionConfig(Config):
 
 class TestingConfig(Config):
     TESTING = True
+    LOGIN_THROTTLE_ENABLED = False
+    AUDIT_WRITE_BEHIND = False
+    # the minimum bcrypt cost, as the tests log in and register users far more often than real users:
+    BCRYPT_LOG_ROUNDS = 4
 
 
 environment = os.environ.get("FLASK_ENV")
@@ -11,6 +11,8 @@ from controllers.interviews_controller import interviews
 from controllers.scorecards_controller import scorecards
 from controllers.staff_controller import staff
 from controllers.candidates_controller import candidates
+from controllers.audit_controller import audit
+from controllers.changes_controller import changes
 
 controllers = [
     jobs,
@@ -20,5 +22,7 @@ controllers = [
     interviews,
     scorecards,
     staff, 
-    candidates
+    candidates,
+    audit,
+    changes,
 ]
\ No newline at end of file
@@ -1,49 +1,145 @@
 from main import db
 from models.applications import (
     Application,
+    VALID_STATUSES,
     application_schema,
     application_view_schema,
     application_staff_view_schema,
     applications_staff_view_schema,
+    application_bulk_status_schema,
 )
 from models.candidates import Candidate
+from models.application_status_history import ApplicationStatusChange, application_status_changes_schema
 from controllers.auth_controller import authorise_as_admin, authorise_as_staff
-
-
-from flask import Blueprint, jsonify, request
-from datetime import date
+from tasks import task, enqueue
+from fieldsets import sparse_fieldset
+from filters import QueryFilter, filter_and_sort
+from idempotency import idempotent
+from versioning import check_if_match, with_etag
+from events import publish
+from status_history import time_in_stage, time_to_status
+
+from flask import Blueprint, jsonify, request, current_app
+from marshmallow import fields
+from marshmallow.validate import OneOf
+from datetime import date, datetime, timedelta
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from marshmallow.exceptions import ValidationError
 from psycopg2 import errorcodes
 
 
 applications = Blueprint("applications", __name__, url_prefix="/applications")
 
+APPLICATION_FILTERS = {
+    "status": QueryFilter(Application.status, fields.String(validate=OneOf(VALID_STATUSES))),
+    "job_id": QueryFilter(Application.job_id, fields.Integer()),
+    "candidate_id": QueryFilter(Application.candidate_id, fields.Integer()),
+    "location": QueryFilter(Application.location, fields.String()),
+    "application_date": QueryFilter(
+        Application.application_date, fields.Date(format="%Y-%m-%d"), range=True
+    ),
+}
+APPLICATION_SORTS = {
+    "id": Application.id,
+    "application_date": Application.application_date,
+    "status": Application.status,
+    "job_id": Application.job_id,
+}
+
+
+@task("notify_application_status")
+def notify_application_status(application_id, status):
+    """Background task that notifies the candidate that their application status has changed.
+
+    There is no email service yet, so the notification is logged.
+    """
+    application = db.session.get(Application, application_id)
+    if application:
+        current_app.logger.info(
+            f"Notifying {application.candidate.name} that their application for {application.job.title} is now '{status}'"
+        )
+
+ANALYTICS_ARGS = {
+    "date_from": fields.Date(format="%Y-%m-%d"),
+    "date_to": fields.Date(format="%Y-%m-%d"),
+    "job_id": fields.Integer(),
+    "status": fields.String(validate=OneOf(VALID_STATUSES)),
+}
+
+
+def change_status(application, status):
+    """Sets the status of an application, and if it changed, queues the notification for the candidate and publishes an application.updated event.
+
+    The status change is added to the application's status history by the status_history module when the session flushes.
+
+    Returns:
+        True if the status changed.
+    """
+    if status == application.status:
+        return False
+    application.status = status
+    enqueue("notify_application_status", application_id=application.id, status=status)
+    publish(
+        "application.updated",
+        {"id": application.id, "status": status},
+        candidate_ids=[application.candidate_id],
+        staff_ids=[application.job.hiring_manager_id],
+    )
+    return True
+
+
+def analytics_args():
+    """Parses the date range and job_id query parameters of the analytics routes, defaulting to the last 365 days."""
+    args = {}
+    for name, field in ANALYTICS_ARGS.items():
+        if name in request.args:
+            try:
+                args[name] = field.deserialize(request.args[name])
+            except ValidationError as err:
+                raise ValidationError({name: err.messages})
+    date_to = datetime.combine(args.get("date_to", date.today()), datetime.min.time()) + timedelta(days=1)
+    date_from = (
+        datetime.combine(args["date_from"], datetime.min.time())
+        if "date_from" in args
+        else date_to - timedelta(days=365)
+    )
+    return date_from, date_to, args
+
+
 @applications.route("/", methods=["GET"])
 @jwt_required()
 @authorise_as_admin
 def get_all_applications():
     """Retrieves rows from Applications table.
 
-    A GET request is used to retrieve all records in the Applications table. Requires a JWT and for a user to have the admin permission.
+    A GET request is used to retrieve all records in the Applications table, or the records that match the filters provided. Requires a JWT and for a user to have the admin permission.
 
     Args:
         None required.
 
     Input:
-        None required.
+        None required. Optionally a "fields" query parameter, a comma-separated list of the fields to return (nested fields use dots, such as candidate.name).
+        Optionally filters on status, job_id, candidate_id or location (one value, or comma-separated values to match any of them), and application_date_from or application_date_to in YYYY-MM-DD format.
+        Optionally a "sort" query parameter, a comma-separated list of id, application_date, status or job_id, with a leading "-" for descending order.
 
     Returns:
-        Key value pairs for all fields for each record in the Applications table, in JSON format. Records are sorted in ascending order by application date.
+        Key value pairs for all fields (or the requested fields) for each matching record in the Applications table, in JSON format. Records are sorted in ascending order by application date unless a sort is provided.
 
     Errors:
+        400: Displayed if a requested field isn't available, a filter value is invalid or a sort key isn't allowed.
         403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
         401: Displayed if no JWT is provided.
     """
-    applications_list = (
-        Application.query.order_by(Application.application_date).all()
+    query = filter_and_sort(
+        Application.query,
+        APPLICATION_FILTERS,
+        APPLICATION_SORTS,
+        default_sort=[Application.application_date],
     )
-    result = applications_staff_view_schema.dump(applications_list)
+    query, schema = sparse_fieldset(query, Application, applications_staff_view_schema)
+    result = schema.dump(query.all())
     return jsonify(result)
 
 
@@ -59,26 +155,32 @@ def get_one_application(id):
         application.id
 
     Input:
-        None required.
+        None required. Optionally a "fields" query parameter, a comma-separated list of the fields to return (nested fields use dots, such as candidate.name).
 
     Returns:
-        Key value pairs for all fields in the requested record in the Applications table, in JSON format.
+        Key value pairs for all fields (or the requested fields) in the requested record in the Applications table, in JSON format.
 
     Errors:
+        400: Displayed if a requested field isn't available.
         404: Displayed if the id provided as an arg doesn't match a record in the Applications table.
         403: Displayed if the user does not meet the conditions of the authorise_as_staff wrapper functions.
         401: Displayed if no JWT is provided.
     """
-    query = db.select(Application).filter_by(id=id)
+    query, schema = sparse_fieldset(
+        db.select(Application).filter_by(id=id),
+        Application,
+        application_staff_view_schema,
+    )
     application = db.session.scalar(query)
     if application:
-        return application_staff_view_schema.dump(application)
+        return with_etag(schema.dump(application), application)
     else:
         return {"Error": f"Application not found with id {id}"}, 404
 
 
 @applications.route("/", methods=["POST"])
 @jwt_required()
+@idempotent
 def create_application():
     """Creates a new record in the Applications table.
 
@@ -89,6 +191,7 @@ def create_application():
 
     Input:
         job_id, resume, location, salary_expectations, notice_period and working_rights fields, in JSON format.
+        Optionally an Idempotency-Key header, so that a retried request is given the stored response instead of creating the record again.
 
     Returns:
         Key value pairs for all fields for the new record in the Applications table, in JSON format.
@@ -97,6 +200,7 @@ def create_application():
         400: Displayed if a value provided for a field doesn't match a validation criteria.
         409: Displayed if a required field is not provided.
         404: Displayed if the job_id provided doesn't match a record in the Jobs table.
+        422: Displayed if the Idempotency-Key header has already been used for a different request.
         401: Displayed if the authenticated user does not have a linked record in the Candidates table.
         401: Displayed if no JWT is provided.
     """
@@ -116,7 +220,7 @@ def create_application():
         new_application.resume = application_fields["resume"]
         db.session.add(new_application)
         db.session.commit()
-        return jsonify(application_view_schema.dump(new_application)), 201
+        return with_etag(jsonify(application_view_schema.dump(new_application)), new_application), 201
     except IntegrityError as err:
         if err.orig.pgcode == errorcodes.NOT_NULL_VIOLATION:
             return {
@@ -137,19 +241,23 @@ def update_application(id):
     """Updates a specified record in Applications table, only for admin users.
 
     A PUT or PATCH request is used to update the status field for a specified record in the Applications table. Requires a JWT and for a user to have the admin permission.
+    If the status changes, a background task to notify the candidate is queued, an application.updated event is published to the candidate and hiring manager, and the change is added to the status history, all in the same transaction.
 
     Args:
         application.id
 
     Input:
         Valid string value for "status".
+        Optionally an If-Match header with the record's ETag, so the update is rejected if the record has changed since it was retrieved. Required if REQUIRE_IF_MATCH is turned on.
 
     Returns:
-        Key value pairs for all fields for the updated record in the Applications table, in JSON format.
+        Key value pairs for all fields for the updated record in the Applications table, in JSON format, with its new version in the ETag header.
 
     Errors:
         400: Displayed if an invalid status value is provided.
         404: Displayed if the id provided as an arg doesn't match a record in the Applications table.
+        412: Displayed if the If-Match header doesn't match the record's ETag, or the record is changed by another request before this update is saved.
+        428: Displayed if REQUIRE_IF_MATCH is turned on and no If-Match header is provided.
         403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
         401: Displayed if no JWT is provided.
     """
@@ -157,13 +265,146 @@ def update_application(id):
     query = db.select(Application).filter_by(id=id)
     application = db.session.scalar(query)
     if application:
-        application.status = body_data.get("status") or application.status
+        precondition_error = check_if_match(application)
+        if precondition_error:
+            return precondition_error
+        change_status(application, body_data.get("status") or application.status)
         db.session.commit()
-        return application_staff_view_schema.dump(application)
+        return with_etag(application_staff_view_schema.dump(application), application)
+    else:
+        return {"error": f"Application not found with id {id}"}, 404
+
+
+@applications.route("/status/", methods=["PUT", "PATCH"])
+@jwt_required()
+@authorise_as_admin
+def update_application_statuses():
+    """Updates the status of several records in the Applications table at once, only for admin users.
+
+    A PUT or PATCH request is used to set the same status on a list of applications, such as to reject the remaining applicants for a filled job. Requires a JWT and for a user to have the admin permission.
+    Each application whose status changes is handled as by update_application, with its notification, event and status history, and all of them are saved in one transaction.
+
+    Args:
+        None required.
+
+    Input:
+        "ids", a list of up to 1000 application ids, and a valid string value for "status", in JSON format.
+
+    Returns:
+        "updated", the ids of the applications whose status changed, "unchanged", the ids that already had the status, and "not_found", the ids that don't match a record, in JSON format.
+
+    Errors:
+        400: Displayed if the ids or status are missing or invalid.
+        412: Displayed if one of the applications is changed by another request before this update is saved, in which case none of them are updated.
+        403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
+        401: Displayed if no JWT is provided.
+    """
+    body_data = application_bulk_status_schema.load(request.get_json())
+    ids = list(dict.fromkeys(body_data["ids"]))
+    query = (
+        db.select(Application)
+        .where(Application.id.in_(ids))
+        .order_by(Application.id)
+        .options(selectinload(Application.job))
+    )
+    found = {application.id: application for application in db.session.scalars(query)}
+    updated = [id for id, application in found.items() if change_status(application, body_data["status"])]
+    db.session.commit()
+    return {
+        "updated": updated,
+        "unchanged": [id for id in found if id not in updated],
+        "not_found": [id for id in ids if id not in found],
+    }
+
+
+@applications.route("/<int:id>/history/", methods=["GET"])
+@jwt_required()
+@authorise_as_staff
+def get_application_history(id):
+    """Retrieves the status history of a single record in the Applications table.
+
+    A GET request is used to retrieve every status the specified application has had, oldest first. Requires a JWT and for a user to be a Staff user.
+
+    Args:
+        application.id
+
+    Input:
+        None required.
+
+    Returns:
+        from_status, to_status, changed_at and user_id for each status change, in JSON format. The first change has no from_status.
+
+    Errors:
+        404: Displayed if the id provided as an arg doesn't match a record in the Applications table, or in its history.
+        403: Displayed if the user does not meet the conditions of the authorise_as_staff wrapper functions.
+        401: Displayed if no JWT is provided.
+    """
+    query = (
+        db.select(ApplicationStatusChange)
+        .filter_by(application_id=id)
+        .order_by(ApplicationStatusChange.changed_at, ApplicationStatusChange.id)
+    )
+    history = db.session.scalars(query).all()
+    if history:
+        return jsonify(application_status_changes_schema.dump(history))
     else:
         return {"error": f"Application not found with id {id}"}, 404
 
 
+@applications.route("/analytics/time-in-stage/", methods=["GET"])
+@jwt_required()
+@authorise_as_admin
+def get_time_in_stage():
+    """Summarises how long applications stay in each status.
+
+    A GET request is used to retrieve the distribution of the time applications spent in each status, for the stays that began within a date range. Requires a JWT and for a user to have the admin permission.
+
+    Args:
+        None required.
+
+    Input:
+        None required. Optionally date_from and date_to query parameters in YYYY-MM-DD format (default the 365 days up to and including today), and a job_id query parameter to only include the applications for one job.
+
+    Returns:
+        For each status, the number of completed stays (count), their mean_days, median_days, p75_days and p90_days, and the number of applications still in the status (in_progress), in JSON format.
+
+    Errors:
+        400: Displayed if a date or job_id is invalid.
+        403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
+        401: Displayed if no JWT is provided.
+    """
+    date_from, date_to, args = analytics_args()
+    return jsonify(time_in_stage(date_from, date_to, job_id=args.get("job_id")))
+
+
+@applications.route("/analytics/time-to-offer/", methods=["GET"])
+@jwt_required()
+@authorise_as_admin
+def get_time_to_offer():
+    """Summarises how long applications take to reach an offer.
+
+    A GET request is used to retrieve the distribution of the time from an application's first status to its first Offer status, for the applications given an offer within a date range.
+    Requires a JWT and for a user to have the admin permission.
+
+    Args:
+        None required.
+
+    Input:
+        None required. Optionally date_from and date_to query parameters in YYYY-MM-DD format (default the 365 days up to and including today), and a job_id query parameter to only include the applications for one job.
+        Optionally a "status" query parameter to measure the time to another status instead of Offer.
+
+    Returns:
+        The status, the number of applications that reached it (count), and the mean_days, median_days, p75_days and p90_days they took, in JSON format.
+
+    Errors:
+        400: Displayed if a date, job_id or status is invalid.
+        403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
+        401: Displayed if no JWT is provided.
+    """
+    date_from, date_to, args = analytics_args()
+    return time_to_status(args.get("status", "Offer"), date_from, date_to, job_id=args.get("job_id"))
+
+
 @applications.route("/<int:id>/", methods=["DELETE"])
 @jwt_required()
 @authorise_as_admin
@@ -0,0 +1,66 @@
+from models.audit_log import AuditLog, audit_logs_schema
+from controllers.auth_controller import authorise_as_admin
+from filters import QueryFilter, filter_and_sort
+
+from flask import Blueprint, jsonify, request
+from marshmallow import fields
+from marshmallow.exceptions import ValidationError
+from marshmallow.validate import OneOf, Range
+from flask_jwt_extended import jwt_required
+
+
+audit = Blueprint("audit", __name__, url_prefix="/audit")
+
+AUDIT_FILTERS = {
+    "table_name": QueryFilter(
+        AuditLog.table_name, fields.String(validate=OneOf(("applications", "interviews", "scorecards")))
+    ),
+    "record_id": QueryFilter(AuditLog.record_id, fields.Integer()),
+    "user_id": QueryFilter(AuditLog.user_id, fields.Integer()),
+    "action": QueryFilter(AuditLog.action, fields.String(validate=OneOf(("insert", "update", "delete")))),
+    "changed_at": QueryFilter(AuditLog.changed_at, fields.DateTime(format="%Y-%m-%dT%H:%M"), range=True),
+}
+AUDIT_SORTS = {
+    "changed_at": AuditLog.changed_at,
+}
+AUDIT_LIMIT = fields.Integer(validate=Range(min=1, max=1000))
+
+
+@audit.route("/", methods=["GET"])
+@jwt_required()
+@authorise_as_admin
+def get_audit_log():
+    """Retrieves rows from the AuditLog table.
+
+    A GET request is used to retrieve the most recent changes to Applications, Interviews and Scorecards, or the changes that match the filters provided. Requires a JWT and for a user to have the admin permission.
+    Changes are written in the background, so the last few seconds of changes may not be returned yet.
+
+    Args:
+        None required.
+
+    Input:
+        None required. Optionally filters on table_name, record_id, user_id or action (one value, or comma-separated values to match any of them), and changed_at_from or changed_at_to in ISO format YYYY-MM-DDTHH:MM.
+        Filtering on changed_at limits the search to the matching monthly partitions of the table.
+        Optionally a "sort" query parameter, changed_at or -changed_at, and a "limit" query parameter between 1 and 1000 (default 100).
+
+    Returns:
+        Key value pairs for all fields for each matching record in the AuditLog table, in JSON format. The changes field holds [before, after] pairs for each changed field.
+        Records are sorted in descending order by changed_at unless a sort is provided.
+
+    Errors:
+        400: Displayed if a filter value, sort key or limit is invalid.
+        403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
+        401: Displayed if no JWT is provided.
+    """
+    try:
+        limit = AUDIT_LIMIT.deserialize(request.args.get("limit", 100))
+    except ValidationError as err:
+        raise ValidationError({"limit": err.messages})
+    query = filter_and_sort(
+        AuditLog.query,
+        AUDIT_FILTERS,
+        AUDIT_SORTS,
+        default_sort=[AuditLog.changed_at.desc(), AuditLog.id.desc()],
+    )
+    result = audit_logs_schema.dump(query.limit(limit).all())
+    return jsonify(result)
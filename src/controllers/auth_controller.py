@@ -1,14 +1,25 @@
-from main import db, bcrypt
+from main import db, bcrypt, jwt
 from models.users import User, user_schema, user_view_schema
 from models.staff import Staff
+from models.revoked_tokens import RevokedToken
+from revocation import ISSUED_AT_CLAIM, denylist
+from throttle import throttle_login
 
-from flask import Blueprint, request
-from flask_jwt_extended import create_access_token, get_jwt_identity
+from flask import Blueprint, g, request
+from flask_jwt_extended import create_access_token, get_jwt_identity, get_jwt, jwt_required
 from sqlalchemy.exc import IntegrityError
 from psycopg2 import errorcodes
-from datetime import timedelta
+from datetime import datetime, timedelta
 import functools
 
+TOKEN_LIFETIME = timedelta(days=1)
+
+
+@jwt.token_in_blocklist_loader
+def check_if_token_revoked(jwt_header, jwt_payload):
+    """Callback used by JWT Extended on every request with a JWT, to reject tokens that have been revoked."""
+    return denylist.is_revoked(jwt_payload)
+
 
 def authorise_as_admin(fn):
     @functools.wraps(fn)
@@ -40,6 +51,7 @@ def authorise_as_staff(fn):
         """Wrapper function for authorising a staff member.
 
         Used in other controller functions to easily authorise a user as a staff member.
+        The Staff record is kept in g.staff, so the route doesn't need to look it up again.
 
         Errors:
             403: Displays error if user does not have a matching record in the Staff table.
@@ -49,6 +61,7 @@ def authorise_as_staff(fn):
             query = db.select(Staff).filter_by(user_id=user_id)
             user = db.session.scalar(query)
             if user:
+                g.staff = user
                 return fn(*args, **kwargs)
             else:
                 return {"error": "Not authorised to perform this action"}, 403
@@ -104,10 +117,12 @@ def auth_register():
 
 
 @auth.route("/login", methods=["POST"])
+@throttle_login
 def auth_login():
     """Authenticates an existing record in the Users table.
 
     A POST request is used to authenticate a record in the Users table, and return a JWT that is used to perform other operations that require authentication.
+    Attempts are throttled by client IP address and by email before the password is checked.
 
     Args:
         None required.
@@ -121,6 +136,7 @@ def auth_login():
     Errors:
         409: Displayed if email or password fields are not provided. 
         401: Displayed if the email or password provided do not match a record in the Users table.
+        429: Displayed if the throttle_login wrapper function rejects the attempt.
     """    
     try:
         body_data = request.get_json()
@@ -128,10 +144,76 @@ def auth_login():
         user = db.session.scalar(query)
         if user and bcrypt.check_password_hash(user.password, body_data.get("password")):
             token = create_access_token(
-                identity=str(user.id), expires_delta=timedelta(days=1)
+                identity=str(user.id),
+                expires_delta=TOKEN_LIFETIME,
+                additional_claims={ISSUED_AT_CLAIM: datetime.now().timestamp()},
             )
             return {"email": user.email, "token": token}
         else:
             return {"error": "Invalid email or password"}, 401
     except TypeError:
         return {"error": "Email and password fields are both required, please try again."}, 409
+
+
+@auth.route("/logout", methods=["POST"])
+@jwt_required()
+def auth_logout():
+    """Revokes the JWT used to make this request.
+
+    A POST request is used to add the current token to the RevokedTokens table, so that it can't be used again. Requires a JWT.
+
+    Args:
+        None required.
+
+    Input:
+        None required.
+
+    Returns:
+        A confirmation message in JSON format that the user has been logged out.
+
+    Errors:
+        401: Displayed if no JWT is provided, or the JWT has already been revoked.
+    """
+    jwt_payload = get_jwt()
+    revoked = RevokedToken(
+        jti=jwt_payload["jti"],
+        user_id=int(jwt_payload["sub"]),
+        revoked_at=datetime.now(),
+        expires_at=datetime.fromtimestamp(jwt_payload["exp"]),
+    )
+    denylist.revoke(revoked)
+    return {"message": "You have been logged out successfully"}
+
+
+@auth.route("/revoke/<int:user_id>/", methods=["POST"])
+@jwt_required()
+@authorise_as_admin
+def auth_revoke_sessions(user_id):
+    """Revokes every JWT issued to a specified user, only for admin users.
+
+    A POST request is used to add a record to the RevokedTokens table that revokes all tokens issued to the user before now. The user can log in again to receive a new token. Requires a JWT and for a user to have the admin permission.
+
+    Args:
+        user.id
+
+    Input:
+        None required.
+
+    Returns:
+        A confirmation message in JSON format that the user's sessions have been revoked.
+
+    Errors:
+        404: Displayed if the id provided as an arg doesn't match a record in the Users table.
+        403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
+        401: Displayed if no JWT is provided.
+    """
+    user = db.session.get(User, user_id)
+    if user:
+        now = datetime.now()
+        revoked = RevokedToken(
+            user_id=user.id, revoked_at=now, expires_at=now + TOKEN_LIFETIME
+        )
+        denylist.revoke(revoked)
+        return {"message": f"All sessions for {user.email} have been revoked successfully"}
+    else:
+        return {"error": f"User not found with id {user_id}"}, 404
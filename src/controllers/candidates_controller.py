@@ -1,15 +1,37 @@
 from main import db
 from models.candidates import Candidate, candidate_schema, candidates_schema
+from models.candidate_duplicates import (
+    CandidateDuplicate,
+    candidate_duplicate_schema,
+    candidate_duplicates_schema,
+)
 from controllers.auth_controller import authorise_as_admin
+from fieldsets import sparse_fieldset
+from filters import QueryFilter, filter_and_sort
+from dedupe import merge_candidates
+from idempotency import idempotent
 
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
+from marshmallow import fields
+from marshmallow.validate import OneOf
+from sqlalchemy.orm import joinedload
+from datetime import datetime
 from sqlalchemy.exc import IntegrityError
 from psycopg2 import errorcodes
 
 
 candidates = Blueprint("candidates", __name__, url_prefix="/candidates")
 
+DUPLICATE_FILTERS = {
+    "status": QueryFilter(CandidateDuplicate.status, fields.String(validate=OneOf(("Pending", "Dismissed")))),
+    "reason": QueryFilter(CandidateDuplicate.reason, fields.String(validate=OneOf(("phone", "name")))),
+}
+DUPLICATE_SORTS = {
+    "score": CandidateDuplicate.score,
+    "created_at": CandidateDuplicate.created_at,
+}
+
 
 @candidates.route("/", methods=["GET"])
 @jwt_required()
@@ -23,22 +45,26 @@ def get_candidates():
         None required.
 
     Input:
-        None required.
+        None required. Optionally a "fields" query parameter, a comma-separated list of the fields to return.
 
     Returns:
         Key value pairs for the fields in each record in the Candidates table, in JSON format. Records are sorted in ascending order by id.
 
     Errors:
+        400: Displayed if a requested field isn't available.
         403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
         401: Displayed if no JWT is provided.
     """
-    candidates_list = Candidate.query.order_by(Candidate.id).all()
-    result = candidates_schema.dump(candidates_list)
+    query, schema = sparse_fieldset(
+        Candidate.query.order_by(Candidate.id), Candidate, candidates_schema
+    )
+    result = schema.dump(query.all())
     return jsonify(result)
 
 
 @candidates.route("/", methods=["POST"])
 @jwt_required()
+@idempotent
 def create_candidate():
     """Creates a new record in the Candidates table.
 
@@ -49,6 +75,7 @@ def create_candidate():
 
     Input:
         name and phone_number fields, in JSON format.
+        Optionally an Idempotency-Key header, so that a retried request is given the stored response instead of creating the record again.
 
     Returns:
         Key value pairs for all fields for the new record in the Candidates table, in JSON format.
@@ -57,6 +84,7 @@ def create_candidate():
         400: Displayed if a value provided for a field doesn't match a validation criteria.
         409: Displayed if a required field is not provided.
         409: Displayed if a Candidate record already exists with the user.id of the authenticated user.
+        422: Displayed if the Idempotency-Key header has already been used for a different request.
         401: Displayed if no JWT is provided.
     """
     user_id = get_jwt_identity()
@@ -149,3 +177,112 @@ def delete_candidate(id):
         }
     else:
         return {"error": f"Candidate not found with id {id}"}, 404
+
+
+@candidates.route("/duplicates/", methods=["GET"])
+@jwt_required()
+@authorise_as_admin
+def get_duplicates():
+    """Retrieves rows from the CandidateDuplicate table.
+
+    A GET request is used to retrieve the suggested duplicate Candidate records found by the `flask db find-duplicates` command or the find_duplicate_candidates task. Requires a JWT and for a user to have the admin permission.
+
+    Args:
+        None required.
+
+    Input:
+        None required. Optionally filters on status (defaults to "Pending") or reason, and a "sort" query parameter using score or created_at.
+
+    Returns:
+        Key value pairs for all fields for each suggestion, with both Candidate records nested, in JSON format. Records are sorted in descending order by score unless a sort is provided.
+
+    Errors:
+        400: Displayed if a filter value or sort key is invalid.
+        403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
+        401: Displayed if no JWT is provided.
+    """
+    query = db.select(CandidateDuplicate).options(
+        joinedload(CandidateDuplicate.candidate), joinedload(CandidateDuplicate.duplicate)
+    )
+    if "status" not in request.args:
+        query = query.filter_by(status="Pending")
+    query = filter_and_sort(
+        query,
+        DUPLICATE_FILTERS,
+        DUPLICATE_SORTS,
+        default_sort=[CandidateDuplicate.score.desc(), CandidateDuplicate.id],
+    )
+    result = candidate_duplicates_schema.dump(db.session.scalars(query))
+    return jsonify(result)
+
+
+@candidates.route("/duplicates/<int:id>/merge/", methods=["POST"])
+@jwt_required()
+@authorise_as_admin
+def merge_duplicate(id):
+    """Merges the two Candidate records of a pending suggestion.
+
+    A POST request is used to confirm a suggested duplicate. The applications and interviews of one Candidate record are moved to the other, and the record that isn't kept is deleted along with its user. Requires a JWT and for a user to have the admin permission.
+
+    Args:
+        candidate_duplicate.id
+
+    Input:
+        None required. Optionally a "keep_id" field in JSON format, the id of the Candidate record to keep. Defaults to the older record, the suggestion's candidate.
+
+    Returns:
+        A confirmation message in JSON format, with the kept Candidate record and the number of applications and interviews moved to it.
+
+    Errors:
+        400: Displayed if keep_id isn't the id of one of the two Candidate records.
+        404: Displayed if the id provided as an arg doesn't match a pending record in the CandidateDuplicate table.
+        403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
+        401: Displayed if no JWT is provided.
+    """
+    suggestion = db.session.scalar(db.select(CandidateDuplicate).filter_by(id=id, status="Pending"))
+    if not suggestion:
+        return {"error": f"Pending duplicate suggestion not found with id {id}"}, 404
+    keep_id = (request.get_json(silent=True) or {}).get("keep_id", suggestion.candidate_id)
+    if keep_id not in (suggestion.candidate_id, suggestion.duplicate_id):
+        return {
+            "error": f"keep_id must be {suggestion.candidate_id} or {suggestion.duplicate_id}, please try again."
+        }, 400
+    keep = suggestion.candidate if keep_id == suggestion.candidate_id else suggestion.duplicate
+    moved = merge_candidates(suggestion, keep)
+    db.session.commit()
+    return {
+        "message": f"The candidates have been merged, {moved} applications and interviews were moved to candidate {keep.id}",
+        "candidate": candidate_schema.dump(keep),
+    }
+
+
+@candidates.route("/duplicates/<int:id>/dismiss/", methods=["POST"])
+@jwt_required()
+@authorise_as_admin
+def dismiss_duplicate(id):
+    """Dismisses a suggestion that two Candidate records are duplicates.
+
+    A POST request is used to mark a suggestion as "Dismissed", so the same pair isn't suggested again. Requires a JWT and for a user to have the admin permission.
+
+    Args:
+        candidate_duplicate.id
+
+    Input:
+        None required.
+
+    Returns:
+        Key value pairs for all fields for the dismissed suggestion, in JSON format.
+
+    Errors:
+        404: Displayed if the id provided as an arg doesn't match a pending record in the CandidateDuplicate table.
+        403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
+        401: Displayed if no JWT is provided.
+    """
+    suggestion = db.session.scalar(db.select(CandidateDuplicate).filter_by(id=id, status="Pending"))
+    if not suggestion:
+        return {"error": f"Pending duplicate suggestion not found with id {id}"}, 404
+    suggestion.status = "Dismissed"
+    suggestion.reviewed_at = datetime.now()
+    suggestion.reviewed_by = int(get_jwt_identity())
+    db.session.commit()
+    return candidate_duplicate_schema.dump(suggestion)
@@ -0,0 +1,177 @@
+from main import db
+from models.changes import Change
+from models.jobs import Job
+from models.applications import Application, applications_staff_view_schema, applications_view_schema
+from models.interviews import Interview, interviews_staff_view_schema, interviews_view_schema
+from models.staff import Staff
+from models.candidates import Candidate
+from controllers.jobs_controller import jobs_schema_for_staff
+from change_feed import decode_cursor, encode_cursor
+from fieldsets import load_options
+
+from flask import Blueprint, current_app, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from marshmallow import fields
+from marshmallow.exceptions import ValidationError
+from marshmallow.validate import OneOf, Range
+
+changes = Blueprint("changes", __name__, url_prefix="/changes")
+
+CHANGE_MODELS = {"jobs": Job, "applications": Application, "interviews": Interview}
+CHANGE_TABLES = fields.List(fields.String(validate=OneOf(tuple(CHANGE_MODELS))))
+
+
+def feed_reader():
+    """Looks up the authenticated user's Staff or Candidate record, either of which may be None."""
+    user_id = get_jwt_identity()
+    if user_id is None:
+        return None, None
+    staff_member = db.session.scalar(db.select(Staff).filter_by(user_id=user_id))
+    if staff_member:
+        return staff_member, None
+    return None, db.session.scalar(db.select(Candidate).filter_by(user_id=user_id))
+
+
+def visible_changes(staff_member, candidate):
+    """Builds the condition for the changes the user is allowed to see.
+
+    Admins see every change. Other staff see changes to Jobs and Applications, and to the Interviews they are the interviewer of.
+    Candidates see changes to Jobs, and to their own Applications and Interviews. Everyone else sees changes to Jobs.
+    """
+    if staff_member and staff_member.admin:
+        return db.true()
+    if staff_member:
+        return db.or_(
+            Change.table_name.in_(("jobs", "applications")),
+            db.and_(Change.table_name == "interviews", Change.interviewer_id == staff_member.id),
+        )
+    if candidate:
+        return db.or_(
+            Change.table_name == "jobs",
+            db.and_(Change.table_name.in_(("applications", "interviews")), Change.candidate_id == candidate.id),
+        )
+    return Change.table_name == "jobs"
+
+
+def visible_record(record, staff_member, candidate):
+    """Checks a record is still the user's, as it may have moved to another candidate or interviewer since the change."""
+    if isinstance(record, Job) or (staff_member and staff_member.admin):
+        return True
+    if staff_member:
+        return not isinstance(record, Interview) or record.interviewer_id == staff_member.id
+    return candidate is not None and record.candidate_id == candidate.id
+
+
+def change_schemas(staff_member):
+    return {
+        "jobs": jobs_schema_for_staff(staff_member, True),
+        "applications": applications_staff_view_schema if staff_member else applications_view_schema,
+        "interviews": interviews_staff_view_schema if staff_member else interviews_view_schema,
+    }
+
+
+@changes.route("/", methods=["GET"])
+@jwt_required(optional=True)
+def get_changes():
+    """Retrieves the inserts, updates and deletes to Jobs, Applications and Interviews since a cursor, so a client can keep a local copy in sync.
+
+    A GET request is used to retrieve a page of changes in the order they were committed. No JWT is required, but only changes to Jobs are returned without one.
+    With a JWT, admins see every change, other staff see changes to Jobs, Applications and the Interviews they are the interviewer of,
+    and candidates see changes to Jobs and to their own Applications and Interviews. If a record moves to another candidate or interviewer, the previous one is sent a delete for it.
+    To sync, start by reading the current cursor from GET /changes/cursor/, then download the records, then call this endpoint with the cursor until has_more is false,
+    each time passing the next_cursor from the previous page. A change may be returned more than once, so clients should apply them as upserts.
+
+    Args:
+        None required.
+
+    Input:
+        None required. Optionally a "cursor" query parameter from a previous response, to return the changes after it, otherwise changes are returned from the oldest one kept.
+        Optionally a "tables" query parameter, a comma-separated list of jobs, applications or interviews, and a "limit" query parameter between 1 and CHANGE_FEED_MAX_LIMIT (default CHANGE_FEED_DEFAULT_LIMIT).
+
+    Returns:
+        A JSON object with a "changes" list, a "next_cursor" and a "has_more" flag that is true if there are more changes after this page.
+        Each change has the table, id and action (insert, update or delete) of the record, the time it changed, and for inserts and updates the record's current fields in the same format as the other endpoints return for the user.
+        Several changes to the same record within a page are returned as one change, with its latest fields.
+
+    Errors:
+        400: Displayed if the cursor, tables or limit are invalid.
+        410: Displayed if the cursor is older than the changes kept for CHANGE_FEED_RETENTION_DAYS, in which case the client should download the records again and restart from the current cursor.
+    """
+    config = current_app.config
+    limit_field = fields.Integer(validate=Range(min=1, max=config["CHANGE_FEED_MAX_LIMIT"]))
+    try:
+        limit = limit_field.deserialize(request.args.get("limit", config["CHANGE_FEED_DEFAULT_LIMIT"]))
+    except ValidationError as err:
+        raise ValidationError({"limit": err.messages})
+    try:
+        tables = CHANGE_TABLES.deserialize(request.args["tables"].split(",")) if "tables" in request.args else None
+    except ValidationError as err:
+        raise ValidationError({"tables": err.messages})
+    after = decode_cursor(request.args["cursor"]) if "cursor" in request.args else 0
+    if after:
+        # purging always keeps the newest change, so a gap before the oldest one means changes were purged:
+        oldest = db.session.scalar(db.select(db.func.min(Change.seq)))
+        if oldest is not None and after < oldest - 1:
+            return {"error": "The cursor has expired, please download the records again and restart from the current cursor"}, 410
+
+    staff_member, candidate = feed_reader()
+    query = (
+        db.select(Change)
+        .where(Change.seq > after, visible_changes(staff_member, candidate))
+        .order_by(Change.seq)
+        .limit(limit + 1)
+    )
+    if tables:
+        query = query.where(Change.table_name.in_(tables))
+    page = db.session.scalars(query).all()
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    # collapses the page to the latest change to each record, keeping "insert" if the record was created within the page:
+    latest = {}
+    for change in page:
+        key = (change.table_name, change.record_id)
+        first = latest.pop(key, None)
+        latest[key] = (change, "insert" if first and first[1] == "insert" and change.action != "delete" else change.action)
+
+    schemas = change_schemas(staff_member)
+    records = {}
+    for table_name, model in CHANGE_MODELS.items():
+        ids = [record_id for (table, record_id), (_, action) in latest.items() if table == table_name and action != "delete"]
+        if not ids:
+            continue
+        schema = schemas[table_name]
+        query = db.select(model).where(model.id.in_(ids)).options(*load_options(model, schema, tuple(schema.dump_fields)))
+        loaded = [record for record in db.session.scalars(query).unique() if visible_record(record, staff_member, candidate)]
+        records.update(((table_name, record.id), data) for record, data in zip(loaded, schema.dump(loaded)))
+
+    result = []
+    for key, (change, action) in latest.items():
+        entry = {"table": change.table_name, "id": change.record_id, "action": action, "changed_at": change.changed_at.isoformat()}
+        if action != "delete":
+            # a record that has since been deleted or moved away from the user is left out, as its delete is further on in the feed:
+            if key not in records:
+                continue
+            entry["record"] = records[key]
+        result.append(entry)
+    next_seq = page[-1].seq if page else after
+    return {"changes": result, "next_cursor": encode_cursor(next_seq), "has_more": has_more}
+
+
+@changes.route("/cursor/", methods=["GET"])
+def get_change_cursor():
+    """Retrieves a cursor for the latest change, to start following the change feed from now.
+
+    A GET request is used to retrieve the cursor before a client downloads the records it will keep in sync, so no change made during the download is missed. No JWT is required.
+
+    Args:
+        None required.
+
+    Input:
+        None required.
+
+    Returns:
+        A JSON object with the "cursor" to pass to GET /changes/.
+    """
+    latest = db.session.scalar(db.select(db.func.max(Change.seq))) or 0
+    return {"cursor": encode_cursor(latest)}
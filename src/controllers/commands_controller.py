@@ -6,17 +6,31 @@ from models.staff import Staff
 from models.applications import Application
 from models.interviews import Interview
 from models.scorecards import Scorecard
+from models.tasks import Task
+from models.revoked_tokens import RevokedToken
+from models.idempotency_keys import IdempotencyKey
+from models.changes import Change
+from tasks import enqueue, run_workers
+from plans import check_plans, seed_large_dataset
+from partitions import create_all_partitions, maintain_partitions
+from archive import archive_closed_jobs
+from dedupe import find_duplicates
+from status_history import backfill_status_history
+from snapshots import restore_snapshot, take_snapshot
 
-from flask import Blueprint
-from datetime import date, datetime
+from flask import Blueprint, current_app
+from datetime import date, datetime, timedelta
+import click
 
 db_commands = Blueprint("db", __name__)
+worker_commands = Blueprint("worker", __name__, cli_group=None)
 
 
 @db_commands.cli.command("create")
 def create_db():
     """Creates the database tables."""
     db.create_all()
+    create_all_partitions()
     print("Database tables created")
 
 
@@ -28,6 +42,27 @@ def drop_db():
     print("Database tables dropped")
 
 
+@db_commands.cli.command("snapshot")
+@click.option("--dir", "directory", help="Directory to write the snapshot to, defaulting to SNAPSHOT_DIR.")
+@click.option("--workers", type=int, help="Number of tables copied at once, defaulting to SNAPSHOT_WORKERS.")
+def snapshot_db(directory, workers):
+    """Writes every table to a snapshot directory with binary COPY, to be restored with `flask db restore`."""
+    rows = take_snapshot(directory, workers)
+    print(f"Snapshot of {len(rows)} tables ({sum(rows.values())} rows) written to {directory or current_app.config['SNAPSHOT_DIR']}")
+
+
+@db_commands.cli.command("restore")
+@click.option("--dir", "directory", help="Directory of the snapshot, defaulting to SNAPSHOT_DIR.")
+@click.option("--workers", type=int, help="Number of tables loaded or indexed at once, defaulting to SNAPSHOT_WORKERS.")
+def restore_db(directory, workers):
+    """Drops and recreates the database tables, and loads them from a snapshot taken with `flask db snapshot`."""
+    try:
+        timings = restore_snapshot(directory, workers)
+    except ValueError as err:
+        raise click.ClickException(str(err))
+    print(f"Database restored in {sum(timings.values()):.1f}s ({', '.join(f'{step} {seconds}s' for step, seconds in timings.items())})")
+
+
 @db_commands.cli.command("seed")
 def seed_db():
     """Seeds the database tables.
@@ -177,3 +212,122 @@ def seed_db():
     db.session.commit()
 
     print("Database tables seeded")
+
+
+@db_commands.cli.command("purge-revoked")
+def purge_revoked_tokens():
+    """Deletes revoked token records that have passed their expiry, as those tokens can no longer be used anyway."""
+    query = db.delete(RevokedToken).where(RevokedToken.expires_at < datetime.now())
+    result = db.session.execute(query)
+    db.session.commit()
+    print(f"{result.rowcount} expired revoked token records deleted")
+
+
+@db_commands.cli.command("purge-idempotency-keys")
+def purge_idempotency_keys():
+    """Deletes stored Idempotency-Key responses that have passed their expiry."""
+    query = db.delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.now())
+    result = db.session.execute(query)
+    db.session.commit()
+    print(f"{result.rowcount} expired idempotency keys deleted")
+
+
+@db_commands.cli.command("purge-changes")
+def purge_changes():
+    """Deletes change feed records older than CHANGE_FEED_RETENTION_DAYS. Clients with a cursor from before then have to download the records again.
+
+    The newest change is always kept, so an expired cursor can still be told apart from one that is up to date.
+    """
+    cutoff = datetime.now() - timedelta(days=current_app.config["CHANGE_FEED_RETENTION_DAYS"])
+    newest = db.select(db.func.max(Change.seq)).scalar_subquery()
+    query = db.delete(Change).where(Change.changed_at < cutoff, Change.seq < newest)
+    result = db.session.execute(query)
+    db.session.commit()
+    print(f"{result.rowcount} expired change feed records deleted")
+
+
+@db_commands.cli.command("backfill-status-history")
+def backfill_status_history_db():
+    """Adds a first status history record for applications created before status changes were recorded."""
+    print(f"{backfill_status_history()} applications backfilled")
+
+
+@db_commands.cli.command("maintain-partitions")
+def maintain_partitions_db():
+    """Creates future monthly partitions and detaches old ones for partitioned tables. Run at least monthly.
+
+    Also moves any rows in a DEFAULT partition into monthly partitions, such as after first turning on PARTITIONED_TABLES for a table with existing data.
+    """
+    for table_name, changes in maintain_partitions().items():
+        print(
+            f"{table_name}: created {', '.join(changes['created']) or 'none'}, "
+            f"detached {', '.join(changes['detached']) or 'none'}"
+        )
+
+
+@db_commands.cli.command("archive-jobs")
+@click.option("--days", type=int, help="Archive jobs closed for longer than this many days.")
+@click.option("--batch-size", type=int, help="Number of jobs archived per transaction.")
+@click.option("--background", is_flag=True, help="Enqueue the archive_closed_jobs task for the workers instead.")
+def archive_jobs(days, batch_size, background):
+    """Moves jobs that have been closed for longer than ARCHIVE_AFTER_DAYS, and their applications, interviews and scorecards, to cold storage."""
+    if background:
+        enqueue("archive_closed_jobs", days=days)
+        db.session.commit()
+        print("Archive task enqueued")
+        return
+    print(f"{archive_closed_jobs(days, batch_size)} jobs archived to {current_app.config['ARCHIVE_DIR']}")
+
+
+@db_commands.cli.command("find-duplicates")
+@click.option("--background", is_flag=True, help="Enqueue the find_duplicate_candidates task for the workers instead.")
+def find_duplicate_candidates(background):
+    """Finds candidates that are likely to have registered more than once, and saves them as merge suggestions for admins to review."""
+    if background:
+        enqueue("find_duplicate_candidates")
+        db.session.commit()
+        print("Duplicate detection task enqueued")
+        return
+    counts = find_duplicates()
+    print(
+        f"Compared {counts['blocks_compared']} blocks (skipped {counts['blocks_skipped']} oversized), "
+        f"{counts['suggestions_created']} new suggestions"
+    )
+
+
+@db_commands.cli.command("seed-large")
+@click.option("--scale", default=100, help="Multiplier for the number of synthetic rows added.")
+def seed_large_db(scale):
+    """Adds a large synthetic dataset on top of the seeded data, for checking query plans."""
+    counts = seed_large_dataset(scale)
+    print(f"Added synthetic rows: {', '.join(f'{count} {table}' for table, count in counts.items())}")
+
+
+@db_commands.cli.command("check-plans")
+@click.option("--update", is_flag=True, help="Rewrite the plan snapshots instead of comparing them.")
+def check_query_plans(update):
+    """Checks the query plans of the read endpoints against their budgets and snapshots."""
+    results = check_plans(update=update)
+    for name, failures in results.items():
+        print(f"{'FAIL' if failures else 'ok'}  {name}")
+        for failure in failures:
+            print(f"      {failure}")
+    if any(results.values()):
+        raise SystemExit(1)
+
+
+@worker_commands.cli.command("worker")
+@click.option("--processes", type=int, help="Number of worker processes.")
+@click.option("--threads", type=int, help="Number of worker threads per process.")
+@click.option("--poll-interval", default=1.0, help="Seconds to wait when the queue is empty.")
+def worker(processes, threads, poll_interval):
+    """Runs background task workers until interrupted.
+
+    The number of processes and threads default to the WORKER_PROCESSES and WORKER_THREADS config values.
+    """
+    run_workers(
+        current_app._get_current_object(),
+        processes or current_app.config["WORKER_PROCESSES"],
+        threads or current_app.config["WORKER_THREADS"],
+        poll_interval,
+    )
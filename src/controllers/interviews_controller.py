@@ -4,23 +4,64 @@ from models.candidates import Candidate
 from models.applications import Application
 from models.interviews import (
     Interview,
+    VALID_FORMATS,
     interview_schema,
     interview_staff_view_schema,
     interviews_staff_view_schema,
     interviews_view_schema,
+    interview_slot_schema,
 )
 from controllers.auth_controller import authorise_as_admin, authorise_as_staff
 from controllers.scorecards_controller import scorecards
-
-from flask import Blueprint, jsonify, request
+from tasks import task, enqueue
+from fieldsets import sparse_fieldset
+from filters import QueryFilter, filter_and_sort
+from idempotency import idempotent
+from versioning import check_if_match, with_etag
+from events import publish
+
+from flask import Blueprint, jsonify, request, current_app
+from marshmallow import fields
+from marshmallow.validate import OneOf
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy.exc import IntegrityError
 from psycopg2 import errorcodes
+from datetime import datetime, timedelta
 
 
 interviews = Blueprint("interviews", __name__, url_prefix="/interviews")
 interviews.register_blueprint(scorecards, url_prefix="/<int:interview_id>/scorecards")
 
+INTERVIEW_FILTERS = {
+    "interviewer_id": QueryFilter(Interview.interviewer_id, fields.Integer()),
+    "candidate_id": QueryFilter(Interview.candidate_id, fields.Integer()),
+    "application_id": QueryFilter(Interview.application_id, fields.Integer()),
+    "format": QueryFilter(Interview.format, fields.String(validate=OneOf(VALID_FORMATS))),
+    "job_id": QueryFilter(
+        Application.job_id, fields.Integer(), through=Interview.application
+    ),
+    "interview_datetime": QueryFilter(
+        Interview.interview_datetime, fields.DateTime(), range=True
+    ),
+}
+INTERVIEW_SORTS = {
+    "id": Interview.id,
+    "interview_datetime": Interview.interview_datetime,
+}
+
+
+@task("notify_interview_scheduled")
+def notify_interview_scheduled(interview_id):
+    """Background task that notifies the candidate and interviewer that an interview has been scheduled.
+
+    There is no email or calendar service yet, so the notification is logged.
+    """
+    interview = db.session.get(Interview, interview_id)
+    if interview:
+        current_app.logger.info(
+            f"Notifying {interview.candidate.name} and {interview.interviewer.name} of their interview on {interview.interview_datetime}"
+        )
+
 
 @interviews.route("/all", methods=["GET"])
 @jwt_required()
@@ -28,23 +69,32 @@ interviews.register_blueprint(scorecards, url_prefix="/<int:interview_id>/scorec
 def get_all_interviews():
     """Retrieves rows from the Interviews table.
 
-    A GET request is used to retrieve all records in the Interviews table. Requires a JWT and for a user to have the admin permission.
+    A GET request is used to retrieve all records in the Interviews table, or the records that match the filters provided. Requires a JWT and for a user to have the admin permission.
 
     Args:
         None required.
 
     Input:
-        None required.
+        None required. Optionally a "fields" query parameter, a comma-separated list of the fields to return (nested fields use dots, such as interviewer.name).
+        Optionally filters on interviewer_id, candidate_id, application_id, job_id or format (one value, or comma-separated values to match any of them), and interview_datetime_from or interview_datetime_to in ISO format YYYY-MM-DDTHH:MM.
+        Optionally a "sort" query parameter, a comma-separated list of id or interview_datetime, with a leading "-" for descending order.
 
     Returns:
-        Key value pairs for all fields for each record in the Interviews table, in JSON format. Records are sorted in ascending order by interview datetime.
+        Key value pairs for all fields for each matching record in the Interviews table, in JSON format. Records are sorted in ascending order by interview datetime unless a sort is provided.
 
     Errors:
+        400: Displayed if a requested field isn't available, a filter value is invalid or a sort key isn't allowed.
         403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
         401: Displayed if no JWT is provided.
     """
-    interviews_list = Interview.query.order_by(Interview.interview_datetime).all()
-    result = interviews_staff_view_schema.dump(interviews_list)
+    query = filter_and_sort(
+        Interview.query,
+        INTERVIEW_FILTERS,
+        INTERVIEW_SORTS,
+        default_sort=[Interview.interview_datetime],
+    )
+    query, schema = sparse_fieldset(query, Interview, interviews_staff_view_schema)
+    result = schema.dump(query.all())
     return jsonify(result)
 
 
@@ -59,7 +109,7 @@ def get_my_interviews():
         None required.
 
     Input:
-        None required.
+        None required. Optionally a "fields" query parameter, a comma-separated list of the fields to return (nested fields use dots, such as interviewer.name).
 
     Returns:
         If a match is found, key value pairs for all fields for each record in the Interviews table that match the filter, in JSON format.
@@ -67,7 +117,7 @@ def get_my_interviews():
         If not result is found or no JWT provided, the user is returned a JSON message saying they have no interviews scheduled.
 
     Errors:
-        No errors expected.
+        400: Displayed if a requested field isn't available.
     """
     user_id = get_jwt_identity()
     try:
@@ -75,8 +125,12 @@ def get_my_interviews():
         query = db.select(Staff).filter_by(user_id=user_id)
         user = db.session.scalar(query)
         if user:
-            interview_list = Interview.query.order_by(Interview.interview_datetime).filter_by(interviewer_id=user.id)
-            result = interviews_staff_view_schema.dump(interview_list)
+            interview_list, schema = sparse_fieldset(
+                Interview.query.order_by(Interview.interview_datetime).filter_by(interviewer_id=user.id),
+                Interview,
+                interviews_staff_view_schema,
+            )
+            result = schema.dump(interview_list)
             if len(result) > 0:
                 return jsonify(result)
             else: pass # if they match a Staff record but have no interviews, using pass to use the one return line as for Candidates
@@ -85,8 +139,12 @@ def get_my_interviews():
             query = db.select(Candidate).filter_by(user_id=user_id)
             user = db.session.scalar(query)
             if user:
-                interview_list = Interview.query.order_by(Interview.interview_datetime).filter_by(candidate_id=user.id)
-                result = interviews_view_schema.dump(interview_list)
+                interview_list, schema = sparse_fieldset(
+                    Interview.query.order_by(Interview.interview_datetime).filter_by(candidate_id=user.id),
+                    Interview,
+                    interviews_view_schema,
+                )
+                result = schema.dump(interview_list)
                 if len(result) > 0:
                     return jsonify(result)
                 else: pass
@@ -96,19 +154,135 @@ def get_my_interviews():
         return {"message": "You have no scheduled interviews."}
 
 
+def merge_busy_intervals(rows):
+    """Merges interview bookings into a sorted list of non-overlapping busy intervals.
+
+    A sweep-line pass over the bookings sorted by start time - each booking either extends the current busy interval or starts a new one.
+
+    Args:
+        rows: An iterable of (interview_datetime, length_mins) pairs.
+
+    Returns:
+        A list of [start, end] datetime pairs, sorted and non-overlapping.
+    """
+    merged = []
+    for start, length_mins in sorted(rows):
+        end = start + timedelta(minutes=length_mins)
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def find_free_slots(busy, slot_data, not_before):
+    """Finds the earliest free slots within working hours that avoid all busy intervals.
+
+    Walks each day in the date window alongside the merged busy intervals, so every busy interval is visited at most once across the whole window.
+
+    Args:
+        busy: Sorted, non-overlapping [start, end] pairs from merge_busy_intervals.
+        slot_data: The validated fields from the interview_slot_schema.
+        not_before: The earliest datetime a slot can start at.
+
+    Returns:
+        A list of (start, end) datetime pairs, at most slot_data["limit"] long.
+    """
+    length = timedelta(minutes=slot_data["length_mins"])
+    slots = []
+    i = 0
+    day = slot_data["start_date"]
+    while day <= slot_data["end_date"] and len(slots) < slot_data["limit"]:
+        if slot_data["include_weekends"] or day.weekday() < 5:
+            cursor = max(datetime.combine(day, slot_data["day_start"]), not_before)
+            day_end = datetime.combine(day, slot_data["day_end"])
+            while i < len(busy) and busy[i][1] <= cursor:
+                i += 1
+            j = i
+            while cursor + length <= day_end and len(slots) < slot_data["limit"]:
+                if j < len(busy) and busy[j][0] < cursor + length:
+                    # the slot would overlap a busy interval, so jump to the end of it:
+                    cursor = max(cursor, busy[j][1])
+                    j += 1
+                else:
+                    slots.append((cursor, cursor + length))
+                    cursor += length
+        day += timedelta(days=1)
+    return slots
+
+
+@interviews.route("/slots/", methods=["POST"])
+@jwt_required()
+@authorise_as_staff
+def find_interview_slots():
+    """Finds the earliest common free interview slots for a panel of interviewers, only for staff users.
+
+    A POST request is used to search the Interviews table for the existing bookings of the specified interviewers (and the candidate, if an application is provided), and return the earliest slots within working hours where everyone is free. Requires a JWT and for a user to have staff permission.
+
+    Args:
+        None required.
+
+    Input:
+        interviewer_ids, length_mins, start_date and end_date fields, and optionally application_id, day_start, day_end, include_weekends and limit fields, in JSON format.
+
+    Returns:
+        The requested length_mins and a list of free slots, each with a start and end in the same datetime format used to create an interview, in JSON format.
+        Slots are sorted in ascending order by start time.
+
+    Errors:
+        400: Displayed if a value provided for a field doesn't match a validation criteria.
+        404: Displayed if the application_id provided doesn't match a record in the Applications table.
+        403: Displayed if the user does not meet the conditions of the authorise_as_staff wrapper functions.
+        401: Displayed if no JWT is provided.
+    """
+    slot_data = interview_slot_schema.load(request.get_json())
+    window_start = datetime.combine(slot_data["start_date"], slot_data["day_start"])
+    window_end = datetime.combine(slot_data["end_date"], slot_data["day_end"])
+    busy_filter = Interview.interviewer_id.in_(slot_data["interviewer_ids"])
+    if slot_data.get("application_id"):
+        query = db.select(Application).filter_by(id=slot_data["application_id"])
+        application = db.session.scalar(query)
+        if not application:
+            return {
+                "error": f"Application not found with id {slot_data['application_id']}"
+            }, 404
+        busy_filter = db.or_(busy_filter, Interview.candidate_id == application.candidate_id)
+    # looking back one day catches interviews that start before the window but run into it:
+    query = db.select(Interview.interview_datetime, Interview.length_mins).where(
+        busy_filter,
+        Interview.interview_datetime >= window_start - timedelta(days=1),
+        Interview.interview_datetime < window_end,
+    )
+    busy = merge_busy_intervals(db.session.execute(query).all())
+    slots = find_free_slots(busy, slot_data, datetime.now())
+    return {
+        "length_mins": slot_data["length_mins"],
+        "slots": [
+            {
+                "start": start.strftime("%Y-%m-%d %H:%M%p"),
+                "end": end.strftime("%Y-%m-%d %H:%M%p"),
+            }
+            for start, end in slots
+        ],
+    }
+
+
 @interviews.route("/", methods=["POST"])
 @jwt_required()
 @authorise_as_staff
+@idempotent
 def create_interview():
     """Creates a new record in the Interviews table, only for staff users.
 
     A POST request is used to create a new record in the Interviews table. Requires a JWT and for a user to have staff permission.
+    A background task to notify the candidate and interviewer is queued, and an interview.created event is published to them, in the same transaction.
 
     Args:
         None required.
 
     Input:
         application.id, format, length_mins, interviewer_id, and interview_datetime fields, in JSON format.
+        Optionally an Idempotency-Key header, so that a retried request is given the stored response instead of creating the record again.
 
     Returns:
         Key value pairs for all fields for the new record in the Interview table, in JSON format.
@@ -118,6 +292,7 @@ def create_interview():
         409: Displayed if a required field is not provided.
         409: Displayed if the hiring_manager_id provided doesn't match a record in the Staff table.
         409: Displayed if the application_id provided doesn't match a record in the Applications table.
+        422: Displayed if the Idempotency-Key header has already been used for a different request.
         403: Displayed if the user does not meet the conditions of the authorise_as_staff wrapper functions.
         401: Displayed if no JWT is provided.
     """
@@ -133,8 +308,17 @@ def create_interview():
         new_interview.length_mins = interview_fields["length_mins"]
         new_interview.format = interview_fields["format"]
         db.session.add(new_interview)
+        # flushing assigns the new id, so the notification task can be committed with the interview:
+        db.session.flush()
+        enqueue("notify_interview_scheduled", interview_id=new_interview.id)
+        publish(
+            "interview.created",
+            {"id": new_interview.id, "application_id": new_interview.application_id},
+            candidate_ids=[new_interview.candidate_id],
+            staff_ids=[new_interview.interviewer_id],
+        )
         db.session.commit()
-        return jsonify(interview_staff_view_schema.dump(new_interview)), 201
+        return with_etag(jsonify(interview_staff_view_schema.dump(new_interview)), new_interview), 201
     except IntegrityError as err:
         if err.orig.pgcode == errorcodes.NOT_NULL_VIOLATION:
             return {
@@ -146,6 +330,39 @@ def create_interview():
             }, 409
 
 
+@interviews.route("/<int:id>/", methods=["GET"])
+@jwt_required()
+@authorise_as_admin
+def get_one_interview(id):
+    """Retrieves a single row from the Interviews table, only for admin users.
+
+    A GET request is used to retrieve the specified record in the Interviews table, with its ETag for a following update. Requires a JWT and for a user to have admin permission.
+
+    Args:
+        interview.id
+
+    Input:
+        None required. Optionally a "fields" query parameter, a comma-separated list of the fields to return (nested fields use dots, such as interviewer.name).
+
+    Returns:
+        Key value pairs for all fields (or the requested fields) in the requested record in the Interviews table, in JSON format, with its version in the ETag header.
+
+    Errors:
+        400: Displayed if a requested field isn't available.
+        404: Displayed if the id provided as an arg doesn't match a record in the Interviews table.
+        403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
+        401: Displayed if no JWT is provided.
+    """
+    query, schema = sparse_fieldset(
+        db.select(Interview).filter_by(id=id), Interview, interview_staff_view_schema
+    )
+    interview = db.session.scalar(query)
+    if interview:
+        return with_etag(schema.dump(interview), interview)
+    else:
+        return {"error": f"Interview not found with id {id}"}, 404
+
+
 @interviews.route("/<int:id>/", methods=["PUT", "PATCH"])
 @jwt_required()
 @authorise_as_admin
@@ -153,20 +370,24 @@ def update_interview(id):
     """Updates a specified record in the Interviews table, only for admin users.
 
     A PUT or PATCH request is used to update the specified record in the Interviews table. Requires a JWT and for a user to have admin permission.
+    An interview.updated event is published to the candidate and the interviewer, and to the previous interviewer if it changed, in the same transaction.
 
     Args:
         interview.id
 
     Input:
         At least one or more of format, length_mins, interviewer_id and interview_datetime fields, in JSON format.
+        Optionally an If-Match header with the record's ETag, so the update is rejected if the record has changed since it was retrieved. Required if REQUIRE_IF_MATCH is turned on.
 
     Returns:
-        Key value pairs for all fields for the updated record in the Interviews table, in JSON format.
+        Key value pairs for all fields for the updated record in the Interviews table, in JSON format, with its new version in the ETag header.
 
     Errors:
         400: Displayed if a value provided for a field doesn't match a validation criteria.
         404: Displayed if the id provided as an arg doesn't match a record in the Interviews table.
         409: Displayed if the hiring_manager_id provided doesn't match a record in the Staff table.
+        412: Displayed if the If-Match header doesn't match the record's ETag, or the record is changed by another request before this update is saved.
+        428: Displayed if REQUIRE_IF_MATCH is turned on and no If-Match header is provided.
         403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
         401: Displayed if no JWT is provided.
     """
@@ -174,6 +395,10 @@ def update_interview(id):
     query = db.select(Interview).filter_by(id=id)
     interview = db.session.scalar(query)
     if interview:
+        precondition_error = check_if_match(interview)
+        if precondition_error:
+            return precondition_error
+        previous_interviewer_id = interview.interviewer_id
         interview.interviewer_id = (
             body_data.get("interviewer_id") or interview.interviewer_id
         )
@@ -182,8 +407,14 @@ def update_interview(id):
         )
         interview.format = body_data.get("format") or interview.format
         interview.length_mins = body_data.get("length_mins") or interview.length_mins
+        publish(
+            "interview.updated",
+            {"id": id, "application_id": interview.application_id},
+            candidate_ids=[interview.candidate_id],
+            staff_ids=[previous_interviewer_id, interview.interviewer_id],
+        )
         db.session.commit()
-        return interview_staff_view_schema.dump(interview)
+        return with_etag(interview_staff_view_schema.dump(interview), interview)
     else:
         return {"error": f"Interview not found with id {id}"}, 404
 
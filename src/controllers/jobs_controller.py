@@ -2,22 +2,75 @@ from main import db
 from models.jobs import (
     Job,
     job_schema,
+    job_view_schema,
     jobs_view_schema,
     job_admin_schema,
     jobs_admin_schema,
+    job_staff_schema,
     jobs_staff_schema,
 )
 from models.applications import Application, applications_staff_view_schema
 from models.staff import Staff
+from models.archived_jobs import ArchivedJob, archived_jobs_schema
 from controllers.auth_controller import authorise_as_admin, authorise_as_staff
-
-from flask import Blueprint, jsonify, request
+from fieldsets import sparse_fieldset
+from filters import QueryFilter, filter_and_sort
+from archive import read_archive
+from versioning import check_if_match, with_etag
+from idempotency import idempotent
+from job_board_cache import cache_key, job_board_cache
+from compression import choose_encoding
+
+from flask import Blueprint, current_app, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from marshmallow import fields
 from sqlalchemy.exc import IntegrityError
 from psycopg2 import errorcodes
+from datetime import datetime
 
 jobs = Blueprint("jobs", __name__, url_prefix="/jobs")
 
+ARCHIVED_JOB_FILTERS = {
+    "department": QueryFilter(ArchivedJob.department, fields.String()),
+    "closed_at": QueryFilter(ArchivedJob.closed_at, fields.DateTime(format="%Y-%m-%d"), range=True),
+    "archived_at": QueryFilter(ArchivedJob.archived_at, fields.DateTime(format="%Y-%m-%d"), range=True),
+}
+ARCHIVED_JOB_SORTS = {
+    "closed_at": ArchivedJob.closed_at,
+    "archived_at": ArchivedJob.archived_at,
+    "job_id": ArchivedJob.job_id,
+}
+
+
+def jobs_schema_for_user(many):
+    """Selects the Jobs schema for the authenticated user.
+
+    Args:
+        many: True when multiple Job records will be returned.
+    """
+    user_id = get_jwt_identity()
+    query = db.select(Staff).filter_by(id=user_id)
+    user = db.session.scalar(query)
+    return jobs_schema_for_staff(user, many)
+
+
+def jobs_schema_for_staff(user, many):
+    """Selects the Jobs schema for a Staff record.
+
+    Admin users are given the admin schema, other Staff users are given the staff schema without salary_budget, and everyone else is given the view schema without hiring_manager or salary_budget.
+
+    Args:
+        user: The Staff record of the authenticated user, or None.
+        many: True when multiple Job records will be returned.
+    """
+    if user:
+        if user.admin:
+            return jobs_admin_schema if many else job_admin_schema
+        else:
+            return jobs_staff_schema if many else job_staff_schema
+    else:
+        return jobs_view_schema if many else job_view_schema
+
 
 @jobs.route("/", methods=["GET"])
 @jwt_required(optional=True)
@@ -30,30 +83,32 @@ def get_open_jobs():
         None required.
 
     Input:
-        None required.
+        None required. Optionally a "fields" query parameter, a comma-separated list of the fields to return (nested fields use dots, such as hiring_manager.name).
 
     Returns:
         Key value pairs for the fields in each record in the Jobs table that meet the filter, in JSON format.
         Depending on the user's authentication, a different schema will be returned resulting in hiring_manager or salary_budget being excluded.
         Records are sorted in ascending order by id.
+        The response is cached for JOB_BOARD_CACHE_SECONDS, uncompressed and in each encoding requested, and rebuilt by one request at a time when it expires (see job_board_cache.py).
 
     Errors:
-        No expected errors.
+        400: Displayed if a requested field isn't available.
     """
-    jobs_list = Job.query.order_by(Job.id).filter_by(status="Open")
-    user_id = get_jwt_identity()
-    query = db.select(Staff).filter_by(id=user_id)
-    user = db.session.scalar(query)
-    if user:
-        if user.admin:
-            result = jobs_admin_schema.dump(jobs_list)
-            return jsonify(result)
-        else:
-            result = jobs_staff_schema.dump(jobs_list)
-            return jsonify(result)
-    else:
-        result = jobs_view_schema.dump(jobs_list)
-        return jsonify(result)
+    schema = jobs_schema_for_user(many=True)
+    query, schema = sparse_fieldset(
+        Job.query.order_by(Job.id).filter_by(status="Open"), Job, schema
+    )
+    body, content_encoding = job_board_cache.get(
+        cache_key("open", schema),
+        lambda: current_app.json.response(schema.dump(query.all())).get_data(as_text=True),
+        choose_encoding(request.accept_encodings),
+    )
+    response = current_app.response_class(body, mimetype="application/json")
+    response.vary.add("Accept-Encoding")
+    # a body that is already compressed is skipped by the Compress extension:
+    if content_encoding:
+        response.headers["Content-Encoding"] = content_encoding
+    return response
 
 
 @jobs.route("/all/", methods=["GET"])
@@ -67,7 +122,7 @@ def get_all_jobs():
         None required.
 
     Input:
-        None required.
+        None required. Optionally a "fields" query parameter, a comma-separated list of the fields to return (nested fields use dots, such as hiring_manager.name).
 
     Returns:
         Key value pairs for the fields in each record in the Jobs table, in JSON format.
@@ -75,22 +130,12 @@ def get_all_jobs():
         Records are sorted in ascending order by id.
 
     Errors:
-        No expected errors.
+        400: Displayed if a requested field isn't available.
     """
-    jobs_list = Job.query.order_by(Job.id).all()
-    user_id = get_jwt_identity()
-    query = db.select(Staff).filter_by(id=user_id)
-    user = db.session.scalar(query)
-    if user:
-        if user.admin:
-            result = jobs_admin_schema.dump(jobs_list)
-            return jsonify(result)
-        else:
-            result = jobs_staff_schema.dump(jobs_list)
-            return jsonify(result)
-    else:
-        result = jobs_view_schema.dump(jobs_list)
-        return jsonify(result)
+    schema = jobs_schema_for_user(many=True)
+    query, schema = sparse_fieldset(Job.query.order_by(Job.id), Job, schema)
+    result = schema.dump(query.all())
+    return jsonify(result)
 
 
 @jobs.route("/<int:id>/", methods=["GET"])
@@ -104,31 +149,22 @@ def get_one_job(id):
         job.id
 
     Input:
-        None required.
+        None required. Optionally a "fields" query parameter, a comma-separated list of the fields to return (nested fields use dots, such as hiring_manager.name).
 
     Returns:
         Key value pairs for the fields in the requested record from the Jobs table, in JSON format.
         Depending on the user's authentication, a different schema will be returned resulting in hiring_manager or salary_budget being excluded.
 
     Errors:
+        400: Displayed if a requested field isn't available.
         404: Displayed if the id provided as an arg doesn't match a record in the Jobs table.
     """
-    query = db.select(Job).filter_by(id=id)
+    schema = jobs_schema_for_user(many=False)
+    query, schema = sparse_fieldset(db.select(Job).filter_by(id=id), Job, schema)
     job = db.session.scalar(query)
     if job:
-        user_id = get_jwt_identity()
-        stmt = db.select(Staff).filter_by(id=user_id)
-        user = db.session.scalar(stmt)
-        if user:
-            if user.admin:
-                result = jobs_admin_schema.dump(job)
-                return jsonify(result)
-            else:
-                result = jobs_staff_schema.dump(job)
-                return jsonify(result)
-        else:
-            result = jobs_view_schema.dump(job)
-            return jsonify(result)
+        result = schema.dump(job)
+        return with_etag(jsonify(result), job)
     else:
         return {"Error": f"Job not found with id {id}"}, 404
 
@@ -145,19 +181,24 @@ def get_job_applications(id):
         job.id
 
     Input:
-        None required.
+        None required. Optionally a "fields" query parameter, a comma-separated list of the fields to return (nested fields use dots, such as candidate.name).
 
     Returns:
         Key value pairs for all fields for each record in the Applications table that meet the job.id filter, in JSON format. Records are sorted in ascending order by application date.
 
     Errors:
+        400: Displayed if a requested field isn't available.
         404: Displayed if the id provided as an arg doesn't match a record in the Jobs table.
         403: Displayed if the user does not meet the conditions of the authorise_as_staff wrapper functions.
         401: Displayed if no JWT is provided.
     """
-    applications_list = Application.query.order_by(Application.application_date).filter_by(job_id=id)
+    applications_list, schema = sparse_fieldset(
+        Application.query.order_by(Application.application_date).filter_by(job_id=id),
+        Application,
+        applications_staff_view_schema,
+    )
     if applications_list:
-        return applications_staff_view_schema.dump(applications_list)
+        return schema.dump(applications_list)
     else:
         return {"Error": f"Job not found with id {id}"}, 404
 
@@ -165,6 +206,7 @@ def get_job_applications(id):
 @jobs.route("/", methods=["POST"])
 @jwt_required()
 @authorise_as_staff
+@idempotent
 def create_job():
     """Creates a new record in the Jobs table, only for staff users.
 
@@ -175,6 +217,7 @@ def create_job():
 
     Input:
         title, description, location, department, salary_budget and hiring_manager_id fields, in JSON format.
+        Optionally an Idempotency-Key header, so that a retried request is given the stored response instead of creating the record again.
 
     Returns:
         Key value pairs for all fields for the new record in the Staff table, in JSON format.
@@ -183,6 +226,7 @@ def create_job():
         400: Displayed if a value provided for a field doesn't match a validation criteria.
         409: Displayed if a required field is not provided.
         404: Displayed if the hiring_manager_id provided doesn't match a record in the Staff table.
+        422: Displayed if the Idempotency-Key header has already been used for a different request.
         403: Displayed if the user does not meet the conditions of the authorise_as_staff wrapper functions.
         401: Displayed if no JWT is provided.
     """
@@ -197,7 +241,8 @@ def create_job():
         new_job.hiring_manager_id = job_fields["hiring_manager_id"]
         db.session.add(new_job)
         db.session.commit()
-        return jsonify(job_admin_schema.dump(new_job)), 201
+        job_board_cache.invalidate()
+        return with_etag(jsonify(job_admin_schema.dump(new_job)), new_job), 201
     except IntegrityError as err:
         if err.orig.pgcode == errorcodes.NOT_NULL_VIOLATION:
             return {
@@ -222,14 +267,17 @@ def update_job(id):
 
     Input:
         At least one or more of title, description, location, department, salary_budget and hiring_manager_id fields, in JSON format.
+        Optionally an If-Match header with the record's ETag, so the update is rejected if the record has changed since it was retrieved. Required if REQUIRE_IF_MATCH is turned on.
 
     Returns:
-        Key value pairs for all fields for the updated record in the Jobs table, in JSON format.
+        Key value pairs for all fields for the updated record in the Jobs table, in JSON format, with its new version in the ETag header.
 
     Errors:
         400: Displayed if a value provided for a field doesn't match a validation criteria.
         404: Displayed if the id provided as an arg doesn't match a record in the Jobs table.
         404: Displayed if the hiring_manager_id provided doesn't match a record in the Staff table.
+        412: Displayed if the If-Match header doesn't match the record's ETag, or the record is changed by another request before this update is saved.
+        428: Displayed if REQUIRE_IF_MATCH is turned on and no If-Match header is provided.
         403: Displayed if the user does not meet the conditions of the authorise_as_staff wrapper functions.
         401: Displayed if no JWT is provided.
     """
@@ -237,18 +285,26 @@ def update_job(id):
     query = db.select(Job).filter_by(id=id)
     job = db.session.scalar(query)
     if job:
+        precondition_error = check_if_match(job)
+        if precondition_error:
+            return precondition_error
         try:
             job.title = body_data.get("title") or job.title
             job.description = body_data.get("description") or job.description
             job.department = body_data.get("department") or job.department
             job.location = body_data.get("location") or job.location
             job.salary_budget = body_data.get("salary_budget") or job.salary_budget
-            job.status = body_data.get("status") or job.status
+            status = body_data.get("status") or job.status
+            if status != job.status:
+                # starts (or stops) the clock for archiving the job:
+                job.closed_at = datetime.now() if status == "Closed" else None
+            job.status = status
             job.hiring_manager_id = (
                 body_data.get("hiring_manager_id") or job.hiring_manager_id
             )
             db.session.commit()
-            return job_admin_schema.dump(job)
+            job_board_cache.invalidate()
+            return with_etag(job_admin_schema.dump(job), job)
         except IntegrityError:
             return {
                 "error": f"Invalid hiring manager id provided, please try again."
@@ -284,6 +340,70 @@ def delete_job(id):
     if job:
         db.session.delete(job)
         db.session.commit()
+        job_board_cache.invalidate()
         return {"message": f"The {job.title} job has been deleted successfully"}
     else:
         return {"error": f"Job not found with id {id}"}, 404
+
+
+@jobs.route("/archived/", methods=["GET"])
+@jwt_required()
+@authorise_as_admin
+def get_archived_jobs():
+    """Retrieves all records from the ArchivedJob table.
+
+    A GET request is used to list the closed jobs that have been moved to cold storage by the archive module. Requires a JWT and for a user to have the admin permission.
+
+    Args:
+        None required.
+
+    Input:
+        None required. Optionally filters on department (one value, or comma-separated values to match any of them), and closed_at_from, closed_at_to, archived_at_from or archived_at_to in format YYYY-MM-DD.
+        Optionally a "sort" query parameter using closed_at, archived_at or job_id.
+
+    Returns:
+        The job_id, title, department, closed_at, archived_at and application_count of each archived job, in JSON format.
+        Records are sorted in descending order by archived_at unless a sort is provided.
+
+    Errors:
+        400: Displayed if a filter value or sort key is invalid.
+        403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
+        401: Displayed if no JWT is provided.
+    """
+    query = filter_and_sort(
+        db.select(ArchivedJob),
+        ARCHIVED_JOB_FILTERS,
+        ARCHIVED_JOB_SORTS,
+        default_sort=[ArchivedJob.archived_at.desc(), ArchivedJob.job_id.desc()],
+    )
+    result = archived_jobs_schema.dump(db.session.scalars(query))
+    return jsonify(result)
+
+
+@jobs.route("/archived/<int:id>/", methods=["GET"])
+@jwt_required()
+@authorise_as_admin
+def get_archived_job(id):
+    """Retrieves an archived job from cold storage.
+
+    A GET request is used to read back a job that has been archived, with all of its applications, their interviews and the interviews' scorecards. Requires a JWT and for a user to have the admin permission.
+
+    Args:
+        job.id, the id the job had before it was archived.
+
+    Input:
+        None required.
+
+    Returns:
+        Key value pairs for all fields of the archived job, in JSON format. Its applications are nested in an "applications" list, each with an "interviews" list, each with a "scorecards" list.
+
+    Errors:
+        404: Displayed if the id provided as an arg doesn't match a record in the ArchivedJob table.
+        403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
+        401: Displayed if no JWT is provided.
+    """
+    archived_job = db.session.get(ArchivedJob, id)
+    if archived_job:
+        return jsonify(read_archive(archived_job.path))
+    else:
+        return {"error": f"Archived job not found with id {id}"}, 404
@@ -3,6 +3,9 @@ from models.scorecards import Scorecard, scorecard_schema, scorecard_view_schema
 from models.interviews import Interview
 from models.staff import Staff
 from controllers.auth_controller import authorise_as_admin, authorise_as_staff
+from idempotency import idempotent
+from versioning import check_if_match, with_etag
+from events import publish
 
 from flask import Blueprint, request
 from datetime import datetime
@@ -45,7 +48,7 @@ def get_scorecard(interview_id):
             query = db.select(Scorecard).filter_by(interview_id=interview_id)
             scorecard = db.session.scalar(query)
             if scorecard:
-                return scorecard_view_schema.dump(scorecard)
+                return with_etag(scorecard_view_schema.dump(scorecard), scorecard)
             else:
                 return {"error": f"Scorecard not found for interview {interview_id}"}, 404
         else:
@@ -57,17 +60,20 @@ def get_scorecard(interview_id):
 @scorecards.route("/", methods=["POST"])
 @jwt_required()
 @authorise_as_staff
+@idempotent
 def create_scorecard(interview_id):
     """Creates a new record in the Scorecards table, only for the interviewer.
 
     A POST request is used to create a new record in the Scorecards table.
     Requires a JWT, for a user to have staff permission and for the interviewer_id on the interview to be linked to the Staff record of the authenticated user.
+    A scorecard.created event is published to the interviewer and the job's hiring manager in the same transaction.
 
     Args:
         interview.id
 
     Input:
         notes and rating fields, in JSON format.
+        Optionally an Idempotency-Key header, so that a retried request is given the stored response instead of creating the record again.
 
     Returns:
         Key value pairs for all fields for the new record in the Scorecards table, in JSON format.
@@ -77,6 +83,7 @@ def create_scorecard(interview_id):
         409: Displayed if a required field is not provided.
         404: Displayed if the interview_id provided doesn't match a record in the Interviews table.
         409: Displayed if there is already a record in the Scorecards record linked to the interview.id provided.
+        422: Displayed if the Idempotency-Key header has already been used for a different request.
         403: Displayed if the user does not meet the conditions of the authorise_as_staff wrapper functions.
         403: Displayed if the authenticated staff user does not link to the interviewer_id on the specified interview.id.
         401: Displayed if no JWT is provided.
@@ -97,8 +104,13 @@ def create_scorecard(interview_id):
                     rating=scorecard_fields["rating"],
                 )
                 db.session.add(new_scorecard)
+                publish(
+                    "scorecard.created",
+                    {"interview_id": interview.id, "application_id": interview.application_id},
+                    staff_ids=[interview.interviewer_id, interview.application.job.hiring_manager_id],
+                )
                 db.session.commit()
-                return scorecard_view_schema.dump(new_scorecard), 201
+                return with_etag(scorecard_view_schema.dump(new_scorecard), new_scorecard), 201
             else:
                 return {"error": "Only the interviewer can create a scorecard"}, 403
         else:
@@ -124,14 +136,17 @@ def update_scorecard(interview_id):
 
     Input:
         At least one of notes or rating fields, in JSON format.
+        Optionally an If-Match header with the record's ETag, so the update is rejected if the record has changed since it was retrieved. Required if REQUIRE_IF_MATCH is turned on.
 
     Returns:
-        Key value pairs for all fields for the updated record in the Scorecards table, in JSON format.
+        Key value pairs for all fields for the updated record in the Scorecards table, in JSON format, with its new version in the ETag header.
 
     Errors:
         400: Displayed if a value provided for a field doesn't match a validation criteria.
         404: Displayed if the interview_id provided doesn't match a record in the Interviews table.
         404: Displayed if there is no matching Scorecards record linked to the interview.id provided.
+        412: Displayed if the If-Match header doesn't match the record's ETag, or the record is changed by another request before this update is saved.
+        428: Displayed if REQUIRE_IF_MATCH is turned on and no If-Match header is provided.
         403: Displayed if the user does not meet the conditions of the authorise_as_staff wrapper functions.
         403: Displayed if the authenticated staff user does not link to the interviewer_id on the specified interview.id.
         401: Displayed if no JWT is provided.
@@ -147,10 +162,13 @@ def update_scorecard(interview_id):
             query = db.select(Scorecard).filter_by(interview_id=interview_id)
             scorecard = db.session.scalar(query)
             if scorecard:
+                precondition_error = check_if_match(scorecard)
+                if precondition_error:
+                    return precondition_error
                 scorecard.notes = body_data.get("notes") or scorecard.notes
                 scorecard.rating = body_data.get("rating") or scorecard.rating
                 db.session.commit()
-                return scorecard_view_schema.dump(scorecard)
+                return with_etag(scorecard_view_schema.dump(scorecard), scorecard)
             else:
                 return {"error": f"No scorecard found for interview {interview_id}"}
         else:
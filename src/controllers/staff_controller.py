@@ -1,8 +1,18 @@
 from main import db
 from models.staff import Staff, staff_schema, staffs_schema
-from controllers.auth_controller import authorise_as_admin
-
-from flask import Blueprint, jsonify, request
+from models.jobs import Job
+from models.applications import Application, applications_dashboard_schema
+from models.candidates import Candidate
+from models.interviews import Interview, interviews_dashboard_schema
+from controllers.auth_controller import authorise_as_admin, authorise_as_staff
+from controllers.jobs_controller import jobs_schema_for_staff
+from fieldsets import sparse_fieldset
+from idempotency import idempotent
+from staff_cache import staff_cache
+from job_board_cache import job_board_cache
+
+from flask import Blueprint, jsonify, request, current_app, g
+from datetime import datetime
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy.exc import IntegrityError
 from psycopg2 import errorcodes
@@ -22,24 +32,125 @@ def get_staff():
         None required.
 
     Input:
-        None required.
+        None required. Optionally a "fields" query parameter, a comma-separated list of the fields to return.
 
     Returns:
         Key value pairs for the fields in each record in the Staff table, in JSON format. Records are sorted in ascending order by id.
 
     Errors:
+        400: Displayed if a requested field isn't available.
         403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
         401: Displayed if no JWT is provided.
     """
-    staff_list = Staff.query.order_by(Staff.id).all()
-    result = staffs_schema.dump(staff_list)
+    query, schema = sparse_fieldset(Staff.query.order_by(Staff.id), Staff, staffs_schema)
+    result = schema.dump(query.all())
     return jsonify(result)
 
 
+@staff.route("/dashboard/", methods=["GET"])
+@jwt_required()
+@authorise_as_staff
+def get_dashboard():
+    """Retrieves the hiring manager's dashboard for the authenticated Staff user.
+
+    A GET request is used to retrieve the Jobs the user is the hiring manager for, with the number of Applications in each status and the newest applicants for each job, and the user's upcoming Interviews. Requires a JWT and for a user to have staff permission.
+    The dashboard is built with four queries however many jobs the user manages: one for the jobs, one for the status counts, one for the newest applicants (ranked per job with a window function) and one for the interviews.
+
+    Args:
+        None required.
+
+    Input:
+        None required.
+
+    Returns:
+        jobs: Key value pairs for the fields in each Job record the user is the hiring manager for, with status_counts (the number of applications in each status) and newest_applicants (up to DASHBOARD_NEWEST_APPLICANTS applications, newest first). Sorted in ascending order by id.
+        Depending on the user's authentication, salary_budget is only included for admin users, as for the Jobs routes.
+        upcoming_interviews: Up to DASHBOARD_UPCOMING_INTERVIEWS of the user's interviews from now on, with the candidate's name and the job title, sorted in ascending order by interview datetime.
+
+    Errors:
+        403: Displayed if the user does not meet the conditions of the authorise_as_staff wrapper functions.
+        401: Displayed if no JWT is provided.
+    """
+    user = g.staff
+    config = current_app.config
+
+    job_list = db.session.scalars(
+        db.select(Job).filter_by(hiring_manager_id=user.id).order_by(Job.id)
+    ).all()
+
+    status_counts = {}
+    query = (
+        db.select(Application.job_id, Application.status, db.func.count())
+        .join(Job)
+        .where(Job.hiring_manager_id == user.id)
+        .group_by(Application.job_id, Application.status)
+    )
+    for job_id, status, count in db.session.execute(query):
+        status_counts.setdefault(job_id, {})[status] = count
+
+    # ranks each job's applications from newest to oldest, then keeps the top few of each:
+    ranked = (
+        db.select(
+            Application.id,
+            Application.job_id,
+            Application.application_date,
+            Application.status,
+            Application.candidate_id,
+            db.func.row_number()
+            .over(
+                partition_by=Application.job_id,
+                order_by=(Application.application_date.desc(), Application.id.desc()),
+            )
+            .label("rank"),
+        )
+        .join(Job)
+        .where(Job.hiring_manager_id == user.id)
+        .subquery()
+    )
+    query = (
+        db.select(ranked, Candidate.name.label("candidate_name"))
+        .join(Candidate, Candidate.id == ranked.c.candidate_id)
+        .where(ranked.c.rank <= config["DASHBOARD_NEWEST_APPLICANTS"])
+        .order_by(ranked.c.job_id, ranked.c.rank)
+    )
+    newest_applicants = {}
+    for row in db.session.execute(query):
+        newest_applicants.setdefault(row.job_id, []).append(row)
+
+    query = (
+        db.select(
+            Interview.id,
+            Interview.application_id,
+            Interview.interview_datetime,
+            Interview.length_mins,
+            Interview.format,
+            Candidate.name.label("candidate_name"),
+            Job.title.label("job_title"),
+        )
+        .join(Interview.candidate)
+        .join(Interview.application)
+        .join(Application.job)
+        .where(Interview.interviewer_id == user.id, Interview.interview_datetime >= datetime.now())
+        .order_by(Interview.interview_datetime)
+        .limit(config["DASHBOARD_UPCOMING_INTERVIEWS"])
+    )
+    upcoming_interviews = db.session.execute(query).all()
+
+    jobs = jobs_schema_for_staff(user, many=True).dump(job_list)
+    for job in jobs:
+        job["status_counts"] = status_counts.get(job["id"], {})
+        job["newest_applicants"] = applications_dashboard_schema.dump(newest_applicants.get(job["id"], []))
+    return {
+        "jobs": jobs,
+        "upcoming_interviews": interviews_dashboard_schema.dump(upcoming_interviews),
+    }
+
+
 # allows an admin user to create staff access linked to a registered user using a POST request:
 @staff.route("/", methods=["POST"])
 @jwt_required()
 @authorise_as_admin
+@idempotent
 def create_staff():
     """Creates a new record in the Staff table, only for admin users.
 
@@ -50,6 +161,7 @@ def create_staff():
 
     Input:
         user.id, name, title and admin fields, in JSON format.
+        Optionally an Idempotency-Key header, so that a retried request is given the stored response instead of creating the record again.
 
     Returns:
         Key value pairs for all fields for the new record in the Staff table, in JSON format.
@@ -59,6 +171,7 @@ def create_staff():
         409: Displayed if a required field is not provided.
         409: Displayed if a Staff record already exists with the user.id provided.
         404: Displayed if the user.id provided doesn't match a record in the Users table.
+        422: Displayed if the Idempotency-Key header has already been used for a different request.
         403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
         401: Displayed if no JWT is provided.
     """
@@ -71,6 +184,7 @@ def create_staff():
         new_staff.admin = staff_fields["admin"]
         db.session.add(new_staff)
         db.session.commit()
+        staff_cache.invalidate(new_staff.id)
         return jsonify(staff_schema.dump(new_staff)), 201
     except IntegrityError as err:
         if err.orig.pgcode == errorcodes.NOT_NULL_VIOLATION:
@@ -89,6 +203,7 @@ def update_staff():
     """Updates record in Staff table for linked user's own record.
 
     A PUT or PATCH request is used to update the name or title fields for an authenticated user's record in the Staff table. Requires a JWT.
+    The name and title nested in Jobs and Interviews are updated straight away by this worker, and by the others within STAFF_CACHE_TTL_SECONDS (see staff_cache.py).
 
     Args:
         None required.
@@ -112,6 +227,8 @@ def update_staff():
         staff.name = body_data.get("name") or staff.name
         staff.title = body_data.get("title") or staff.title
         db.session.commit()
+        staff_cache.invalidate(staff.id)
+        job_board_cache.invalidate()
         return staff_schema.dump(staff)
     else:
         return {"error": "You do not have a Staff record to update"}, 404
@@ -124,6 +241,7 @@ def update_staff_admin(id):
     """Updates a specified record in Staff table, only for admin users.
 
     A PUT or PATCH request is used to update the admin field for a specified record in the Staff table. Requires a JWT and for a user to have the admin permission.
+    The name and title nested in Jobs and Interviews are updated straight away by this worker, and by the others within STAFF_CACHE_TTL_SECONDS (see staff_cache.py).
 
     Args:
         staff.id
@@ -148,6 +266,8 @@ def update_staff_admin(id):
         staff.name = body_data.get("name") or staff.name
         staff.title = body_data.get("title") or staff.title
         db.session.commit()
+        staff_cache.invalidate(staff.id)
+        job_board_cache.invalidate()
         return staff_schema.dump(staff)
     else:
         return {"error": f"Staff not found with id {id}"}, 404
@@ -180,6 +300,8 @@ def delete_staff(id):
     if staff:
         db.session.delete(staff)
         db.session.commit()
+        staff_cache.invalidate(id)
+        job_board_cache.invalidate()
         return {
             "message": f"The staff record for id: {id} has been deleted successfully"
         }
@@ -1,6 +1,7 @@
 from main import db, bcrypt
 from models.users import User, user_schema, user_view_schema, users_view_schema
 from controllers.auth_controller import authorise_as_admin
+from fieldsets import sparse_fieldset
 
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
@@ -21,17 +22,18 @@ def get_users():
         None required.
 
     Input:
-        None required.
+        None required. Optionally a "fields" query parameter, a comma-separated list of the fields to return.
 
     Returns:
         Key value pairs for the email and id fields for each record in the Users table, in JSON format. Records are sorted in ascending order by id.
 
     Errors:
+        400: Displayed if a requested field isn't available.
         403: Displayed if the user does not meet the conditions of the authorise_as_admin wrapper functions.
         401: Displayed if no JWT is provided.
     """
-    users_list = User.query.order_by(User.id).all()
-    result = users_view_schema.dump(users_list)
+    query, schema = sparse_fieldset(User.query.order_by(User.id), User, users_view_schema)
+    result = schema.dump(query.all())
     return jsonify(result)
 
 
@@ -0,0 +1,161 @@
+"""Detection of candidates that have registered more than once.
+
+Comparing every candidate with every other one doesn't scale, so candidates are first grouped into blocks that share a key, and are only compared within their blocks:
+    phone: the last DEDUPE_PHONE_DIGITS digits of the phone number, ignoring spaces, brackets, hyphens and country codes.
+    name: the first three letters of each word in the name, in alphabetical order, so "Elizabeth Riley", "Riley, Elisabeth" and "Eliza Riley" share a block.
+The blocks are built by Postgres in a single grouped scan of the candidates table, and only blocks with more than one candidate are returned, so the work grows with the number of candidates rather than its square.
+Pairs within a block are then compared by the similarity of their names, and likely duplicates are saved as suggestions for an admin to merge or dismiss.
+"""
+
+from main import db
+from models.applications import Application
+from models.interviews import Interview
+from models.candidate_duplicates import CandidateDuplicate
+from tasks import task
+
+from flask import current_app
+from sqlalchemy.dialects.postgresql import insert
+from difflib import SequenceMatcher
+from itertools import combinations
+import re
+
+BLOCKS_SQL = """
+    WITH keys AS (
+        SELECT id, name, 'phone' AS kind, right(digits, :phone_digits) AS key
+        FROM (SELECT id, name, regexp_replace(phone_number, '[^0-9]', '', 'g') AS digits FROM candidates) phones
+        WHERE length(digits) >= :phone_digits
+        UNION ALL
+        SELECT id, name, 'name' AS kind, (
+            SELECT string_agg(left(word, 3), ' ' ORDER BY left(word, 3))
+            FROM regexp_split_to_table(lower(name), '[^a-z]+') AS word
+            WHERE word <> ''
+        ) AS key
+        FROM candidates
+    )
+    SELECT kind, key, json_agg(json_build_array(id, name) ORDER BY id) AS members
+    FROM keys
+    WHERE key IS NOT NULL
+    GROUP BY kind, key
+    HAVING count(*) > 1
+"""
+
+
+def normalise_name(name):
+    """Lowercases a name and sorts its words, so that the order of first and last names doesn't matter."""
+    return " ".join(sorted(re.findall("[a-z]+", name.lower())))
+
+
+def name_similarity(first, second):
+    """Returns how similar two normalised names are, between 0 and 1."""
+    matcher = SequenceMatcher(None, first, second)
+    return matcher.ratio()
+
+
+def block_pairs(kind, members, threshold):
+    """Compares every pair of candidates in a block.
+
+    Args:
+        kind: "phone" or "name", the key the block was formed on.
+        members: A list of [id, name] pairs, in id order.
+        threshold: The name similarity needed for a pair to be suggested.
+
+    Returns:
+        A list of (candidate_id, duplicate_id, score, reason) tuples for the likely duplicates.
+    """
+    names = [(candidate_id, normalise_name(name)) for candidate_id, name in members]
+    pairs = []
+    for (first_id, first_name), (second_id, second_name) in combinations(names, 2):
+        score = name_similarity(first_name, second_name)
+        if score >= threshold:
+            pairs.append((first_id, second_id, round(score, 3), kind))
+    return pairs
+
+
+def find_duplicates():
+    """Finds likely duplicate candidates and saves them as pending merge suggestions.
+
+    Pairs that share a phone number need names at least DEDUPE_PHONE_NAME_THRESHOLD similar, as people in the same household can share a number.
+    Pairs that only share a name block need names at least DEDUPE_NAME_THRESHOLD similar.
+    Blocks with more than DEDUPE_MAX_BLOCK_SIZE candidates are skipped, as a very common key (such as a placeholder phone number) says little about whether two records are the same person.
+    Pairs that have already been suggested, including dismissed ones, are not suggested again.
+
+    Returns:
+        A dict with the number of blocks compared and skipped, and the number of new suggestions.
+    """
+    config = current_app.config
+    thresholds = {
+        "phone": config["DEDUPE_PHONE_NAME_THRESHOLD"],
+        "name": config["DEDUPE_NAME_THRESHOLD"],
+    }
+    suggestions = {}
+    compared = skipped = 0
+    blocks = db.session.execute(
+        db.text(BLOCKS_SQL).execution_options(yield_per=1000),
+        {"phone_digits": config["DEDUPE_PHONE_DIGITS"]},
+    )
+    for kind, key, members in blocks:
+        if len(members) > config["DEDUPE_MAX_BLOCK_SIZE"]:
+            skipped += 1
+            current_app.logger.warning(f"Skipped {kind} block {key!r} with {len(members)} candidates")
+            continue
+        compared += 1
+        for candidate_id, duplicate_id, score, reason in block_pairs(kind, members, thresholds[kind]):
+            # a pair found in both a phone block and a name block is kept as a phone match:
+            if (candidate_id, duplicate_id) not in suggestions or reason == "phone":
+                suggestions[(candidate_id, duplicate_id)] = {
+                    "candidate_id": candidate_id,
+                    "duplicate_id": duplicate_id,
+                    "score": score,
+                    "reason": reason,
+                }
+    rows = list(suggestions.values())
+    created = 0
+    for i in range(0, len(rows), config["DEDUPE_INSERT_BATCH_SIZE"]):
+        statement = (
+            insert(CandidateDuplicate)
+            .on_conflict_do_nothing(constraint="uq_candidate_duplicates_pair")
+            .returning(CandidateDuplicate.id)
+        )
+        created += len(db.session.scalars(statement, rows[i : i + config["DEDUPE_INSERT_BATCH_SIZE"]]).all())
+    db.session.commit()
+    return {"blocks_compared": compared, "blocks_skipped": skipped, "suggestions_created": created}
+
+
+def merge_candidates(suggestion, keep):
+    """Merges the two candidates of a suggestion, without committing.
+
+    The applications and interviews of the candidate that isn't kept are moved to the one that is, and the other candidate is deleted along with its user, so it can no longer log in.
+    The suggestion is deleted too, along with any other suggestions involving the deleted candidate. The moved applications and interviews are recorded in the audit log.
+
+    Args:
+        suggestion: A pending CandidateDuplicate record.
+        keep: The Candidate record to keep, either suggestion.candidate or suggestion.duplicate.
+
+    Returns:
+        The number of applications and interviews moved to the kept candidate.
+    """
+    removed = suggestion.duplicate if keep is suggestion.candidate else suggestion.candidate
+    moved = 0
+    for model in (Application, Interview):
+        for record in db.session.scalars(db.select(model).filter_by(candidate_id=removed.id)):
+            record.candidate_id = keep.id
+            moved += 1
+    db.session.execute(
+        db.delete(CandidateDuplicate)
+        .where(
+            db.or_(
+                CandidateDuplicate.candidate_id == removed.id,
+                CandidateDuplicate.duplicate_id == removed.id,
+            )
+        )
+        .execution_options(synchronize_session="fetch")
+    )
+    # the moved records must not still be in the removed candidate's collections, or they would be deleted with it:
+    db.session.expire(removed)
+    db.session.delete(removed.user)
+    return moved
+
+
+@task("find_duplicate_candidates")
+def find_duplicate_candidates_task():
+    find_duplicates()
@@ -0,0 +1,117 @@
+"""Live events for Applications, Interviews and Scorecards, streamed to clients as Server-Sent Events.
+
+Writes publish an event with Postgres NOTIFY in the same transaction, so it is only delivered if the write commits, and is delivered to every process.
+An event names the candidates and staff it is for, and is also sent to every admin. It only holds the type and ids of the record, so clients fetch the record itself through the API.
+
+The stream is served by the async serving mode (asgi.py), where each process has one EventHub with a single LISTEN connection that fans each event out
+to a queue per connected client, so an open stream only costs a queue and a coroutine rather than a worker thread.
+NOTIFY isn't stored, so a client that disconnects misses the events until it reconnects, and should then refresh, such as from the change feed.
+"""
+
+from main import db
+
+from flask import current_app
+import asyncio
+import json
+
+
+def publish(event, data, candidate_ids=(), staff_ids=()):
+    """Publishes an event with NOTIFY, to be delivered when the current transaction commits.
+
+    Args:
+        event: The event type, such as "application.updated".
+        data: A dict of ids identifying the record, kept small as NOTIFY payloads are limited to 8000 bytes.
+        candidate_ids: The ids of the Candidates the event is for.
+        staff_ids: The ids of the Staff the event is for. Admins receive every event anyway.
+    """
+    payload = {
+        "event": event,
+        "data": data,
+        "candidates": sorted({id for id in candidate_ids if id is not None}),
+        "staff": sorted({id for id in staff_ids if id is not None}),
+    }
+    db.session.execute(
+        db.select(db.func.pg_notify(current_app.config["EVENTS_CHANNEL"], json.dumps(payload)))
+    )
+
+
+def subscriber_keys(staff_member, candidate):
+    """Lists the keys a user's stream is subscribed under, from their Staff or Candidate record."""
+    if staff_member:
+        return [("staff", staff_member.id)] + ([("admin",)] if staff_member.admin else [])
+    if candidate:
+        return [("candidate", candidate.id)]
+    return []
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class EventHub:
+    """Listens for events on one connection per process, and fans them out to the queues of the connected clients.
+
+    The LISTEN connection is opened by the first subscriber. If it is lost, every stream is ended so its client reconnects, which opens it again.
+    A client whose queue fills up because it isn't reading is also ended, rather than holding events in memory.
+    """
+
+    def __init__(self, connect_args, channel, queue_size):
+        self.connect_args = connect_args
+        self.channel = channel
+        self.queue_size = queue_size
+        self.subscribers = {}
+        self.connection = None
+        self.lock = asyncio.Lock()
+
+    async def subscribe(self, keys):
+        """Returns a new queue for a client, which receives formatted events, or None when the stream should end."""
+        async with self.lock:
+            if self.connection is None or self.connection.is_closed():
+                # installed with requirements-async.txt:
+                import asyncpg
+
+                self.connection = await asyncpg.connect(**self.connect_args)
+                self.connection.add_termination_listener(self.connection_lost)
+                await self.connection.add_listener(self.channel, self.dispatch)
+        queue = asyncio.Queue(self.queue_size)
+        for key in keys:
+            self.subscribers.setdefault(key, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue, keys):
+        for key in keys:
+            queues = self.subscribers.get(key)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self.subscribers[key]
+
+    def dispatch(self, connection, pid, channel, payload):
+        event = json.loads(payload)
+        keys = [("admin",)]
+        keys += [("staff", id) for id in event["staff"]]
+        keys += [("candidate", id) for id in event["candidates"]]
+        # a queue subscribed under several keys, such as an admin who is also the interviewer, gets the event once:
+        queues = set().union(*(self.subscribers.get(key, ()) for key in keys))
+        message = format_event(event["event"], event["data"])
+        for queue in queues:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.end(queue)
+
+    def connection_lost(self, connection):
+        self.connection = None
+        for queue in set().union(*self.subscribers.values()):
+            self.end(queue)
+
+    def end(self, queue):
+        """Ends a client's stream, by replacing its queued events with None."""
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    async def close(self):
+        if self.connection is not None:
+            await self.connection.close()
+            self.connection = None
@@ -0,0 +1,113 @@
+"""Sparse fieldsets requested with the ?fields= query parameter.
+
+A request such as ?fields=id,status,candidate.name is checked against the fields that the role's schema allows, and is then used both to limit the columns and joins in the query, and to limit the fields that are serialised.
+"""
+
+from staff_cache import StaffReference
+
+from flask import request
+from marshmallow import fields
+from marshmallow.exceptions import ValidationError
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, load_only, selectinload
+
+_schema_cache = {}
+
+
+def allowed_fields(schema, prefix=""):
+    """Lists every field path the schema will serialise, including dotted paths into nested schemas."""
+    paths = []
+    for name, field in schema.dump_fields.items():
+        paths.append(prefix + name)
+        if isinstance(field, fields.Nested):
+            paths.extend(allowed_fields(field.schema, f"{prefix}{name}."))
+        elif isinstance(field, StaffReference):
+            paths.extend(f"{prefix}{name}.{sub_name}" for sub_name in field.FIELDS)
+    return paths
+
+
+def requested_fields(schema, args=None):
+    """Parses the ?fields= query parameter against what the schema allows.
+
+    Args:
+        schema: The schema that would otherwise be used to serialise the result.
+        args: The query parameters, which default to those of the current Flask request.
+
+    Returns:
+        A tuple of the requested field paths, or None if the parameter wasn't provided.
+
+    Errors:
+        Raises a ValidationError, which is returned as a 400 error, if a requested field isn't available in the schema.
+    """
+    raw = (request.args if args is None else args).get("fields")
+    if not raw:
+        return None
+    requested = tuple(dict.fromkeys(path.strip() for path in raw.split(",") if path.strip()))
+    invalid = set(requested) - set(allowed_fields(schema))
+    if invalid or not requested:
+        raise ValidationError(
+            {"fields": [f"Invalid field(s) requested: {', '.join(sorted(invalid)) or 'none'}"]}
+        )
+    return requested
+
+
+def fieldset_schema(schema, only):
+    """Returns a copy of the schema limited to the requested fields, reusing copies between requests."""
+    key = (type(schema), only, schema.many)
+    if key not in _schema_cache:
+        _schema_cache[key] = type(schema)(only=only, many=schema.many)
+    return _schema_cache[key]
+
+
+def load_options(model, schema, only):
+    """Translates requested field paths into loader options for the model's query.
+
+    Requested columns are loaded with load_only, requested nested schemas are loaded in the same query with joinedload (or selectinload for collections), and relationships that weren't requested are left out of the query entirely.
+    A StaffReference field only needs its foreign key column, as the Staff member comes from the staff cache.
+    """
+    mapper = inspect(model)
+    columns = [mapper.get_property_by_column(mapper.primary_key[0]).class_attribute]
+    if mapper.version_id_col is not None:
+        # the version is always loaded, as it is sent as the ETag and checked by updates:
+        columns.append(mapper.get_property_by_column(mapper.version_id_col).class_attribute)
+    nested = {}
+    for path in only:
+        name, _, rest = path.partition(".")
+        field = schema.dump_fields[name]
+        attribute = field.attribute or name
+        if isinstance(field, fields.Nested):
+            nested.setdefault(name, [])
+            if rest:
+                nested[name].append(rest)
+        elif attribute in mapper.column_attrs:
+            columns.append(mapper.column_attrs[attribute].class_attribute)
+    options = [load_only(*columns)]
+    for name, sub_paths in nested.items():
+        field = schema.dump_fields[name]
+        relationship = mapper.relationships[field.attribute or name]
+        loader = selectinload if relationship.uselist else joinedload
+        sub_paths = tuple(sub_paths) or tuple(field.schema.dump_fields)
+        options.append(
+            loader(relationship.class_attribute).options(
+                *load_options(relationship.mapper.class_, field.schema, sub_paths)
+            )
+        )
+    return options
+
+
+def sparse_fieldset(query, model, schema, args=None):
+    """Applies the ?fields= query parameter to a query and its schema.
+
+    Args:
+        query: A select statement or query for the model.
+        model: The model being queried.
+        schema: The schema that would otherwise be used to serialise the result.
+        args: The query parameters, which default to those of the current Flask request.
+
+    Returns:
+        The query with loader options for the requested fields, and the schema to serialise the result with. Both are returned unchanged if no fields were requested.
+    """
+    only = requested_fields(schema, args)
+    if only is None:
+        return query, schema
+    return query.options(*load_options(model, schema, only)), fieldset_schema(schema, only)
@@ -0,0 +1,91 @@
+"""Filtering and sorting of list endpoints from query parameters.
+
+Each endpoint declares an allow-list of the parameters it accepts, so that only indexed columns can be filtered and sorted on.
+For a filter named "status":
+    ?status=Offer filters on equality, and ?status=Offer,Rejected filters with IN.
+For a range filter named "application_date":
+    ?application_date_from=2023-07-01&application_date_to=2023-07-31 filters with >= and <=, and either end can be left out.
+Sorting uses a comma-separated list of allowed sort keys, with a leading "-" for descending order:
+    ?sort=-application_date,id
+"""
+
+from flask import request
+from marshmallow.exceptions import ValidationError
+
+
+class QueryFilter:
+    """An allowed filter for a list endpoint.
+
+    Args:
+        column: The column that is filtered on.
+        field: A marshmallow field used to validate and convert each value.
+        range: True to filter with _from and _to parameters instead of equality or IN.
+        through: An optional many-to-one relationship on the queried model, used when the column belongs to the related model. The condition is then applied with an EXISTS subquery rather than a join.
+    """
+
+    def __init__(self, column, field, range=False, through=None):
+        self.column = column
+        self.field = field
+        self.range = range
+        self.through = through
+
+    def _load(self, name, value):
+        try:
+            return self.field.deserialize(value)
+        except ValidationError as err:
+            raise ValidationError({name: err.messages})
+
+    def conditions(self, name, args):
+        """Builds the SQL conditions for this filter from the request's query parameters."""
+        conditions = []
+        if self.range:
+            if f"{name}_from" in args:
+                conditions.append(self.column >= self._load(f"{name}_from", args[f"{name}_from"]))
+            if f"{name}_to" in args:
+                conditions.append(self.column <= self._load(f"{name}_to", args[f"{name}_to"]))
+        elif name in args:
+            values = [self._load(name, value) for value in args[name].split(",")]
+            if len(values) == 1:
+                conditions.append(self.column == values[0])
+            else:
+                conditions.append(self.column.in_(values))
+        if self.through is not None:
+            return [self.through.has(condition) for condition in conditions]
+        return conditions
+
+
+def filter_and_sort(query, filters, sorts, default_sort, args=None):
+    """Applies the filter and sort query parameters to a list query.
+
+    Args:
+        query: The query for the list endpoint.
+        filters: A dict of filter names to QueryFilter objects.
+        sorts: A dict of allowed sort keys to columns.
+        default_sort: The columns to sort by when no sort parameter is provided.
+        args: The query parameters, which default to those of the current Flask request.
+
+    Returns:
+        The filtered and sorted query.
+
+    Errors:
+        Raises a ValidationError, which is returned as a 400 error, if a filter value is invalid or a sort key isn't allowed.
+    """
+    args = request.args if args is None else args
+    for name, query_filter in filters.items():
+        conditions = query_filter.conditions(name, args)
+        if conditions:
+            query = query.filter(*conditions)
+    sort = args.get("sort")
+    if not sort:
+        return query.order_by(*default_sort)
+    order_by = []
+    for key in sort.split(","):
+        key = key.strip()
+        descending = key.startswith("-")
+        column = sorts.get(key.lstrip("-"))
+        if column is None:
+            raise ValidationError(
+                {"sort": [f"Cannot sort by '{key.lstrip('-')}', allowed keys are: {', '.join(sorts)}"]}
+            )
+        order_by.append(column.desc() if descending else column.asc())
+    return query.order_by(*order_by)
@@ -0,0 +1,63 @@
+"""Gunicorn settings for running the API in production.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is loaded once in the master process and the garbage collector is frozen before forking, so the workers share the imported code and schemas copy-on-write instead of each holding their own copy.
+Workers are restarted after GUNICORN_MAX_REQUESTS requests, with jitter so they don't all restart at once.
+
+Reloading:
+    kill -HUP <master pid> gracefully replaces the workers, but as the app is preloaded they keep the code loaded by the master.
+    To deploy new code without dropping requests, send USR2 to start a new master with the new code, then WINCH and QUIT to the old master once the new workers are up.
+"""
+
+from main import db
+
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 100))
+preload_app = True
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+
+
+def unique_memory_kb():
+    """Reads the memory that belongs only to this process (its USS), in kB, or None if /proc isn't available."""
+    try:
+        with open("/proc/self/smaps_rollup") as smaps:
+            return sum(
+                int(line.split()[1])
+                for line in smaps
+                if line.startswith(("Private_Clean:", "Private_Dirty:"))
+            )
+    except OSError:
+        return None
+
+
+def when_ready(server):
+    # moves everything loaded so far into a permanent generation, so collections in the workers don't write to
+    # (and so copy) the pages shared with the master:
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Master ready, unique memory {unique_memory_kb()} kB")
+
+
+def post_fork(server, worker):
+    # the workers must not share the master's database connections:
+    with server.app.wsgi().app_context():
+        db.engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    worker.log.info(f"Worker {worker.pid} started, unique memory {unique_memory_kb()} kB")
+
+
+def worker_exit(server, worker):
+    server.log.info(f"Worker {worker.pid} exiting, unique memory {unique_memory_kb()} kB")
@@ -0,0 +1,111 @@
+"""Idempotency keys for create endpoints.
+
+A client that retries a create request after a timeout can send the same Idempotency-Key header with each attempt.
+The first request with a key is handled as normal and its response is stored for IDEMPOTENCY_KEY_TTL_HOURS, and any retry with the same key is given the stored response
+(with its ETag and an Idempotent-Replayed header) instead of creating the record again.
+
+The key is claimed by inserting its row in a separate transaction that is only committed once the response has been stored.
+A concurrent request with the same key blocks on that insert until the first request finishes, and then replays its response rather than racing it.
+If the first request fails with a 5xx error or an exception, its row is rolled back and the waiting request is handled as a new request.
+"""
+
+from main import db
+from models.idempotency_keys import IdempotencyKey
+
+from flask import current_app, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy.dialects.postgresql import insert
+from datetime import datetime, timedelta
+import functools
+import hashlib
+import json
+
+# the response headers that are stored and replayed with the body, such as the ETag a client needs for a follow-up If-Match update:
+REPLAYED_HEADERS = ("ETag",)
+
+
+def request_fingerprint():
+    """Hashes the request method, path and body, ignoring the order of keys and whitespace in a JSON body."""
+    body = request.get_json(silent=True)
+    if body is None:
+        body_bytes = request.get_data()
+    else:
+        body_bytes = json.dumps(body, sort_keys=True, separators=(",", ":")).encode()
+    digest = hashlib.sha256(f"{request.method} {request.path}\n".encode())
+    digest.update(body_bytes)
+    return digest.hexdigest()
+
+
+def replay(stored):
+    response = current_app.response_class(stored.body, stored.status_code, mimetype=stored.mimetype)
+    response.headers.update(stored.headers or {})
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(fn):
+    """Wrapper function for create endpoints that accept an Idempotency-Key header.
+
+    Used after jwt_required and any authorisation wrapper, so that keys are scoped to the authenticated user. Requests without the header are handled as normal.
+
+    Errors:
+        400: Displayed if the Idempotency-Key header is longer than 255 characters.
+        422: Displayed if the Idempotency-Key has already been used for a different request.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return fn(*args, **kwargs)
+        if len(key) > 255:
+            return {"error": "The Idempotency-Key header can only be a maximum of 255 characters long"}, 400
+        user_id = int(get_jwt_identity())
+        fingerprint = request_fingerprint()
+        now = datetime.now()
+        expires_at = now + timedelta(hours=current_app.config["IDEMPOTENCY_KEY_TTL_HOURS"])
+        table = IdempotencyKey.__table__
+        claim = insert(table).values(
+            user_id=user_id, key=key, fingerprint=fingerprint, created_at=now, expires_at=expires_at
+        )
+        # an expired key is claimed again as if it was new:
+        claim = claim.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.key],
+            set_={
+                "fingerprint": claim.excluded.fingerprint,
+                "status_code": None,
+                "body": None,
+                "mimetype": None,
+                "headers": None,
+                "created_at": claim.excluded.created_at,
+                "expires_at": claim.excluded.expires_at,
+            },
+            where=table.c.expires_at < now,
+        ).returning(table.c.key)
+        row = db.and_(table.c.user_id == user_id, table.c.key == key)
+        # closing the connection without committing rolls back the claim:
+        with db.engine.connect() as connection:
+            if connection.execute(claim).first() is None:
+                stored = connection.execute(db.select(table).where(row)).one()
+                if stored.fingerprint != fingerprint:
+                    return {
+                        "error": "This Idempotency-Key has already been used for a different request"
+                    }, 422
+                return replay(stored)
+            response = make_response(fn(*args, **kwargs))
+            if response.status_code >= 500:
+                return response
+            connection.execute(
+                db.update(table)
+                .where(row)
+                .values(
+                    status_code=response.status_code,
+                    body=response.get_data(as_text=True),
+                    mimetype=response.mimetype,
+                    headers={name: response.headers[name] for name in REPLAYED_HEADERS if name in response.headers},
+                )
+            )
+            connection.commit()
+            return response
+
+    return wrapper
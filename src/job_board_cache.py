@@ -0,0 +1,161 @@
+"""A cache of the job board's response bodies (GET /jobs/), rebuilt by one request at a time after it expires or is invalidated.
+
+Each worker keeps the JSON body of the open jobs for each schema and ?fields= combination for JOB_BOARD_CACHE_SECONDS, up to JOB_BOARD_CACHE_SIZE bodies.
+The body is also kept compressed in each encoding that clients ask for, so that a hit is sent as it is, rather than compressed again for every request.
+Writes to Jobs and Staff invalidate the cache straight away in their own worker, while other workers pick up the change within JOB_BOARD_CACHE_SECONDS.
+
+On a miss, the body is rebuilt through single_flight, so the many requests that miss at once when the cache is invalidated or a worker starts
+make one query between them rather than one each. With SINGLE_FLIGHT_ADVISORY_LOCK turned on, the rebuild is also coalesced across workers:
+the body is shared through the cached_responses table, and only the worker holding the key's advisory lock builds it, while the others wait for the lock and read it.
+"""
+
+from main import db
+from models.cached_responses import CachedResponse
+from compression import compress_body
+from single_flight import cross_worker_lock, single_flight
+
+from sqlalchemy.dialects.postgresql import insert
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import threading
+import time
+
+
+def cache_key(name, schema):
+    """Returns the cache key of a response serialised with a schema, which depends on the schema for the user's role and the fields requested."""
+    return f"jobs:{name}:{type(schema).__name__}:{','.join(sorted(schema.only or ()))}"
+
+
+class JobBoardCache:
+    """The per-worker LRU cache of job board response bodies, each kept uncompressed and in the encodings clients have asked for."""
+
+    def __init__(self):
+        self.config = None
+        # (expires_at, body, content_encoding) by (cache key, requested encoding):
+        self.entries = OrderedDict()
+        # incremented by each invalidation, so a body built from data read before the invalidation isn't stored after it:
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        self.config = app.config
+
+    def _fresh(self, entry_key):
+        """Returns the cached entry, or None if it isn't cached or has expired. Must be called with the lock held."""
+        entry = self.entries.get(entry_key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self.entries[entry_key]
+            return None
+        self.entries.move_to_end(entry_key)
+        return entry
+
+    def _store(self, entry_key, generation, expires_at, body, content_encoding):
+        with self.lock:
+            if generation == self.generation:
+                self.entries[entry_key] = (expires_at, body, content_encoding)
+                self.entries.move_to_end(entry_key)
+                while len(self.entries) > self.config["JOB_BOARD_CACHE_SIZE"]:
+                    self.entries.popitem(last=False)
+        return body, content_encoding
+
+    def encode(self, body, encoding):
+        """Compresses a body with the encoding, as the Compress extension would, returning the body and its Content-Encoding."""
+        if encoding and len(body) >= self.config["COMPRESS_MIN_SIZE"]:
+            return compress_body(body, encoding, self.config), encoding
+        return body, None
+
+    def peek(self, key, encoding=None):
+        """Returns the cached body for a key in an encoding, and its Content-Encoding, or None if it isn't cached or has expired."""
+        with self.lock:
+            entry = self._fresh((key, encoding))
+        return None if entry is None else entry[1:]
+
+    def get(self, key, build, encoding=None):
+        """Returns the cached body for a key, building it with build() on a miss, once for all the requests that miss at the same time.
+
+        Compressed bodies are kept alongside the uncompressed one, so a hit is sent without compressing it again.
+
+        Args:
+            key: The cache key from cache_key().
+            build: Returns the JSON body as a string, called with no arguments.
+            encoding: The encoding chosen from the request's Accept-Encoding header with compression.choose_encoding, or None.
+
+        Returns:
+            The body as bytes, and its Content-Encoding, which is None if the body isn't compressed, such as when it's under COMPRESS_MIN_SIZE.
+        """
+        if self.config["JOB_BOARD_CACHE_SECONDS"] <= 0:
+            return self.encode(build().encode(), encoding)
+        cached = self.peek(key, encoding)
+        if cached is None:
+            timeout = self.config["SINGLE_FLIGHT_TIMEOUT_SECONDS"]
+            if encoding is None:
+                cached = single_flight.do(key, lambda: self.fill(key, build), timeout)
+            else:
+                cached = single_flight.do((key, encoding), lambda: self.fill_encoded(key, build, encoding), timeout)
+        return cached
+
+    def fill(self, key, build):
+        with self.lock:
+            generation = self.generation
+        # a request that gave up waiting for the leader may get here after the leader stored the body:
+        cached = self.peek(key)
+        if cached is not None:
+            return cached
+        body = self.fill_shared(key, build) if self.config["SINGLE_FLIGHT_ADVISORY_LOCK"] else build()
+        expires_at = time.monotonic() + self.config["JOB_BOARD_CACHE_SECONDS"]
+        return self._store((key, None), generation, expires_at, body.encode(), None)
+
+    def fill_encoded(self, key, build, encoding):
+        """Compresses the uncompressed body for a key, which is cached first if needed, and caches it until the uncompressed body expires."""
+        with self.lock:
+            generation = self.generation
+        cached = self.peek(key, encoding)
+        if cached is not None:
+            return cached
+        body, _ = self.get(key, build)
+        with self.lock:
+            entry = self._fresh((key, None))
+        encoded = self.encode(body, encoding)
+        if entry is None:
+            # invalidated since the body was built, so the compressed body isn't stored either:
+            return encoded
+        return self._store((key, encoding), generation, entry[0], *encoded)
+
+    def fill_shared(self, key, build):
+        """Reads the body from the cached_responses table, or builds and stores it, while holding the key's advisory lock.
+
+        The lock is held on a connection of its own, so the leader uses one connection from the pool besides the request's.
+        """
+        with cross_worker_lock(key, self.config["SINGLE_FLIGHT_TIMEOUT_SECONDS"]) as connection:
+            if connection is None:
+                return build()
+            now = datetime.now()
+            body = connection.scalar(
+                db.select(CachedResponse.body).where(CachedResponse.key == key, CachedResponse.expires_at > now)
+            )
+            if body is None:
+                body = build()
+                expires_at = now + timedelta(seconds=self.config["JOB_BOARD_CACHE_SECONDS"])
+                upsert = insert(CachedResponse).values(key=key, body=body, expires_at=expires_at)
+                connection.execute(
+                    upsert.on_conflict_do_update(
+                        index_elements=[CachedResponse.key],
+                        set_={"body": upsert.excluded.body, "expires_at": upsert.excluded.expires_at},
+                    )
+                )
+                connection.commit()
+            return body
+
+    def invalidate(self):
+        """Removes every cached body, after a write to Jobs or Staff has been committed."""
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+        if self.config["SINGLE_FLIGHT_ADVISORY_LOCK"]:
+            with db.engine.begin() as connection:
+                connection.execute(db.delete(CachedResponse))
+
+
+job_board_cache = JobBoardCache()
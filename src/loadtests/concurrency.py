@@ -0,0 +1,136 @@
+"""Load test of how many requests one server process keeps in flight at once, comparing the Flask (gunicorn) and async (uvicorn) modes.
+
+The requests are only slow if the database is, so the test can put a delaying proxy in front of Postgres to stand in for a database
+on another host. Start the proxy, then serve the API through it with a single worker process in either mode:
+
+    python loadtests/concurrency.py proxy --upstream /tmp/pgdata/.s.PGSQL.5432 --delay 0.02
+    DATABASE_URL=postgresql+psycopg2://postgres@127.0.0.1:6543/ats_db WEB_CONCURRENCY=1 gunicorn -c gunicorn.conf.py wsgi:app
+    DATABASE_URL=postgresql+psycopg2://postgres@127.0.0.1:6543/ats_db uvicorn asgi:app --port 8000
+
+and run the clients against it:
+
+    python loadtests/concurrency.py run http://127.0.0.1:8000/jobs/1/ --concurrency 200
+
+The number of requests in flight is worked out from the throughput and the latency of a request on its own (Little's law), so it counts
+the requests the server was working on at once, rather than those waiting in its listen backlog. As requests slow down under load,
+this is a lower bound.
+
+Measured for GET /jobs/1/ with 200 clients for 20 seconds, a 20 ms delay on each database round trip, and one worker process,
+on one CPU shared with Postgres and the clients:
+    gunicorn, 1 sync worker:           11 requests/s, median latency 17.6 s, 1 request in flight
+    gunicorn, 1 worker with 8 threads: 84 requests/s, median latency 2.3 s, 8 requests in flight
+    uvicorn, 1 worker:                 214 requests/s, median latency 0.9 s, 15 requests in flight
+The async worker is then limited by the CPU rather than by threads, with up to ASYNC_POOL_SIZE queries waiting on the database at once.
+"""
+
+from urllib.parse import urlsplit
+import argparse
+import asyncio
+import statistics
+import time
+
+
+async def delayed_copy(reader, writer, delay):
+    """Copies data from reader to writer, holding each chunk back for delay seconds."""
+    try:
+        while data := await reader.read(65536):
+            await asyncio.sleep(delay)
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def proxy(args):
+    """Forwards TCP connections to Postgres, delaying the replies to stand in for a database on another host."""
+
+    async def connect(client_reader, client_writer):
+        if args.upstream.startswith("/"):
+            server_reader, server_writer = await asyncio.open_unix_connection(args.upstream)
+        else:
+            host, port = args.upstream.rsplit(":", 1)
+            server_reader, server_writer = await asyncio.open_connection(host, int(port))
+        await asyncio.gather(
+            delayed_copy(client_reader, server_writer, 0),
+            delayed_copy(server_reader, client_writer, args.delay),
+        )
+
+    server = await asyncio.start_server(connect, "127.0.0.1", args.port)
+    print(f"Forwarding 127.0.0.1:{args.port} to {args.upstream} with {args.delay * 1000:.0f} ms of delay")
+    async with server:
+        await server.serve_forever()
+
+
+async def get(host, port, target):
+    """Sends one GET request on a new connection and returns the status code."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f"GET {target} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    return int(response.split(b" ", 2)[1])
+
+
+async def client(host, port, target, deadline, latencies, statuses):
+    """Sends requests one after another until the deadline."""
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            statuses.append(await get(host, port, target))
+        except (ConnectionError, IndexError, ValueError):
+            statuses.append(None)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(args):
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    target = url.path + (f"?{url.query}" if url.query else "")
+    # the latency of a request on its own is the time the server spends on it, without any queueing:
+    unloaded = []
+    await client(host, port, target, time.perf_counter() + 2, unloaded, [])
+    service_time = statistics.median(unloaded)
+    latencies, statuses = [], []
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*(client(host, port, target, deadline, latencies, statuses) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    if not latencies:
+        print("no responses")
+        return
+    throughput = len(latencies) / elapsed
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, round(len(latencies) * 0.95))]
+    print(f"unloaded latency {service_time * 1000:.0f} ms")
+    print(
+        f"{len(latencies)} responses in {elapsed:.1f} s: {throughput:.0f} requests/s, "
+        f"median latency {statistics.median(latencies) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms"
+    )
+    print(f"requests in flight: {throughput * service_time:.0f} of {args.concurrency}")
+    failed = len(statuses) - statuses.count(200)
+    if failed:
+        print(f"{failed} requests failed or returned an error")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    proxy_parser = commands.add_parser("proxy", help="forward to Postgres with a delay on each reply")
+    proxy_parser.add_argument("--upstream", default="/tmp/pgdata/.s.PGSQL.5432", help="Postgres unix socket path or host:port")
+    proxy_parser.add_argument("--port", type=int, default=6543)
+    proxy_parser.add_argument("--delay", type=float, default=0.02, help="seconds added to each database reply")
+    run_parser = commands.add_parser("run", help="send concurrent requests and report the requests in flight")
+    run_parser.add_argument("url", nargs="?", default="http://127.0.0.1:8000/jobs/1/")
+    run_parser.add_argument("--concurrency", type=int, default=200)
+    run_parser.add_argument("--duration", type=float, default=20)
+    args = parser.parse_args()
+    asyncio.run(proxy(args) if args.command == "proxy" else run(args))
+
+
+if __name__ == "__main__":
+    main()
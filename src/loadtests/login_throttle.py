@@ -0,0 +1,157 @@
+"""Load test of POST /auth/login during a credential-stuffing burst, to check that legitimate logins keep their latency while the attack is throttled.
+
+Run it against the API served by gunicorn, seeded with `flask db seed`:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    python loadtests/login_throttle.py http://127.0.0.1:8000
+
+Attackers send bad-password logins for registered victim accounts from a few loopback addresses (127.0.1.x) at a fixed rate, so that
+each attempt that isn't throttled checks a password hash as a real credential-stuffing attempt would, while legitimate users log in
+from 127.0.0.1 at a steady rate. The attackers run in a separate process at the lowest priority, standing in for machines of their own,
+so that the load generator doesn't take the server's CPU. The legitimate logins are timed first on their own, then during the attack.
+Run it once with the server started as usual and once with LOGIN_THROTTLE_ENABLED=false to compare. Delete the bucket file
+(LOGIN_THROTTLE_PATH) between runs.
+
+While throttled, the attack still costs the server its allowed attempts, which is the number of attacking addresses times
+LOGIN_IP_PER_MINUTE (or the victims times LOGIN_EMAIL_PER_MINUTE, if lower) password hashes a minute, plus about 1.3 ms of CPU for each 429.
+The limits need to keep the allowed hashes well below what the host can check. At the default of 30 a minute, two addresses alone
+use a third of one CPU at a bcrypt cost of 12.
+
+Measured against 3 gunicorn workers with LOGIN_IP_PER_MINUTE=6, 16 attacking connections over 2 addresses and 20 victims, on one CPU shared
+with Postgres, medians of 10 legitimate logins (about 355 ms idle):
+    throttled, 50 attempts/s:    392 ms (p95 888 ms), 97% rejected with 429
+    throttled, 100 attempts/s:   509 ms (p95 1078 ms), 98% rejected with 429
+    throttled, 200 attempts/s:   570 ms (p95 1081 ms), 99% rejected with 429
+    not throttled, 200 attempts/s: 6112 ms (p95 6268 ms), and the server could only check 3 attempts/s
+The p95 is a login that ran alongside one of the attack's allowed attempts, and the remaining rise in the median is the cost of the 429s,
+which is on the same CPU here, but would be spread over the workers' CPUs on a larger host.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import statistics
+import time
+
+# seeded users, taken in turn so the legitimate logins stay within each email's own bucket:
+LEGITIMATE_LOGINS = [
+    {"email": "elizabeth.riley@example.com", "password": "Kipper1977"},
+    {"email": "irene.ryan@example.com", "password": "Turtle76"},
+    {"email": "maurice.bailey@example.com", "password": "Namaste55"},
+    {"email": "regina.taylor@example.com", "password": "Camden123"},
+]
+
+
+def post_login(host, port, credentials, source_ip):
+    """Sends one login from a source address and returns the status code and the seconds taken."""
+    connection = http.client.HTTPConnection(host, port, timeout=60, source_address=(source_ip, 0))
+    started = time.perf_counter()
+    try:
+        connection.request("POST", "/auth/login", json.dumps(credentials), {"Content-Type": "application/json"})
+        status = connection.getresponse().status
+    finally:
+        connection.close()
+    return status, time.perf_counter() - started
+
+
+def legitimate_logins(host, port, count, interval):
+    """Logs the legitimate users in count times, every interval seconds, and returns the latencies of the successful logins."""
+    latencies = []
+    for number in range(count):
+        status, seconds = post_login(host, port, LEGITIMATE_LOGINS[number % len(LEGITIMATE_LOGINS)], "127.0.0.1")
+        if status == 200:
+            latencies.append(seconds)
+        time.sleep(interval)
+    return latencies
+
+
+def victim_email(number):
+    return f"loadtest.victim{number}@example.com"
+
+
+def register_victims(host, port, victims):
+    """Registers the accounts to attack, which already exist after the first run."""
+    for number in range(victims):
+        connection = http.client.HTTPConnection(host, port, timeout=60)
+        credentials = {"email": victim_email(number), "password": "Victim1234"}
+        connection.request("POST", "/auth/register", json.dumps(credentials), {"Content-Type": "application/json"})
+        connection.getresponse().read()
+        connection.close()
+
+
+def attacker(host, port, number, args, stop, statuses):
+    """Sends bad-password logins for the victims at this attacker's share of args.rate until stopped, from one of args.ips source addresses."""
+    attempt = 0
+    source_ip = f"127.0.1.{number % args.ips + 1}"
+    interval = args.attackers / args.rate
+    next_attempt = time.perf_counter()
+    while not stop.is_set():
+        attempt += 1
+        credentials = {"email": victim_email((number + attempt) % args.victims), "password": "Password1"}
+        status, _ = post_login(host, port, credentials, source_ip)
+        statuses.append(status)
+        # the attempts are sent at a fixed rate, however quickly they are answered, as an attacker's would be:
+        next_attempt += interval
+        stop.wait(max(0, next_attempt - time.perf_counter()))
+
+
+def attack(host, port, args, stop, results):
+    """Runs the attackers in a separate process, at a lower priority so that they stand in for machines of their own rather than taking the server's CPU."""
+    os.nice(args.attacker_nice)
+    statuses = []
+    with ThreadPoolExecutor(args.attackers) as pool:
+        for number in range(args.attackers):
+            pool.submit(attacker, host, port, number, args, stop, statuses)
+    results.put(statuses)
+
+
+def summary(latencies):
+    if not latencies:
+        return "no successful logins"
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, round(len(latencies) * 0.95))]
+    return f"{len(latencies)} logins, median {statistics.median(latencies) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("url", nargs="?", default="http://127.0.0.1:8000")
+    parser.add_argument("--rate", type=float, default=200, help="attempts per second sent by the attackers")
+    parser.add_argument("--attackers", type=int, default=16, help="concurrent attacking connections")
+    parser.add_argument("--attacker-nice", type=int, default=19, help="niceness of the attacking process")
+    parser.add_argument("--ips", type=int, default=2, help="source addresses the attackers are spread over")
+    parser.add_argument("--warmup", type=float, default=20, help="seconds of attack before the legitimate logins are timed")
+    parser.add_argument("--victims", type=int, default=20, help="accounts the attackers try passwords for")
+    parser.add_argument("--logins", type=int, default=10, help="legitimate logins in each phase")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between legitimate logins")
+    args = parser.parse_args()
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    register_victims(host, port, args.victims)
+
+    print("idle:  ", summary(legitimate_logins(host, port, args.logins, args.interval)))
+
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    attack_process = multiprocessing.Process(target=attack, args=(host, port, args, stop, results))
+    attack_process.start()
+    started = time.perf_counter()
+    # lets the attack use up the buckets' bursts first, so the logins are timed against its sustained rate:
+    time.sleep(args.warmup)
+    print("attack:", summary(legitimate_logins(host, port, args.logins, args.interval)))
+    stop.set()
+    statuses = results.get()
+    elapsed = time.perf_counter() - started
+    attack_process.join()
+    throttled = statuses.count(429)
+    print(
+        f"attack attempts: {len(statuses)} ({len(statuses) / elapsed:.0f}/s), "
+        f"throttled with 429: {throttled} ({throttled / max(1, len(statuses)):.0%})"
+    )
+
+if __name__ == "__main__":
+    main()
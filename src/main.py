@@ -3,12 +3,16 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_marshmallow import Marshmallow
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
+from werkzeug.middleware.proxy_fix import ProxyFix
 from marshmallow.exceptions import ValidationError
+from sqlalchemy.orm.exc import StaleDataError
+from compression import Compress
 
 db = SQLAlchemy()
 ma = Marshmallow()
 bcrypt = Bcrypt()
 jwt = JWTManager()
+compress = Compress()
 
 
 def create_app():
@@ -18,18 +22,42 @@ def create_app():
 
     app.config.from_object("config.app_config")
 
+    # behind reverse proxies, request.remote_addr is the proxy's address unless it is taken from X-Forwarded-For, such as for login throttling:
+    if app.config["TRUSTED_PROXY_COUNT"]:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["TRUSTED_PROXY_COUNT"])
+
     @app.errorhandler(ValidationError)
     def validation_error(err):
         return {"error": err.messages}, 400
 
+    @app.errorhandler(StaleDataError)
+    def stale_data_error(err):
+        return {"error": "The record was changed by another request, please retrieve it again and retry"}, 412
+
     db.init_app(app)
     ma.init_app(app)
     bcrypt.init_app(app)
     jwt.init_app(app)
+    compress.init_app(app)
+
+    from audit import audit_buffer
+    from tracing import tracer
+    from change_feed import change_feed
+    from status_history import status_history
+    from staff_cache import staff_cache
+    from job_board_cache import job_board_cache
+
+    audit_buffer.init_app(app)
+    tracer.init_app(app, bcrypt=bcrypt)
+    change_feed.init_app(app)
+    status_history.init_app(app)
+    staff_cache.init_app(app)
+    job_board_cache.init_app(app)
 
-    from controllers.commands_controller import db_commands
+    from controllers.commands_controller import db_commands, worker_commands
 
     app.register_blueprint(db_commands)
+    app.register_blueprint(worker_commands)
     from controllers import controllers
 
     for controller in controllers:
@@ -0,0 +1,78 @@
+from main import db, ma
+
+from sqlalchemy import DDL, event
+from datetime import datetime
+
+
+class ApplicationStatusChange(db.Model):
+
+    """Creates the ApplicationStatusChange model in our database, an append-only history of every status an Application has had.
+
+    Database columns:
+        id: A required big integer that is automatically serialised, a unique identifier for each status change.
+        application_id: A required integer, the id of the application.
+        job_id: A required integer, the id of the application's job, so the analytics can be filtered by job without joining Applications.
+        from_status: A string, the status before the change. Left empty for the first status of a new application.
+        to_status: A required string, the status after the change.
+        changed_at: A required datetime field, the time of the change. An application is in to_status from this time until its next change.
+        user_id: An integer, the id of the authenticated user that made the change. Left empty for changes made outside of a request.
+
+    Database relationships: None, so that the history is kept for the analytics after an application is archived or deleted.
+
+    Indexes:
+        application_id and changed_at, to read an application's changes in order, which is how the analytics find the time each status lasted.
+        to_status and changed_at, to find the applications that reached a status (such as Offer) within a date range.
+        changed_at, to limit the time in stage analytics to a date range.
+        A trigger rejects any UPDATE or DELETE, so rows can only be added.
+    """
+
+    __tablename__ = "application_status_history"
+    __table_args__ = (
+        db.Index("ix_application_status_history_application", "application_id", "changed_at"),
+        db.Index("ix_application_status_history_to_status", "to_status", "changed_at"),
+        db.Index("ix_application_status_history_changed_at", "changed_at"),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    application_id = db.Column(db.Integer, nullable=False)
+    job_id = db.Column(db.Integer, nullable=False)
+    from_status = db.Column(db.String())
+    to_status = db.Column(db.String(), nullable=False)
+    changed_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    user_id = db.Column(db.Integer)
+
+
+event.listen(
+    ApplicationStatusChange.__table__,
+    "after_create",
+    DDL(
+        """
+        CREATE OR REPLACE FUNCTION application_status_history_append_only() RETURNS trigger AS $$
+        BEGIN
+            RAISE EXCEPTION 'application_status_history is append-only';
+        END;
+        $$ LANGUAGE plpgsql;
+        CREATE TRIGGER application_status_history_append_only BEFORE UPDATE OR DELETE ON application_status_history
+            FOR EACH ROW EXECUTE FUNCTION application_status_history_append_only();
+        """
+    ),
+)
+
+
+class ApplicationStatusChangeSchema(ma.Schema):
+
+    """Schema for the ApplicationStatusChange model.
+
+    Allows us to serialise into JSON using Marshmallow.
+    Status changes are only created by the status_history module, so this schema is only used to return them to staff users.
+
+    Schema variables:
+        application_status_changes_schema: When multiple ApplicationStatusChange records are accessed.
+
+    """
+
+    class Meta:
+        fields = ("from_status", "to_status", "changed_at", "user_id")
+
+
+application_status_changes_schema = ApplicationStatusChangeSchema(many=True)
@@ -1,4 +1,5 @@
 from main import db, ma
+from partitions import partition_by, partitioned
 
 from marshmallow import fields
 from marshmallow.validate import OneOf, Length, And, Regexp
@@ -19,18 +20,33 @@ class Application(db.Model):
         notice_period: A required string, specifies the user's notice period in their current job.
         salary_expectations: A required integer, indicates the candidate's salary expectations for this job.
         resume: A required string, contains a URL of the candidate's resume. A string was used rather than a binary datatype for simplicity but that could be used if a file upload/storage was available.
+        version: A required integer, incremented each time the application is updated, and sent as its ETag.
 
     Database relationships:
         interviews: A child of Applications, the application.id is a foreign key in the Interviews table.
         candidates: A parent of Applications, the candidate.id is a foreign key in the Interviews table.
         jobs: A parent of Applications, the job.id is a foreign key in the Interviews table.
+
+    Indexes:
+        application_date, status, job_id, candidate_id and location are indexed so that the filters and sorts allowed on the Applications list can use an index.
+
+    Partitioning:
+        If "applications" is in PARTITIONED_TABLES, the table is partitioned by month on application_date, and application_date becomes part of the primary key. Records are still identified by id alone in the ORM.
     """
 
     __tablename__ = "applications"
+    __table_args__ = (
+        db.Index("ix_applications_application_date", "application_date"),
+        db.Index("ix_applications_status_date", "status", "application_date"),
+        db.Index("ix_applications_job_date", "job_id", "application_date"),
+        db.Index("ix_applications_candidate_id", "candidate_id"),
+        db.Index("ix_applications_location", "location"),
+        partition_by("applications", "application_date"),
+    )
 
-    id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     job_id = db.Column(db.Integer, db.ForeignKey("jobs.id"), nullable=False)
-    application_date = db.Column(db.Date, nullable=False)
+    application_date = db.Column(db.Date, nullable=False, primary_key=partitioned("applications"))
     status = db.Column(db.String(), default="To review", nullable=False)
     candidate_id = db.Column(db.Integer, db.ForeignKey("candidates.id"), nullable=False)
     location = db.Column(db.String(50), nullable=False)
@@ -38,6 +54,7 @@ class Application(db.Model):
     notice_period = db.Column(db.String(50), nullable=False)
     salary_expectations = db.Column(db.Integer(), nullable=False)
     resume = db.Column(db.String(), nullable=False)
+    version = db.Column(db.Integer, nullable=False, server_default="1")
 
     interviews = db.relationship(
         "Interview", back_populates="application", cascade="all, delete"
@@ -45,6 +62,8 @@ class Application(db.Model):
     candidate = db.relationship("Candidate", back_populates="applications")
     job = db.relationship("Job", back_populates="applications")
 
+    __mapper_args__ = {"primary_key": [id], "version_id_col": version}
+
 
 """Field validations for the schemas.
 
@@ -358,3 +377,53 @@ class ApplicationScorecardSchema(ma.Schema):
 
 
 application_scorecard_schema = ApplicationScorecardSchema()
+
+
+class ApplicationDashboardSchema(ma.Schema):
+
+    """Additional Schema for the newest applicants on the hiring manager's dashboard.
+
+    Allows us to serialise into JSON using Marshmallow.
+    This version of the schema is used to dump rows from the dashboard's applicants query, which selects the candidate's name alongside the Application fields rather than loading a nested Candidate record.
+
+    Class meta: Only includes the following fields:
+        id
+        application_date
+        status
+        candidate_id
+        candidate_name
+
+    Schema variables:
+        applications_dashboard_schema: When multiple rows are accessed.
+
+    """
+
+    application_date = fields.Date(format="%Y-%m-%d")
+
+    class Meta:
+        fields = ("id", "application_date", "status", "candidate_id", "candidate_name")
+
+
+applications_dashboard_schema = ApplicationDashboardSchema(many=True)
+
+
+class ApplicationBulkStatusSchema(ma.Schema):
+
+    """Schema for changing the status of several Applications at once.
+
+    Allows us to load the body of a bulk status update from JSON using Marshmallow. It is not used to return records.
+
+    Field validations:
+        ids: A required list of up to 1000 Application ids.
+        status: A required field, only accepts input that matches a specified list of values.
+
+    Schema variables:
+        application_bulk_status_schema: When a bulk status update is loaded.
+
+    """
+
+    ids = fields.List(fields.Integer(), required=True, validate=Length(min=1, max=1000))
+    status = fields.String(required=True, validate=OneOf(VALID_STATUSES))
+
+
+application_bulk_status_schema = ApplicationBulkStatusSchema()
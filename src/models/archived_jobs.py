@@ -0,0 +1,53 @@
+from main import db, ma
+
+from datetime import datetime
+
+
+class ArchivedJob(db.Model):
+
+    """Creates the ArchivedJob model in our database, an index of the jobs that have been moved to cold storage by the archive module.
+
+    Database columns:
+        job_id: A required integer, the id the job had in the Jobs table. Ids are never reused, so it also identifies the archived job.
+        title: A required string, the title of the job.
+        department: A required string, the department of the job.
+        closed_at: A required datetime field, the time the job was closed.
+        archived_at: A required datetime field, the time the job was archived.
+        application_count: A required integer, the number of applications archived with the job.
+        path: A required string, the archive file holding the job, its applications, interviews and scorecards, relative to ARCHIVE_DIR.
+
+    Database relationships: None, as the archived job no longer exists in the Jobs table.
+
+    Indexes:
+        archived_at, for listing the most recently archived jobs.
+    """
+
+    __tablename__ = "archived_jobs"
+    __table_args__ = (db.Index("ix_archived_jobs_archived_at", "archived_at"),)
+
+    job_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(100), nullable=False)
+    department = db.Column(db.String(50), nullable=False)
+    closed_at = db.Column(db.DateTime, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    application_count = db.Column(db.Integer, nullable=False)
+    path = db.Column(db.String(), nullable=False)
+
+
+class ArchivedJobSchema(ma.Schema):
+
+    """Schema for the ArchivedJob model.
+
+    Allows us to serialise into JSON using Marshmallow.
+    Archived jobs are only created by the archive module, so this schema is only used to return them to admin users.
+
+    Schema variables:
+        archived_jobs_schema: When multiple ArchivedJob records are accessed.
+
+    """
+
+    class Meta:
+        fields = ("job_id", "title", "department", "closed_at", "archived_at", "application_count")
+
+
+archived_jobs_schema = ArchivedJobSchema(many=True)
@@ -0,0 +1,76 @@
+from main import db, ma
+
+from sqlalchemy import DDL, event
+from datetime import datetime
+
+
+class AuditLog(db.Model):
+
+    """Creates the AuditLog model in our database, an append-only record of changes to Applications, Interviews and Scorecards.
+
+    Database columns:
+        id: A required big integer that is automatically serialised, a unique identifier for each change.
+        changed_at: A required datetime field, the time the change was flushed to the database. Part of the primary key, as the table is partitioned on it.
+        user_id: An integer, the id of the authenticated user that made the change. Left empty for changes made outside of a request, such as by a CLI command or background task.
+        table_name: A required string, the table of the changed record.
+        record_id: A required integer, the id of the changed record.
+        action: A required string, one of "insert", "update" or "delete".
+        changes: A required JSON field, the changed fields as a dict of field names to [before, after] pairs.
+
+    Database relationships: None, so that the audit trail is kept if a record or user is deleted.
+
+    Partitioning:
+        The table is partitioned by range on changed_at, with one partition per month created by the partitions module, so old months can be detached and archived without a bulk delete.
+        A trigger rejects any UPDATE or DELETE, so rows can only be added.
+    """
+
+    __tablename__ = "audit_log"
+    __table_args__ = (
+        db.Index("ix_audit_log_record", "table_name", "record_id", "changed_at"),
+        db.Index("ix_audit_log_user", "user_id", "changed_at"),
+        {"postgresql_partition_by": "RANGE (changed_at)"},
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    changed_at = db.Column(db.DateTime, primary_key=True, default=datetime.now)
+    user_id = db.Column(db.Integer)
+    table_name = db.Column(db.String(50), nullable=False)
+    record_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)
+    changes = db.Column(db.JSON, nullable=False)
+
+
+event.listen(
+    AuditLog.__table__,
+    "after_create",
+    DDL(
+        """
+        CREATE OR REPLACE FUNCTION audit_log_append_only() RETURNS trigger AS $$
+        BEGIN
+            RAISE EXCEPTION 'audit_log is append-only';
+        END;
+        $$ LANGUAGE plpgsql;
+        CREATE TRIGGER audit_log_append_only BEFORE UPDATE OR DELETE ON audit_log
+            FOR EACH ROW EXECUTE FUNCTION audit_log_append_only();
+        """
+    ),
+)
+
+
+class AuditLogSchema(ma.Schema):
+
+    """Schema for the AuditLog model.
+
+    Allows us to serialise into JSON using Marshmallow.
+    Audit records are only created by the audit module, so this schema is only used to return them to admin users.
+
+    Schema variables:
+        audit_logs_schema: When multiple AuditLog records are accessed.
+
+    """
+
+    class Meta:
+        fields = ("id", "changed_at", "user_id", "table_name", "record_id", "action", "changes")
+
+
+audit_logs_schema = AuditLogSchema(many=True)
@@ -0,0 +1,25 @@
+from main import db
+
+
+class CachedResponse(db.Model):
+
+    """Creates the CachedResponse model in our database, response bodies shared between workers by the job board cache when SINGLE_FLIGHT_ADVISORY_LOCK is turned on.
+
+    Database columns:
+        key: A required text field, the cache key of the response, such as the schema and fields of a GET /jobs/ request.
+        body: A required text field, the JSON body of the response.
+        expires_at: A required datetime field, the time after which the response is built again. Older rows are replaced rather than purged.
+
+    Database relationships: None.
+
+    Indexes:
+        key is the primary key, so a cached response is found with one index lookup.
+        The table is UNLOGGED, as it can be rebuilt at any time and doesn't need to survive a crash, which makes its writes cheaper.
+    """
+
+    __tablename__ = "cached_responses"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    key = db.Column(db.Text, primary_key=True)
+    body = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,84 @@
+from main import db, ma
+
+from marshmallow import fields
+from datetime import datetime
+
+
+class CandidateDuplicate(db.Model):
+
+    """Creates the CandidateDuplicate model in our database, the merge suggestions found by the dedupe module.
+
+    Database columns:
+        id: A required integer that is automatically serialised, a unique identifier for each suggestion.
+        candidate_id: A required integer, a foreign key that links to the Candidates table for the older of the two records, which is kept by default when they are merged.
+        duplicate_id: A required integer, a foreign key that links to the Candidates table for the newer of the two records.
+        score: A required float between 0 and 1, how similar the two names are.
+        reason: A required string, "phone" if the two records share a phone number, otherwise "name".
+        status: A required string, "Pending" or "Dismissed". Merged suggestions are deleted with the merged candidate.
+        created_at: A required datetime field, the time the suggestion was found.
+        reviewed_at: A datetime field, the time an admin dismissed the suggestion.
+        reviewed_by: An integer, the user id of the admin that dismissed the suggestion.
+
+    Database relationships:
+        candidate: A parent of CandidateDuplicates, the candidate.id is the candidate_id foreign key.
+        duplicate: A parent of CandidateDuplicates, the candidate.id is the duplicate_id foreign key.
+
+    Indexes:
+        candidate_id and duplicate_id are unique together, so a pair is only suggested once, and a dismissed pair is not suggested again.
+        status and score, for listing the pending suggestions with the most likely duplicates first.
+        duplicate_id, for removing the suggestions of a merged candidate.
+    """
+
+    __tablename__ = "candidate_duplicates"
+    __table_args__ = (
+        db.UniqueConstraint("candidate_id", "duplicate_id", name="uq_candidate_duplicates_pair"),
+        db.Index("ix_candidate_duplicates_status_score", "status", "score"),
+        db.Index("ix_candidate_duplicates_duplicate_id", "duplicate_id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    candidate_id = db.Column(db.Integer, db.ForeignKey("candidates.id"), nullable=False)
+    duplicate_id = db.Column(db.Integer, db.ForeignKey("candidates.id"), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    reason = db.Column(db.String(10), nullable=False)
+    status = db.Column(db.String(10), default="Pending", nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    reviewed_at = db.Column(db.DateTime)
+    reviewed_by = db.Column(db.Integer)
+
+    candidate = db.relationship("Candidate", foreign_keys=[candidate_id])
+    duplicate = db.relationship("Candidate", foreign_keys=[duplicate_id])
+
+
+class CandidateDuplicateSchema(ma.Schema):
+
+    """Schema for the CandidateDuplicate model.
+
+    Allows us to serialise into JSON using Marshmallow.
+    Suggestions are only created by the dedupe module, so this schema is only used to return them to admin users, with both candidate records nested.
+
+    Schema variables:
+        candidate_duplicates_schema: When multiple CandidateDuplicate records are accessed.
+
+    """
+
+    candidate = fields.Nested("CandidateSchema")
+    duplicate = fields.Nested("CandidateSchema")
+
+    class Meta:
+        fields = (
+            "id",
+            "candidate",
+            "duplicate",
+            "score",
+            "reason",
+            "status",
+            "created_at",
+            "reviewed_at",
+            "reviewed_by",
+        )
+        ordered = True
+
+
+candidate_duplicate_schema = CandidateDuplicateSchema()
+candidate_duplicates_schema = CandidateDuplicateSchema(many=True)
@@ -0,0 +1,36 @@
+from main import db
+
+from datetime import datetime
+
+
+class Change(db.Model):
+
+    """Creates the Change model in our database, the change feed of inserts, updates and deletes to Jobs, Applications and Interviews.
+
+    Database columns:
+        seq: A required big integer, the position of the change in the feed. Changes are numbered while holding a lock until their transaction commits,
+            so a change with a lower seq is always visible before one with a higher seq, and a client that has read up to a seq can't miss an earlier change.
+        table_name: A required string, the table of the changed record.
+        record_id: A required integer, the id of the changed record.
+        action: A required string, one of "insert", "update" or "delete".
+        candidate_id: An integer, the candidate the record belonged to when it changed, for Applications and Interviews. Used to show candidates only their own changes.
+        interviewer_id: An integer, the interviewer of an Interview when it changed. Used to show non-admin staff only the changes to their own interviews.
+        changed_at: A required datetime field, the time the change was committed. Changes older than CHANGE_FEED_RETENTION_DAYS are deleted by the `flask db purge-changes` command.
+
+    Database relationships: None, so that deletes stay in the feed after the record has gone.
+
+    Indexes:
+        seq is the primary key, so reading the changes after a cursor is a range scan.
+        changed_at, for purging old changes.
+    """
+
+    __tablename__ = "changes"
+    __table_args__ = (db.Index("ix_changes_changed_at", "changed_at"),)
+
+    seq = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    record_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)
+    candidate_id = db.Column(db.Integer)
+    interviewer_id = db.Column(db.Integer)
+    changed_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
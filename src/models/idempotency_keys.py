@@ -0,0 +1,39 @@
+from main import db
+
+from datetime import datetime
+
+
+class IdempotencyKey(db.Model):
+
+    """Creates the IdempotencyKey model in our database, the stored responses of create requests sent with an Idempotency-Key header.
+
+    Database columns:
+        user_id: A required integer, the user that sent the request. Keys are scoped to each user, so two clients can't collide on the same key.
+        key: A required string, the Idempotency-Key header of the request.
+        fingerprint: A required string, a SHA-256 hash of the request method, path and body, used to reject a key that is reused for a different request.
+        status_code: An integer, the status code of the stored response.
+        body: A text field, the body of the stored response.
+        mimetype: A string, the mimetype of the stored response.
+        headers: A JSON field, the stored response's headers that are replayed with it, such as its ETag.
+        created_at: A required datetime field, the time the request was first handled.
+        expires_at: A required datetime field, the time after which the key can be used again. Expired keys are deleted by the `flask db purge-idempotency-keys` command.
+
+    Database relationships: None.
+
+    Indexes:
+        user_id and key are the primary key, so a stored response is found with one index lookup.
+        expires_at, for purging expired keys.
+    """
+
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (db.Index("ix_idempotency_keys_expires_at", "expires_at"),)
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer)
+    body = db.Column(db.Text)
+    mimetype = db.Column(db.String(100))
+    headers = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
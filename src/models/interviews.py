@@ -1,7 +1,10 @@
 from main import db, ma
+from staff_cache import StaffReference, StaffReferenceSchema
+from partitions import partition_by, partitioned, skip_partitioned_foreign_keys
 
-from marshmallow import fields
-from marshmallow.validate import OneOf
+from marshmallow import fields, validates_schema, ValidationError
+from marshmallow.validate import OneOf, Length, Range
+from datetime import time
 
 
 class Interview(db.Model):
@@ -16,25 +19,41 @@ class Interview(db.Model):
         interview_datetime: A required datetime field, this is the date and time that this interview will be occurring.
         length_mins: A required integer field, this is the expected length of the interview in minutes.
         format: A required string, this is the format/method of the interview.
+        version: A required integer, incremented each time the interview is updated, and sent as its ETag.
 
     Database relationships:
         scorecards: A child of Interviews, the interview.id is a foreign key in the Scorecards table.
         candidates: A parent of Interviews, the candidate.id is a foreign key in the Interviews table.
         staff: A parent of Interviews, the staff.id is a foreign key in the Interviews table.
         applications: A parent of Interviews, the application.id is a foreign key in the Interviews table.
+
+    Indexes:
+        interviewer_id and candidate_id are each indexed together with interview_datetime, so that an interviewer's or candidate's bookings within a date range can be found without scanning the whole table.
+        application_id and interview_datetime are also indexed on their own, for filtering by job and sorting the Interviews list.
+
+    Partitioning:
+        If "interviews" is in PARTITIONED_TABLES, the table is partitioned by month on interview_datetime, and interview_datetime becomes part of the primary key. Records are still identified by id alone in the ORM.
     """
 
     __tablename__ = "interviews"
+    __table_args__ = (
+        db.Index("ix_interviews_interviewer_datetime", "interviewer_id", "interview_datetime"),
+        db.Index("ix_interviews_candidate_datetime", "candidate_id", "interview_datetime"),
+        db.Index("ix_interviews_application_id", "application_id"),
+        db.Index("ix_interviews_datetime", "interview_datetime"),
+        partition_by("interviews", "interview_datetime"),
+    )
 
-    id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     application_id = db.Column(
         db.Integer, db.ForeignKey("applications.id"), nullable=False
     )
     candidate_id = db.Column(db.Integer, db.ForeignKey("candidates.id"), nullable=False)
     interviewer_id = db.Column(db.Integer, db.ForeignKey("staff.id"), nullable=False)
-    interview_datetime = db.Column(db.DateTime, nullable=False)
+    interview_datetime = db.Column(db.DateTime, nullable=False, primary_key=partitioned("interviews"))
     length_mins = db.Column(db.Integer, nullable=False)
     format = db.Column(db.String(), nullable=False)
+    version = db.Column(db.Integer, nullable=False, server_default="1")
 
     scorecards = db.relationship(
         "Scorecard", back_populates="interview", cascade="all, delete"
@@ -43,6 +62,11 @@ class Interview(db.Model):
     candidate = db.relationship("Candidate", back_populates="interviews")
     interviewer = db.relationship("Staff", back_populates="interviews")
 
+    __mapper_args__ = {"primary_key": [id], "version_id_col": version}
+
+
+skip_partitioned_foreign_keys(Interview.__table__)
+
 
 """Field validations for the schemas.
 
@@ -108,7 +132,7 @@ interview_schema = InterviewSchema()
 interviews_schema = InterviewSchema(many=True)
 
 
-class InterviewStaffViewSchema(ma.Schema):
+class InterviewStaffViewSchema(StaffReferenceSchema):
 
     """Additional Schema for the Interviews model for Staff users.
 
@@ -116,7 +140,7 @@ class InterviewStaffViewSchema(ma.Schema):
     This version of the schema is used when returning data from the Interviews model to authenticated Staff users.
 
     Nested schemas:
-        interviewer is a nested schema from the StaffSchema, which displays the name and title fields of the Staff record linked via the interviewer_id foreign key field.
+        interviewer is a StaffReference field, which displays the name and title fields of the Staff record linked via the interviewer_id foreign key field, from the staff cache rather than a join.
         application is a nested schema from the ApplicationInterviewSchema, which displays key information about the candidate and their application, linked via the application_id foreign key field.
 
     Field validations: Same as InterviewSchema.
@@ -124,7 +148,7 @@ class InterviewStaffViewSchema(ma.Schema):
     Class meta: Includes the following fields:
         id
         application (nested schema)
-        interviewer (nested schema)
+        interviewer (from the staff cache)
         interview_datetime
         length_mins
         format
@@ -135,7 +159,7 @@ class InterviewStaffViewSchema(ma.Schema):
 
     """
 
-    interviewer = fields.Nested("StaffSchema", only=["name", "title"])
+    interviewer = StaffReference("interviewer_id")
     application = fields.Nested("ApplicationInterviewSchema")
 
     format = validate_format
@@ -159,7 +183,7 @@ interview_staff_view_schema = InterviewStaffViewSchema()
 interviews_staff_view_schema = InterviewStaffViewSchema(many=True)
 
 
-class InterviewViewSchema(ma.Schema):
+class InterviewViewSchema(StaffReferenceSchema):
 
     """Additional Schema for the Interviews model for other authenticated users.
 
@@ -167,13 +191,13 @@ class InterviewViewSchema(ma.Schema):
     This version of the schema is used when returning data from the Applications model to authenticated non-Staff users.
 
     Nested schemas:
-        interviewer is a nested schema from the StaffSchema, which displays the name and title fields of the Staff record linked via the interviewer_id foreign key field.
+        interviewer is a StaffReference field, which displays the name and title fields of the Staff record linked via the interviewer_id foreign key field, from the staff cache rather than a join.
 
     Field validations: Same as InterviewSchema.
 
     Class meta: Includes the following fields:
         id
-        interviewer (nested schema)
+        interviewer (from the staff cache)
         interview_datetime
         length_mins
         format
@@ -184,7 +208,7 @@ class InterviewViewSchema(ma.Schema):
 
     """
 
-    interviewer = fields.Nested("StaffSchema", only=["name", "title"])
+    interviewer = StaffReference("interviewer_id")
 
     format = validate_format
     application_id = fields.Integer(required=True)
@@ -206,7 +230,7 @@ interview_view_schema = InterviewViewSchema()
 interviews_view_schema = InterviewViewSchema(many=True)
 
 
-class InterviewScorecardSchema(ma.Schema):
+class InterviewScorecardSchema(StaffReferenceSchema):
 
     """Additional Schema for the Interviews model for nesting into Scorecard schemas for Staff users.
 
@@ -215,13 +239,13 @@ class InterviewScorecardSchema(ma.Schema):
 
     Nested schemas:
         candidate is a nested schema from the CandidateSchema, which displays the name field the Candidate record linked via the candidate_id foreign key field.
-        interviewer is a nested schema from the StaffSchema, which displays the name and title fields of the Staff record linked via the interviewer_id foreign key field.
+        interviewer is a StaffReference field, which displays the name and title fields of the Staff record linked via the interviewer_id foreign key field, from the staff cache rather than a join.
 
     Field validations: Same as ApplicationSchema.
 
     Class meta: Only includes the following fields:
         candidate (nested schema)
-        interviewer (nested schema)
+        interviewer (from the staff cache)
 
     Schema variables:
         interview_scorecard_schema: When a single Interview record is accessed.
@@ -229,10 +253,107 @@ class InterviewScorecardSchema(ma.Schema):
     """
 
     candidate = fields.Nested("CandidateSchema", only=["name"])
-    interviewer = fields.Nested("StaffSchema", only=["name", "title"])
+    interviewer = StaffReference("interviewer_id")
 
     class Meta:
         fields = ("candidate", "interviewer")
 
 
 interview_scorecard_schema = InterviewScorecardSchema()
+
+
+class InterviewSlotSchema(ma.Schema):
+
+    """Schema for finding free interview slots across interviewer calendars.
+
+    Only used to load and validate the request body for the interview slot finder, this schema is not linked to a model.
+
+    Field validations:
+        interviewer_ids: A required list of between 1 and 20 interviewer ids, integer format.
+        application_id: An optional integer, when provided the candidate's existing interviews are also treated as busy time.
+        length_mins: A required field, integer format, between 5 and 480 minutes.
+        start_date: A required field, uses the ISO date format of YYYY-MM-DD.
+        end_date: A required field, uses the ISO date format of YYYY-MM-DD. Must be on or after start_date, and within 180 days of it.
+        day_start: The start of working hours in HH:MM format, defaults to 09:00.
+        day_end: The end of working hours in HH:MM format, defaults to 17:00. Must be after day_start.
+        include_weekends: A boolean, defaults to False.
+        limit: The maximum number of slots to return, between 1 and 50, defaults to 5.
+
+    Schema variables:
+        interview_slot_schema: When a slot search is requested.
+
+    """
+
+    interviewer_ids = fields.List(
+        fields.Integer(),
+        required=True,
+        validate=Length(
+            min=1, max=20, error="Between 1 and 20 interviewer ids must be provided"
+        ),
+    )
+    application_id = fields.Integer()
+    length_mins = fields.Integer(
+        required=True,
+        validate=Range(min=5, max=480, error="Length must be between 5 and 480 minutes"),
+    )
+    start_date = fields.Date(required=True, format="%Y-%m-%d")
+    end_date = fields.Date(required=True, format="%Y-%m-%d")
+    day_start = fields.Time(format="%H:%M", load_default=time(9, 0))
+    day_end = fields.Time(format="%H:%M", load_default=time(17, 0))
+    include_weekends = fields.Boolean(load_default=False)
+    limit = fields.Integer(
+        load_default=5,
+        validate=Range(min=1, max=50, error="Limit must be between 1 and 50"),
+    )
+
+    @validates_schema
+    def validate_window(self, data, **kwargs):
+        if data["end_date"] < data["start_date"]:
+            raise ValidationError("end_date must be on or after start_date", "end_date")
+        if (data["end_date"] - data["start_date"]).days > 180:
+            raise ValidationError(
+                "The date window can be a maximum of 180 days", "end_date"
+            )
+        if data["day_end"] <= data["day_start"]:
+            raise ValidationError("day_end must be after day_start", "day_end")
+
+
+interview_slot_schema = InterviewSlotSchema()
+
+
+class InterviewDashboardSchema(ma.Schema):
+
+    """Additional Schema for the upcoming interviews on the hiring manager's dashboard.
+
+    Allows us to serialise into JSON using Marshmallow.
+    This version of the schema is used to dump rows from the dashboard's interviews query, which selects the candidate's name and job title alongside the Interview fields rather than loading nested records.
+
+    Class meta: Only includes the following fields:
+        id
+        application_id
+        interview_datetime
+        length_mins
+        format
+        candidate_name
+        job_title
+
+    Schema variables:
+        interviews_dashboard_schema: When multiple rows are accessed.
+
+    """
+
+    interview_datetime = fields.DateTime(format="%Y-%m-%d %H:%M%p")
+
+    class Meta:
+        fields = (
+            "id",
+            "application_id",
+            "interview_datetime",
+            "length_mins",
+            "format",
+            "candidate_name",
+            "job_title",
+        )
+
+
+interviews_dashboard_schema = InterviewDashboardSchema(many=True)
@@ -1,4 +1,5 @@
 from main import db, ma
+from staff_cache import StaffReference, StaffReferenceSchema
 
 from marshmallow import fields
 from marshmallow.validate import Length, And, Regexp, OneOf
@@ -14,15 +15,25 @@ class Job(db.Model):
         description: A required text field, a description of the job responsibilities and requirements.
         location: A required string, the location of where this job is based.
         status: A required string, specifies if the job listing is currently open or has been closed.
+        closed_at: A datetime field, the time the job was last closed. Cleared if the job is reopened, and used to archive jobs that have been closed for longer than ARCHIVE_AFTER_DAYS.
         salary_budget: A required integer, the budget for the role's salary.
         hiring_manager_id: A required integer, a foreign key that links to the Staff table for the hiring manager.
+        version: A required integer, incremented each time the job is updated. Sent as the job's ETag, so that an update based on an out of date copy is rejected.
 
     Database relationships:
         applications: A child of Jobs, the job.id is a foreign key in the Applications table.
         staff: A parent of Jobs, the staff.id is a foreign key in the Jobs table.
+
+    Indexes:
+        hiring_manager_id, for the hiring manager's dashboard.
+        A partial index on closed_at for closed jobs only, for finding the jobs that are due to be archived.
     """
 
     __tablename__ = "jobs"
+    __table_args__ = (
+        db.Index("ix_jobs_hiring_manager_id", "hiring_manager_id"),
+        db.Index("ix_jobs_closed_at", "closed_at", postgresql_where=db.text("status = 'Closed'")),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
@@ -30,14 +41,18 @@ class Job(db.Model):
     department = db.Column(db.String(50), nullable=False)
     location = db.Column(db.String(50), nullable=False)
     status = db.Column(db.String(), default="Open", nullable=False)
+    closed_at = db.Column(db.DateTime)
     salary_budget = db.Column(db.Integer(), nullable=False)
     hiring_manager_id = db.Column(db.Integer, db.ForeignKey("staff.id"), nullable=False)
+    version = db.Column(db.Integer, nullable=False, server_default="1")
 
     hiring_manager = db.relationship("Staff", back_populates="jobs")
     applications = db.relationship(
         "Application", back_populates="job", cascade="all, delete"
     )
 
+    __mapper_args__ = {"version_id_col": version}
+
 
 """Field validations for the schemas.
 
@@ -133,19 +148,19 @@ job_schema = JobSchema()
 jobs_schema = JobSchema(many=True)
 
 
-class JobAdminSchema(ma.Schema):
+class JobAdminSchema(StaffReferenceSchema):
 
     """Additional Schema for the Jobs model for Admin users.
 
     Allows us to serialise into JSON using Marshmallow.
     This version of the schema is used when returning data from the Jobs model to authenticated Admin users.
 
-    Nested schemas:
-        hiring_manager is a nested schema from the StaffSchema, which displays the name and title fields of the Staff record linked via the hiring_manager_id foreign key field.
+    Nested fields:
+        hiring_manager is a StaffReference field, which displays the name and title fields of the Staff record linked via the hiring_manager_id foreign key field, from the staff cache rather than a join.
 
     Field validations: Same as Job_Schema.
 
-    Class meta: Includes all fields from the model except hiring_manager_id, as a nested schema is used instead.
+    Class meta: Includes all fields from the model except hiring_manager_id, as hiring_manager is shown instead.
 
     Schema variables:
         job_admin_schema: When a single Job record is accessed.
@@ -153,7 +168,7 @@ class JobAdminSchema(ma.Schema):
 
     """
 
-    hiring_manager = fields.Nested("StaffSchema", only=["name", "title"])
+    hiring_manager = StaffReference("hiring_manager_id")
 
     title = validate_title
     department = validate_department
@@ -181,19 +196,19 @@ job_admin_schema = JobAdminSchema()
 jobs_admin_schema = JobAdminSchema(many=True)
 
 
-class JobStaffSchema(ma.Schema):
+class JobStaffSchema(StaffReferenceSchema):
 
     """Additional Schema for the Jobs model for non-Admin Staff users.
 
     Allows us to serialise into JSON using Marshmallow.
     This version of the schema is used when returning data from the Jobs model to authenticated Staff users who do not have Admin access.
 
-    Nested schemas: hiring_manager is a nested schema from the StaffSchema, which displays the name and title fields of the Staff record linked via the hiring_manager_id foreign key field.
+    Nested fields: hiring_manager is a StaffReference field, which displays the name and title fields of the Staff record linked via the hiring_manager_id foreign key field, from the staff cache rather than a join.
 
     Field validations: Same as Job_Schema.
 
     Class meta: Includes all fields from the model except:
-    - hiring_manager_id, as a nested schema is used instead
+    - hiring_manager_id, as hiring_manager is shown instead
     - salary_budget
 
     Schema variables:
@@ -202,7 +217,7 @@ class JobStaffSchema(ma.Schema):
 
     """
 
-    hiring_manager = fields.Nested("StaffSchema", only=["name", "title"])
+    hiring_manager = StaffReference("hiring_manager_id")
 
     title = validate_title
     department = validate_department
@@ -0,0 +1,28 @@
+from main import db
+
+
+class RevokedToken(db.Model):
+
+    """Creates the RevokedToken model in our database, the denylist for JWTs that can no longer be used.
+
+    Database columns:
+        id: A required integer that is automatically serialised, a unique identifier for each revocation. Workers use it to load only the revocations added since their last refresh.
+        jti: A string, the unique identifier of a single revoked token. Left empty when every session for the user has been revoked.
+        user_id: A required integer, the id of the user whose token or tokens were revoked.
+        revoked_at: A required datetime field, the time of the revocation. When jti is empty, every token issued to the user up to this time is revoked.
+        expires_at: A required datetime field, the time after which the revoked token(s) would have expired anyway, so the record can be purged.
+
+    Database relationships: None, so that revocations are kept if a user record is deleted.
+    """
+
+    __tablename__ = "revoked_tokens"
+    __table_args__ = (
+        db.Index("ix_revoked_tokens_jti", "jti", unique=True),
+        db.Index("ix_revoked_tokens_user_id", "user_id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36))
+    user_id = db.Column(db.Integer, nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
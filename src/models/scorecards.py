@@ -1,4 +1,5 @@
 from main import db, ma
+from partitions import skip_partitioned_foreign_keys
 
 from marshmallow import fields
 from marshmallow.validate import OneOf
@@ -14,6 +15,7 @@ class Scorecard(db.Model):
         scorecard_datetime: A required datetime field, uses the DateTime module to record the date and time the scorecard record is created.
         notes: A required text field, for the interviewer to document their notes and thoughts on how the interview went.
         rating: A required string field, for the interviewer to rate the candidates's interview.
+        version: A required integer, incremented each time the scorecard is updated, and sent as its ETag.
 
     Database relationships:
         interviews: A parent of Scorecards, the interview.id is a foreign key in the Scorecards table.
@@ -28,9 +30,15 @@ class Scorecard(db.Model):
     scorecard_datetime = db.Column(db.DateTime, nullable=False)
     notes = db.Column(db.Text, nullable=False)
     rating = db.Column(db.String, nullable=False)
+    version = db.Column(db.Integer, nullable=False, server_default="1")
 
     interview = db.relationship("Interview", back_populates="scorecards")
 
+    __mapper_args__ = {"version_id_col": version}
+
+
+skip_partitioned_foreign_keys(Scorecard.__table__)
+
 
 VALID_RATING = ("Strong Yes", "Yes", "No Decision", "No", "Strong No")
 
@@ -0,0 +1,46 @@
+from main import db
+
+from datetime import datetime
+
+
+class Task(db.Model):
+
+    """Creates the Task model in our database, which is used as a queue for background work.
+
+    Database columns:
+        id: A required integer that is automatically serialised, a unique identifier for each task.
+        name: A required string, the name of the registered handler that will run this task.
+        payload: A JSON field, the keyword arguments that are passed to the handler.
+        status: A required string, one of "queued", "running", "done" or "dead". Tasks that have used up all of their attempts are marked as "dead" rather than deleted, so that they can be inspected.
+        attempts: A required integer, the number of times a worker has started this task.
+        max_attempts: A required integer, the number of attempts before a task is marked as "dead".
+        run_at: A required datetime field, the earliest time the task can be picked up by a worker. This is pushed back after each failed attempt.
+        locked_at: A datetime field, the time a worker claimed the task. Used to requeue tasks from a worker that stopped mid-task.
+        last_error: A text field, the error raised by the most recent failed attempt.
+        created_at: A required datetime field, the time the task was enqueued.
+
+    Database relationships: None.
+
+    Indexes:
+        A partial index on run_at for queued and running tasks only, so that workers can find the next task without scanning completed ones.
+    """
+
+    __tablename__ = "tasks"
+    __table_args__ = (
+        db.Index(
+            "ix_tasks_ready",
+            "run_at",
+            postgresql_where=db.text("status IN ('queued', 'running')"),
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), default="queued", nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=5, nullable=False)
+    run_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
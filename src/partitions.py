@@ -0,0 +1,195 @@
+"""Monthly range partitions for partitioned tables.
+
+Tables declared with postgresql_partition_by="RANGE (<column>)" are created by db.create_all() without any partitions, and this module adds them:
+one partition per calendar month, named <table>_YYYY_MM, plus a DEFAULT partition that catches rows outside the monthly partitions so that an insert never fails.
+
+The audit_log table is always partitioned. The applications and interviews tables are only partitioned if they are listed in PARTITIONED_TABLES, which is read when the models are imported.
+Postgres requires the partition column to be part of a partitioned table's primary key, and doesn't allow foreign keys that reference a partitioned table without it,
+so for those tables the ORM still identifies records by id alone, and foreign keys that reference them are enforced by the ORM rather than the database.
+"""
+
+from main import db
+from config import app_config
+
+from flask import current_app
+from datetime import date
+import re
+
+
+def partitioned(table_name):
+    """Checks if an optionally partitioned table is listed in PARTITIONED_TABLES."""
+    return table_name in app_config.PARTITIONED_TABLES
+
+
+def partition_by(table_name, column):
+    """Returns the table options to partition a table by month on a column, or no options if the table isn't in PARTITIONED_TABLES."""
+    if partitioned(table_name):
+        return {"postgresql_partition_by": f"RANGE ({column})"}
+    return {}
+
+
+def skip_partitioned_foreign_keys(table):
+    """Leaves the foreign keys that reference a partitioned table out of the table's DDL, while keeping them for the ORM's joins and relationships."""
+    for foreign_key in table.foreign_keys:
+        if partitioned(foreign_key.target_fullname.split(".")[0]):
+            foreign_key.constraint.ddl_if(callable_=lambda *args, **kwargs: False)
+
+
+def add_months(day, months):
+    """Returns the first day of the month that is the given number of months after day's month."""
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partitioned_tables():
+    """Returns a dict of the partitioned tables in the models to the column each is partitioned on."""
+    tables = {}
+    for table in db.metadata.sorted_tables:
+        partition_by = table.dialect_options["postgresql"].get("partition_by")
+        if partition_by:
+            tables[table.name] = re.fullmatch(r"RANGE \((\w+)\)", partition_by).group(1)
+    return tables
+
+
+def partition_name(table_name, month):
+    return f"{table_name}_{month:%Y_%m}"
+
+
+def create_partitions(table_name, start, months):
+    """Creates the monthly partitions of a table from the start month, skipping any that already exist.
+
+    Args:
+        table_name: The name of a partitioned table.
+        start: A date in the first month to create a partition for.
+        months: The number of monthly partitions to create.
+    """
+    for i in range(months):
+        lower = add_months(start, i)
+        upper = add_months(start, i + 1)
+        db.session.execute(
+            db.text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(table_name, lower)} PARTITION OF {table_name} "
+                f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+            )
+        )
+    db.session.execute(db.text(f"CREATE TABLE IF NOT EXISTS {table_name}_default PARTITION OF {table_name} DEFAULT"))
+
+
+def create_all_partitions():
+    """Creates the partitions for every partitioned table, from the current month to PARTITION_MONTHS_AHEAD months ahead, and commits them."""
+    for table_name in partitioned_tables():
+        create_partitions(table_name, date.today(), current_app.config["PARTITION_MONTHS_AHEAD"] + 1)
+    db.session.commit()
+
+
+def existing_partitions(table_name):
+    """Returns a dict of the first day of each month to the name of the table's monthly partition for it."""
+    query = db.text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :table_name"
+    )
+    partitions = {}
+    for name in db.session.scalars(query, {"table_name": table_name}):
+        match = re.fullmatch(rf"{table_name}_(\d{{4}})_(\d{{2}})", name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def split_default_partition(table_name, column):
+    """Moves the rows in a table's DEFAULT partition into new monthly partitions.
+
+    Postgres won't create a partition for a month while the DEFAULT partition holds rows for it, so each month's rows are moved into a new table first, which is then attached as the month's partition.
+    Used to partition existing data, and to recover if partitions weren't created ahead of time.
+    Rows for a month whose partition has been detached, such as rows inserted late or backdated, are moved into the detached table rather than a new partition, as the month's name is already taken.
+
+    Returns:
+        The names of the partitions created.
+    """
+    default = f"{table_name}_default"
+    months = db.session.scalars(
+        db.text(f"SELECT DISTINCT date_trunc('month', {column})::date FROM {default} ORDER BY 1")
+    ).all()
+    if not months:
+        return []
+    # rows are moved with a DELETE, which triggers such as the audit log's append-only check would reject:
+    db.session.execute(db.text(f"ALTER TABLE {default} DISABLE TRIGGER USER"))
+    created = []
+    for month in months:
+        name = partition_name(table_name, month)
+        lower, upper = month, add_months(month, 1)
+        detached = db.session.scalar(
+            db.text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}
+        )
+        if not detached:
+            # defaults are left out, as inserts through the table use the table's defaults:
+            db.session.execute(db.text(f"CREATE TABLE {name} (LIKE {table_name} INCLUDING CONSTRAINTS)"))
+        db.session.execute(
+            db.text(
+                f"WITH moved AS (DELETE FROM {default} WHERE {column} >= '{lower}' AND {column} < '{upper}' RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved"
+            )
+        )
+        if detached:
+            current_app.logger.warning(f"Moved rows from {default} into the detached partition {name}")
+            continue
+        db.session.execute(
+            db.text(f"ALTER TABLE {table_name} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')")
+        )
+        created.append(name)
+    db.session.execute(db.text(f"ALTER TABLE {default} ENABLE TRIGGER USER"))
+    return created
+
+
+def detach_partitions(table_name, before):
+    """Detaches the monthly partitions of a table for months before the given date.
+
+    Detached partitions are kept as ordinary tables, so they can be archived or dropped separately, and are no longer scanned or vacuumed as part of the table.
+    They keep their foreign keys to other tables, so they need to be dropped before those tables can be.
+
+    Returns:
+        The names of the partitions detached.
+    """
+    detached = []
+    for month, name in sorted(existing_partitions(table_name).items()):
+        if add_months(month, 1) <= before:
+            db.session.execute(db.text(f"ALTER TABLE {table_name} DETACH PARTITION {name}"))
+            # the id defaults use the table's sequence, which would stop the table from being dropped while a detached partition refers to it:
+            columns = db.session.scalars(
+                db.text(
+                    "SELECT column_name FROM information_schema.columns "
+                    "WHERE table_schema = current_schema() AND table_name = :name AND column_default IS NOT NULL"
+                ),
+                {"name": name},
+            ).all()
+            for column in columns:
+                db.session.execute(db.text(f"ALTER TABLE {name} ALTER COLUMN {column} DROP DEFAULT"))
+            detached.append(name)
+    return detached
+
+
+def maintain_partitions():
+    """Runs the regular partition maintenance for every partitioned table, and commits it.
+
+    Rows in the DEFAULT partition are moved into monthly partitions, partitions are created up to PARTITION_MONTHS_AHEAD months ahead,
+    and partitions older than the table's PARTITION_RETENTION_MONTHS are detached (tables without a retention period are never detached).
+
+    Returns:
+        A dict of table names to dicts of the "created" and "detached" partition names.
+    """
+    config = current_app.config
+    results = {}
+    for table_name, column in partitioned_tables().items():
+        created = split_default_partition(table_name, column)
+        before = set(existing_partitions(table_name).values())
+        create_partitions(table_name, date.today(), config["PARTITION_MONTHS_AHEAD"] + 1)
+        created += sorted(set(existing_partitions(table_name).values()) - before)
+        detached = []
+        retention = config["PARTITION_RETENTION_MONTHS"].get(table_name)
+        if retention:
+            detached = detach_partitions(table_name, add_months(date.today(), -retention))
+        results[table_name] = {"created": created, "detached": detached}
+    db.session.commit()
+    return results
@@ -0,0 +1,342 @@
+"""Query plan checks for the read endpoints, run against a large synthetic dataset.
+
+Each case requests an endpoint through the Flask test client, captures every SELECT statement it sends to the database, and runs EXPLAIN (FORMAT JSON) on them.
+A case fails if a plan uses a sequential scan on a table with more than PLAN_LARGE_TABLE_ROWS rows, if an expected index isn't used, or if the total estimated cost is over the case's budget.
+The cost budgets are set for the dataset created by seed-large at its default scale.
+The shape of each plan (without costs or row estimates, which change with the data) is stored in PLAN_SNAPSHOT_DIR, so that a change to an endpoint's plans shows up as a diff in review.
+
+Usage:
+    flask db create && flask db seed && flask db seed-large
+    flask db check-plans            # fails on a broken check or a changed plan
+    flask db check-plans --update   # rewrites the snapshots after an intended change
+"""
+
+from main import db, bcrypt
+from models.applications import VALID_STATUSES
+from models.interviews import VALID_FORMATS
+from revocation import denylist
+from staff_cache import staff_cache
+
+from flask import current_app
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+import json
+import os
+import re
+
+# rows added for each step of --scale:
+SEED_COUNTS = {
+    "staff": 20,
+    "candidates": 200,
+    "jobs": 20,
+    "applications": 1000,
+    "interviews": 1500,
+}
+
+SYNTHETIC_PASSWORD = "Synthetic123"
+EXPANDED_IN = re.compile(r"IN \((?:%\(\w+\)s(?:, )?)+\)")
+
+# every case is requested as one of these seeded users:
+ROLE_USER_IDS = {
+    "admin": 1,
+    "staff": 2,
+    "candidate": 3,
+}
+
+PLAN_CASES = [
+    {
+        "name": "my_interviews_staff",
+        "role": "staff",
+        "url": "/interviews/",
+        "indexes": ["ix_interviews_interviewer_datetime"],
+        "max_cost": 4000,
+    },
+    {
+        "name": "my_interviews_candidate",
+        "role": "candidate",
+        "url": "/interviews/",
+        "indexes": ["ix_interviews_candidate_datetime"],
+        "max_cost": 500,
+    },
+    {
+        "name": "interviews_by_interviewer_and_date",
+        "role": "admin",
+        "url": "/interviews/all?interviewer_id=2&interview_datetime_from=2023-07-01T00:00&interview_datetime_to=2023-07-31T23:59",
+        "indexes": ["ix_interviews_interviewer_datetime"],
+        "max_cost": 200,
+    },
+    {
+        "name": "interviews_by_application",
+        "role": "admin",
+        "url": "/interviews/all?application_id=1",
+        "indexes": ["ix_interviews_application_id"],
+        "max_cost": 200,
+    },
+    {
+        "name": "interview_scorecard",
+        "role": "admin",
+        "url": "/interviews/1/scorecards/",
+        "indexes": ["interviews_pkey"],
+        "max_cost": 100,
+    },
+    {
+        "name": "job_applications",
+        "role": "staff",
+        "url": "/jobs/1/applications/",
+        "indexes": ["ix_applications_job_date"],
+        "max_cost": 1000,
+    },
+    {
+        "name": "one_job",
+        "role": "admin",
+        "url": "/jobs/1/",
+        "indexes": ["jobs_pkey"],
+        "max_cost": 100,
+    },
+    {
+        "name": "one_application",
+        "role": "staff",
+        "url": "/applications/1/?fields=id,status,candidate.name,job.title",
+        "indexes": ["applications_pkey"],
+        "max_cost": 100,
+    },
+    {
+        "name": "applications_by_status",
+        "role": "admin",
+        "url": "/applications/?status=Offer&application_date_from=2023-07-01",
+        "indexes": ["ix_applications_status_date"],
+        "max_cost": 25000,
+    },
+    {
+        "name": "applications_by_candidate",
+        "role": "admin",
+        "url": "/applications/?candidate_id=1",
+        "indexes": ["ix_applications_candidate_id"],
+        "max_cost": 300,
+    },
+    {
+        "name": "time_in_stage",
+        "role": "admin",
+        "url": "/applications/analytics/time-in-stage/",
+        "indexes": ["ix_application_status_history_application"],
+        "max_cost": 40000,
+    },
+    {
+        "name": "time_to_offer",
+        "role": "admin",
+        "url": "/applications/analytics/time-to-offer/",
+        "indexes": ["ix_application_status_history_to_status", "ix_application_status_history_application"],
+        "max_cost": 5000,
+    },
+]
+
+
+def seed_large_dataset(scale):
+    """Adds synthetic Staff, Candidates, Jobs, Applications, Interviews and status history on top of the seeded data, then analyzes the tables.
+
+    Rows are generated by Postgres with generate_series, so a large dataset can be created in seconds.
+
+    Args:
+        scale: The number of times to add the rows in SEED_COUNTS.
+    """
+    counts = {table: count * scale for table, count in SEED_COUNTS.items()}
+    password = bcrypt.generate_password_hash(SYNTHETIC_PASSWORD).decode("utf-8")
+    statements = [
+        """
+        INSERT INTO users (email, password)
+        SELECT 'synthetic.' || kind || '.' || g || '.' || md5(random()::text) || '@example.com', :password
+        FROM (VALUES ('staff', :staff), ('candidate', :candidates)) AS kinds (kind, count),
+            generate_series(1, kinds.count) AS g
+        """,
+        """
+        INSERT INTO staff (user_id, name, title, admin)
+        SELECT users.id, 'Synthetic Staff ' || users.id, 'Interviewer', false
+        FROM users LEFT JOIN staff ON staff.user_id = users.id
+        WHERE users.email LIKE 'synthetic.staff.%' AND staff.id IS NULL
+        """,
+        """
+        INSERT INTO candidates (user_id, name, phone_number)
+        SELECT users.id, 'Synthetic Candidate ' || users.id, '04' || lpad((users.id % 100000000)::text, 8, '0')
+        FROM users LEFT JOIN candidates ON candidates.user_id = users.id
+        WHERE users.email LIKE 'synthetic.candidate.%' AND candidates.id IS NULL
+        """,
+        """
+        INSERT INTO jobs (title, description, department, location, status, salary_budget, hiring_manager_id)
+        SELECT 'Synthetic Job ' || g, 'A synthetic job used for query plan checks.',
+            (ARRAY['Engineering', 'Accounts', 'Sales', 'Marketing'])[1 + g % 4],
+            (ARRAY['Sydney', 'Melbourne', 'Brisbane', 'Australia (Remote)'])[1 + g % 4],
+            CASE WHEN g % 5 = 0 THEN 'Closed' ELSE 'Open' END,
+            100000 + g % 50 * 1000,
+            ids[1 + g % cardinality(ids)]
+        FROM generate_series(1, :jobs) AS g, (SELECT array_agg(id) AS ids FROM staff) AS staff
+        """,
+        """
+        INSERT INTO applications (job_id, application_date, status, candidate_id, location, working_rights,
+            notice_period, salary_expectations, resume)
+        SELECT job_ids[1 + (random() * (cardinality(job_ids) - 1))::int],
+            current_date - (g % 730),
+            CASE WHEN g % 100 = 0 THEN 'Offer' ELSE (:statuses)[1 + g % 4] END,
+            candidate_ids[1 + (random() * (cardinality(candidate_ids) - 1))::int],
+            (ARRAY['Sydney', 'Melbourne', 'Brisbane', 'Perth'])[1 + g % 4],
+            'Citizen', '4 weeks', 90000 + g % 80 * 1000,
+            'https://example.com/resume/' || g
+        FROM generate_series(1, :applications) AS g,
+            (SELECT array_agg(id) AS job_ids FROM jobs) AS jobs,
+            (SELECT array_agg(id) AS candidate_ids FROM candidates) AS candidates
+        """,
+        """
+        INSERT INTO interviews (application_id, candidate_id, interviewer_id, interview_datetime, length_mins, format)
+        SELECT applications.id, applications.candidate_id,
+            staff_ids[1 + (random() * (cardinality(staff_ids) - 1))::int],
+            applications.application_date + interval '9 hours' + (g % 8) * interval '1 hour' + (g % 14) * interval '1 day',
+            (ARRAY[20, 30, 45, 60])[1 + g % 4],
+            (:formats)[1 + g % 3]
+        FROM (
+                SELECT g, 1 + (random() * (max_id - 1))::int AS application_id
+                FROM generate_series(1, :interviews) AS g, (SELECT max(id) AS max_id FROM applications) AS ids
+            ) AS picks
+            JOIN applications ON applications.id = picks.application_id,
+            (SELECT array_agg(id) AS staff_ids FROM staff) AS staff
+        """,
+        # each application moves through the stages up to its status, a few days apart, starting on its application date:
+        """
+        INSERT INTO application_status_history (application_id, job_id, from_status, to_status, changed_at)
+        SELECT applications.id, applications.job_id,
+            lag(steps.status) OVER (PARTITION BY applications.id ORDER BY steps.n),
+            steps.status,
+            applications.application_date + (steps.n - 1) * interval '5 days' + sign(steps.n - 1) * random() * interval '4 days'
+        FROM applications
+            CROSS JOIN LATERAL unnest(
+                CASE WHEN applications.status = ANY(:pipeline)
+                    THEN (:pipeline)[1:array_position(:pipeline, applications.status)]
+                    ELSE ARRAY[(:pipeline)[1], applications.status]
+                END
+            ) WITH ORDINALITY AS steps (status, n)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM application_status_history WHERE application_status_history.application_id = applications.id
+        )
+        """,
+    ]
+    # Offer is kept to 1% of applications, so filtering on it is selective:
+    statuses = [status for status in VALID_STATUSES if status != "Offer"]
+    pipeline = [status for status in VALID_STATUSES if status != "Rejected"]
+    params = dict(counts, password=password, statuses=statuses, formats=list(VALID_FORMATS), pipeline=pipeline)
+    for statement in statements:
+        db.session.execute(db.text(statement), params)
+    db.session.commit()
+    with db.engine.connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT").exec_driver_sql("ANALYZE")
+    return counts
+
+
+def capture_statements(client, url, headers):
+    """Requests a URL with the test client, and returns the SELECT statements and parameters it executed."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = client.get(url, headers=headers)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+    return response, statements
+
+
+def plan_shape(node):
+    """Reduces an EXPLAIN plan node to the fields that describe its shape, leaving out costs and row estimates."""
+    shape = {"node": node["Node Type"]}
+    for key, name in (("Relation Name", "relation"), ("Index Name", "index"), ("Join Type", "join")):
+        if key in node:
+            shape[name] = node[key]
+    if node.get("Plans"):
+        shape["plans"] = [plan_shape(child) for child in node["Plans"]]
+    return shape
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def large_tables():
+    """Returns the names of the tables estimated to hold more than PLAN_LARGE_TABLE_ROWS rows."""
+    query = db.text(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace AND reltuples > :rows"
+    )
+    return set(db.session.scalars(query, {"rows": current_app.config["PLAN_LARGE_TABLE_ROWS"]}))
+
+
+def check_case(client, case, headers, large):
+    """Runs one plan case, and returns its snapshot and a list of failure messages.
+
+    Every statement is explained so the cost includes repeated statements (such as lazy loads for each row), but each distinct statement only appears once in the snapshot, as the number of repeats depends on the data.
+    """
+    response, statements = capture_statements(client, case["url"], headers)
+    failures = []
+    if response.status_code != 200:
+        failures.append(f"GET {case['url']} returned {response.status_code}")
+    snapshot = {}
+    total_cost = 0
+    used_indexes = set()
+    connection = db.session.connection()
+    for statement, parameters in statements:
+        plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()[0]["Plan"]
+        total_cost += plan["Total Cost"]
+        # an IN list has a parameter for each value, so its length is left out of the snapshot, as it depends on the data:
+        sql = EXPANDED_IN.sub("IN (...)", " ".join(statement.split()))
+        if sql in snapshot:
+            continue
+        for node in plan_nodes(plan):
+            if node["Node Type"] == "Seq Scan" and node["Relation Name"] in large:
+                failures.append(f"sequential scan on {node['Relation Name']} in: {sql}")
+            if "Index Name" in node:
+                used_indexes.add(node["Index Name"])
+        snapshot[sql] = plan_shape(plan)
+    for index in case["indexes"]:
+        if index not in used_indexes:
+            failures.append(f"expected index {index} was not used")
+    if total_cost > case["max_cost"]:
+        failures.append(f"estimated cost {total_cost:.0f} is over the budget of {case['max_cost']}")
+    # lazy loads are issued in an order that depends on the data, so the statements are sorted to keep the snapshot stable:
+    return [{"sql": sql, "plan": snapshot[sql]} for sql in sorted(snapshot)], failures
+
+
+def check_plans(update=False):
+    """Runs every case in PLAN_CASES, and compares the plans with the stored snapshots.
+
+    Args:
+        update: True to rewrite the snapshots instead of comparing them.
+
+    Returns:
+        A dict of case names to their list of failure messages.
+    """
+    snapshot_dir = current_app.config["PLAN_SNAPSHOT_DIR"]
+    os.makedirs(snapshot_dir, exist_ok=True)
+    client = current_app.test_client()
+    large = large_tables()
+    # loads the revoked token denylist now, so a refresh isn't captured in whichever case happens to be running when it's due:
+    denylist.refresh()
+    current_app.config["DENYLIST_REFRESH_SECONDS"] = float("inf")
+    results = {}
+    for case in PLAN_CASES:
+        token = create_access_token(identity=str(ROLE_USER_IDS[case["role"]]))
+        # each case starts with an empty staff cache, so its Staff lookup is captured whichever cases ran before it:
+        staff_cache.clear()
+        snapshot, failures = check_case(client, case, {"Authorization": f"Bearer {token}"}, large)
+        path = os.path.join(snapshot_dir, f"{case['name']}.json")
+        content = json.dumps({"url": case["url"], "role": case["role"], "statements": snapshot}, indent=2) + "\n"
+        if update:
+            with open(path, "w") as snapshot_file:
+                snapshot_file.write(content)
+        elif not os.path.exists(path):
+            failures.append(f"no snapshot at {path}, run with --update to create it")
+        else:
+            with open(path) as snapshot_file:
+                if snapshot_file.read() != content:
+                    failures.append(f"plans differ from the snapshot at {path}, run with --update if the change is intended")
+        results[case["name"]] = failures
+    return results
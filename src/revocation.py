@@ -0,0 +1,146 @@
+"""Token revocation checks backed by an in-memory bloom filter.
+
+Every worker keeps a bloom filter of the revoked_tokens table, and adds new revocations to it every DENYLIST_REFRESH_SECONDS.
+A token that is not revoked is almost always rejected by the bloom filter with a few hash probes, so only bloom filter hits need a database lookup to confirm the revocation.
+
+Workers load the revocations with an id above the last one they have seen. Ids come from a sequence when a row is inserted rather than when it commits,
+so revocations are inserted while holding a transaction-level advisory lock, as in the change feed, and become visible strictly in id order,
+otherwise a worker that had loaded a later revocation would never load one committed after it.
+"""
+
+from main import db
+from models.revoked_tokens import RevokedToken
+
+from flask import current_app
+from datetime import datetime
+import hashlib
+import math
+import threading
+import time
+
+# a claim added to tokens at login with the time they were issued to the microsecond, as iat is in whole seconds:
+ISSUED_AT_CLAIM = "issued_at"
+# an arbitrary key shared by every writer of the revoked_tokens table:
+REVOCATION_LOCK = 4405764002
+
+
+class BloomFilter:
+    """A fixed-size bloom filter of strings.
+
+    Sized from the expected number of keys and the acceptable false positive rate, and uses double hashing of a single blake2b digest for its probes.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(math.ceil(self.size / 8))
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+def user_key(user_id):
+    """The bloom filter key used when every session for a user has been revoked."""
+    return f"user:{user_id}"
+
+
+class TokenDenylist:
+    """The per-worker view of the revoked_tokens table.
+
+    The bloom filter is built on first use, and afterwards only revocations with an id above the last one seen are loaded.
+    Revocations made in this worker are added straight away, while revocations made in other workers are picked up within DENYLIST_REFRESH_SECONDS.
+    """
+
+    def __init__(self):
+        self.bloom = None
+        self.last_id = 0
+        self.refreshed_at = 0
+        self.lock = threading.Lock()
+
+    def _rebuild(self):
+        config = current_app.config
+        self.bloom = BloomFilter(config["DENYLIST_CAPACITY"], config["DENYLIST_ERROR_RATE"])
+        self.last_id = 0
+        self._load(RevokedToken.expires_at > datetime.now())
+
+    def _load(self, *criteria):
+        query = db.select(RevokedToken.id, RevokedToken.jti, RevokedToken.user_id).where(
+            RevokedToken.id > self.last_id, *criteria
+        )
+        for revoked_id, jti, user_id in db.session.execute(query):
+            self.bloom.add(jti or user_key(user_id))
+            self.last_id = max(self.last_id, revoked_id)
+
+    def refresh(self):
+        """Loads revocations added since the last refresh, if DENYLIST_REFRESH_SECONDS have passed.
+
+        The bloom filter is rebuilt from the unexpired revocations once it holds more keys than it was sized for.
+        """
+        if time.monotonic() - self.refreshed_at < current_app.config["DENYLIST_REFRESH_SECONDS"]:
+            return
+        with self.lock:
+            if time.monotonic() - self.refreshed_at < current_app.config["DENYLIST_REFRESH_SECONDS"]:
+                return
+            if self.bloom is None or self.bloom.count > self.bloom.capacity:
+                self._rebuild()
+            else:
+                self._load()
+            self.refreshed_at = time.monotonic()
+
+    def revoke(self, revoked):
+        """Adds a revocation to the database session and commits it, then adds it to this worker's bloom filter.
+
+        The advisory lock is taken before the revocation is inserted and released when it commits, so revocations commit in id order.
+        """
+        db.session.execute(db.select(db.func.pg_advisory_xact_lock(REVOCATION_LOCK)))
+        db.session.add(revoked)
+        db.session.commit()
+        self.add(revoked)
+
+    def add(self, revoked):
+        """Adds a revocation committed by this worker to the bloom filter."""
+        if self.bloom is not None:
+            self.bloom.add(revoked.jti or user_key(revoked.user_id))
+
+    def is_revoked(self, jwt_payload):
+        """Checks if a decoded token has been revoked, using the bloom filter before the database."""
+        self.refresh()
+        jti = jwt_payload["jti"]
+        user_id = jwt_payload["sub"]
+        if jti not in self.bloom and user_key(user_id) not in self.bloom:
+            return False
+        if ISSUED_AT_CLAIM in jwt_payload:
+            revoked_after_issue = RevokedToken.revoked_at >= datetime.fromtimestamp(jwt_payload[ISSUED_AT_CLAIM])
+        else:
+            # iat is in whole seconds, so a token issued in the same second as a revocation is treated as revoked, even if it was issued just after it:
+            revoked_after_issue = db.func.date_trunc("second", RevokedToken.revoked_at) >= datetime.fromtimestamp(jwt_payload["iat"])
+        query = db.select(RevokedToken.id).where(
+            db.or_(
+                RevokedToken.jti == jti,
+                db.and_(
+                    RevokedToken.user_id == int(user_id),
+                    RevokedToken.jti.is_(None),
+                    revoked_after_issue,
+                ),
+            )
+        ).limit(1)
+        return db.session.scalar(query) is not None
+
+
+denylist = TokenDenylist()
@@ -0,0 +1,103 @@
+"""Request coalescing (single-flight), so that concurrent requests needing the same expensive result compute it once.
+
+The first request for a key computes the result, and the others for the same key that arrive while it runs wait for it and share it,
+rather than all running the same queries at once, such as when a cache has just been invalidated or a worker has just started.
+A waiting request that isn't given the result within its timeout, or whose leader failed, computes the result itself, so a slow or stuck leader delays requests but never fails them.
+
+SingleFlight coalesces the requests within one worker. cross_worker_lock extends this to every worker with a Postgres advisory lock, for results
+that are shared between workers, such as through a table: the worker holding the lock computes and stores the result, and the others wait for the lock and then read it.
+"""
+
+from main import db
+
+from contextlib import contextmanager
+from sqlalchemy.exc import OperationalError
+from psycopg2 import errorcodes
+import threading
+
+# an arbitrary namespace for the advisory locks, with the key's hash as the second half of the lock:
+SINGLE_FLIGHT_LOCK_NAMESPACE = 5260112
+
+
+class Call:
+    """A computation in progress, which the requests waiting on it share the result of."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class SingleFlight:
+    """The computations in progress in this worker, by key."""
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, function, timeout):
+        """Returns the result of the function, which is only called by one thread at a time for each key.
+
+        Args:
+            key: Identifies the result, such as a cache key.
+            function: Computes the result, called with no arguments.
+            timeout: The seconds to wait for another thread computing the same key, before calling the function anyway.
+
+        Returns:
+            The result of the function, from this call or one running in another thread.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+        if not leader:
+            if call.done.wait(timeout) and not call.failed:
+                return call.result
+            return function()
+        try:
+            call.result = function()
+            return call.result
+        except BaseException:
+            call.failed = True
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+
+single_flight = SingleFlight()
+
+
+@contextmanager
+def cross_worker_lock(key, timeout):
+    """Holds a Postgres advisory lock for a key on its own connection, so only one worker at a time computes the key's result.
+
+    Args:
+        key: Identifies the result, hashed into the lock.
+        timeout: The seconds to wait for the lock.
+
+    Yields:
+        The connection holding the lock, to read and store the shared result on, or None if the lock wasn't acquired within the timeout,
+        in which case the result should be computed without it.
+    """
+    with db.engine.connect() as connection:
+        lock = {"namespace": SINGLE_FLIGHT_LOCK_NAMESPACE, "key": key}
+        try:
+            # the timeout is local to this transaction, while the lock is held by the connection until it is unlocked:
+            connection.execute(db.text("SELECT set_config('lock_timeout', :timeout, true)"), {"timeout": f"{int(timeout * 1000)}ms"})
+            connection.execute(db.text("SELECT pg_advisory_lock(:namespace, hashtext(:key))"), lock)
+            connection.commit()
+        except OperationalError as err:
+            if err.orig.pgcode != errorcodes.LOCK_NOT_AVAILABLE:
+                raise
+            connection.rollback()
+            yield None
+            return
+        try:
+            yield connection
+        finally:
+            connection.rollback()
+            connection.execute(db.text("SELECT pg_advisory_unlock(:namespace, hashtext(:key))"), lock)
+            connection.commit()
@@ -0,0 +1,277 @@
+"""Snapshots of the whole database to a local directory, for quickly resetting test and staging environments.
+
+A snapshot writes each table to <table>.copy with binary COPY, using SNAPSHOT_WORKERS connections at once, one table per connection.
+The connections share one exported snapshot (pg_export_snapshot), so the tables are consistent with each other, as if they had been copied in a single transaction.
+A manifest.json records the columns of each table, the months of each partitioned table's partitions, and the sequence values.
+
+A restore recreates the tables, then drops their indexes, primary keys, unique constraints and foreign keys before loading the data, so that the rows are loaded without
+updating any index and each index is built once at the end, which is much faster. Tables are loaded in parallel, and into a table truncated in the same transaction,
+so the rows can be written already frozen and don't need vacuuming afterwards. The indexes are then rebuilt in parallel, one table per connection,
+and the foreign keys are added without checking and then validated in parallel, which only takes a lock that doesn't block reads and writes.
+
+Usage:
+    flask db snapshot             # writes to SNAPSHOT_DIR
+    flask db restore              # replaces every table with the snapshot in SNAPSHOT_DIR
+"""
+
+from main import db
+from partitions import create_all_partitions, create_partitions, existing_partitions, partitioned_tables
+
+from flask import current_app
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+import json
+import os
+import time
+
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def table_columns():
+    """Returns a dict of each table in the models to its column names, in order."""
+    return {table.name: [column.name for column in table.columns] for table in db.metadata.sorted_tables}
+
+
+def column_list(columns):
+    return ", ".join(f'"{column}"' for column in columns)
+
+
+def run_parallel(function, items, workers):
+    """Calls the function for each item with up to workers threads, each with its own app context, and returns the results in order."""
+    app = current_app._get_current_object()
+
+    def call(item):
+        with app.app_context():
+            return function(item)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(call, items))
+
+
+def table_sizes(connection, tables):
+    """Returns the size on disk of each table, including its partitions, to copy the largest tables first."""
+    query = db.text(
+        "SELECT coalesce(sum(pg_table_size(inhrelid)), 0) + pg_table_size(CAST(:table AS regclass)) "
+        "FROM pg_inherits WHERE inhparent = CAST(:table AS regclass)"
+    )
+    return {table: connection.execute(query, {"table": table}).scalar() for table in tables}
+
+
+def take_snapshot(directory=None, workers=None):
+    """Writes every table to a directory with binary COPY, in parallel, from one consistent snapshot.
+
+    Args:
+        directory: The directory to write to, defaulting to SNAPSHOT_DIR. Any previous snapshot in it is overwritten.
+        workers: The number of tables to copy at once, defaulting to SNAPSHOT_WORKERS.
+
+    Returns:
+        A dict of each table name to the number of rows written.
+    """
+    config = current_app.config
+    directory = directory or config["SNAPSHOT_DIR"]
+    workers = workers or config["SNAPSHOT_WORKERS"]
+    os.makedirs(directory, exist_ok=True)
+    columns = table_columns()
+    partitioned = partitioned_tables()
+    # the exporting transaction must stay open until every worker has started its own transaction with the snapshot:
+    with db.engine.connect().execution_options(
+        isolation_level="REPEATABLE READ", postgresql_readonly=True
+    ) as connection:
+        snapshot_id = connection.execute(db.text("SELECT pg_export_snapshot()")).scalar()
+        sequences = {
+            row.sequencename: row.last_value
+            for row in connection.execute(
+                db.text("SELECT sequencename, last_value FROM pg_sequences WHERE schemaname = current_schema()")
+            )
+        }
+        sizes = table_sizes(connection, columns)
+
+        def copy_table(table):
+            path = os.path.join(directory, f"{table}.copy")
+            # a partitioned table can only be copied out through a query:
+            source = (
+                f"(SELECT {column_list(columns[table])} FROM {table})"
+                if table in partitioned
+                else f"{table} ({column_list(columns[table])})"
+            )
+            with db.engine.connect().execution_options(
+                isolation_level="REPEATABLE READ", postgresql_readonly=True
+            ) as worker:
+                worker.exec_driver_sql(f"SET TRANSACTION SNAPSHOT '{snapshot_id}'")
+                with open(path, "wb") as file:
+                    cursor = worker.connection.driver_connection.cursor()
+                    cursor.copy_expert(f"COPY {source} TO STDOUT (FORMAT binary)", file)
+                    return cursor.rowcount
+
+        tables = sorted(columns, key=sizes.get, reverse=True)
+        rows = dict(zip(tables, run_parallel(copy_table, tables, workers)))
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "tables": {table: {"columns": columns[table], "rows": rows[table]} for table in columns},
+            "partitions": {
+                table: sorted(month.isoformat() for month in existing_partitions(table)) for table in partitioned
+            },
+            "sequences": sequences,
+        }
+    with open(os.path.join(directory, MANIFEST), "w") as file:
+        json.dump(manifest, file, indent=2)
+    return rows
+
+
+def read_manifest(directory):
+    """Reads a snapshot's manifest, checking it was taken from tables with the same columns as the current models.
+
+    Errors:
+        Raises a ValueError if there is no snapshot in the directory, or its tables don't match the models.
+    """
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        raise ValueError(f"No snapshot found in {directory}")
+    with open(path) as file:
+        manifest = json.load(file)
+    columns = table_columns()
+    snapshot_columns = {table: details["columns"] for table, details in manifest["tables"].items()}
+    if manifest.get("version") != MANIFEST_VERSION or snapshot_columns != columns:
+        changed = sorted(
+            table for table in set(columns) | set(snapshot_columns) if columns.get(table) != snapshot_columns.get(table)
+        )
+        raise ValueError(f"The snapshot doesn't match the current tables ({', '.join(changed) or 'format'}), take a new snapshot")
+    return manifest
+
+
+def deferred_definitions(tables):
+    """Returns the definitions of the tables' indexes and constraints that are rebuilt after loading, as lists of (table, name, definition).
+
+    Indexes and constraints on partitions are left out, as they are dropped and created along with those on their partitioned table.
+    """
+    scope = "c.relname = ANY(:tables) AND c.relnamespace = current_schema()::regnamespace AND NOT c.relispartition"
+    constraints = db.session.execute(
+        db.text(
+            "SELECT c.relname, con.conname, con.contype, c.relkind, pg_get_constraintdef(con.oid) "
+            "FROM pg_constraint con JOIN pg_class c ON c.oid = con.conrelid "
+            f"WHERE {scope} AND con.contype IN ('p', 'u', 'f') AND con.conparentid = 0 ORDER BY c.relname, con.conname"
+        ),
+        {"tables": tables},
+    ).all()
+    indexes = db.session.execute(
+        db.text(
+            "SELECT c.relname, i.relname, pg_get_indexdef(ix.indexrelid) "
+            "FROM pg_index ix JOIN pg_class i ON i.oid = ix.indexrelid JOIN pg_class c ON c.oid = ix.indrelid "
+            f"WHERE {scope} AND NOT EXISTS ("
+            "SELECT 1 FROM pg_constraint WHERE conindid = ix.indexrelid AND conrelid = ix.indrelid AND contype IN ('p', 'u')"
+            ") ORDER BY c.relname, i.relname"
+        ),
+        {"tables": tables},
+    ).all()
+    keys = [(table, name, definition) for table, name, kind, _, definition in constraints if kind in "pu"]
+    foreign_keys = [(table, name, definition, relkind == "p") for table, name, kind, relkind, definition in constraints if kind == "f"]
+    # an index on a partitioned table is defined "ON ONLY" the table, which wouldn't create it on the partitions:
+    indexes = [(table, name, definition.replace(" ON ONLY ", " ON ", 1)) for table, name, definition in indexes]
+    return keys, foreign_keys, indexes
+
+
+def restore_snapshot(directory=None, workers=None):
+    """Replaces every table with the contents of a snapshot, rebuilding the indexes and constraints after loading.
+
+    Args:
+        directory: The directory of the snapshot, defaulting to SNAPSHOT_DIR.
+        workers: The number of tables to load or index at once, defaulting to SNAPSHOT_WORKERS.
+
+    Returns:
+        A dict of the seconds taken by each step.
+
+    Errors:
+        Raises a ValueError, before anything is changed, if there is no snapshot in the directory or it doesn't match the models.
+    """
+    config = current_app.config
+    directory = directory or config["SNAPSHOT_DIR"]
+    workers = workers or config["SNAPSHOT_WORKERS"]
+    manifest = read_manifest(directory)
+    tables = list(manifest["tables"])
+    partitioned = partitioned_tables()
+    timings = {}
+    started = time.monotonic()
+
+    def step(name):
+        nonlocal started
+        timings[name] = round(time.monotonic() - started, 2)
+        started = time.monotonic()
+
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    create_all_partitions()
+    for table, months in manifest["partitions"].items():
+        for month in months:
+            create_partitions(table, date.fromisoformat(month), 1)
+    keys, foreign_keys, indexes = deferred_definitions(tables)
+    for table, name, definition, _ in foreign_keys:
+        db.session.execute(db.text(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'))
+    for table, name, definition in keys:
+        db.session.execute(db.text(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'))
+    for table, name, definition in indexes:
+        db.session.execute(db.text(f'DROP INDEX "{name}"'))
+    db.session.commit()
+    step("schema")
+
+    def load_table(table):
+        path = os.path.join(directory, f"{table}.copy")
+        # FREEZE needs the table to be truncated in the same transaction, and isn't supported for partitioned tables:
+        freeze = ", FREEZE" if table not in partitioned else ""
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql(f"TRUNCATE {table}")
+            with open(path, "rb") as file:
+                connection.connection.driver_connection.cursor().copy_expert(
+                    f"COPY {table} ({column_list(manifest['tables'][table]['columns'])}) FROM STDIN (FORMAT binary{freeze})",
+                    file,
+                )
+
+    by_size = sorted(tables, key=lambda table: manifest["tables"][table]["rows"], reverse=True)
+    run_parallel(load_table, by_size, workers)
+    step("load")
+
+    def build_table(table):
+        # each table's keys and indexes are built on one connection, as adding a key locks the table:
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql(f"SET maintenance_work_mem = '{config['SNAPSHOT_MAINTENANCE_WORK_MEM']}'")
+            for key_table, name, definition in keys:
+                if key_table == table:
+                    connection.exec_driver_sql(f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}')
+            for index_table, name, definition in indexes:
+                if index_table == table:
+                    connection.exec_driver_sql(definition)
+
+    run_parallel(build_table, by_size, workers)
+    step("indexes")
+
+    # foreign keys are added unchecked, which only needs a brief lock, then checked in parallel,
+    # except on partitioned tables, which don't support unchecked foreign keys:
+    with db.engine.begin() as connection:
+        for table, name, definition, on_partitioned in foreign_keys:
+            if not on_partitioned:
+                connection.exec_driver_sql(f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition} NOT VALID')
+
+    def validate_foreign_key(foreign_key):
+        table, name, definition, on_partitioned = foreign_key
+        with db.engine.begin() as connection:
+            if on_partitioned:
+                connection.exec_driver_sql(f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}')
+            else:
+                connection.exec_driver_sql(f'ALTER TABLE {table} VALIDATE CONSTRAINT "{name}"')
+
+    run_parallel(validate_foreign_key, foreign_keys, workers)
+    step("foreign_keys")
+
+    with db.engine.begin() as connection:
+        for sequence, last_value in manifest["sequences"].items():
+            # a sequence that had never been used starts again from its first value:
+            connection.execute(
+                db.text("SELECT setval(:sequence, coalesce(:last_value, 1), :called)"),
+                {"sequence": sequence, "last_value": last_value, "called": last_value is not None},
+            )
+    with db.engine.connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT").exec_driver_sql("ANALYZE")
+    step("analyze")
+    return timings
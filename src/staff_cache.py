@@ -0,0 +1,125 @@
+"""An in-process cache of the Staff reference data that responses nest for hiring managers and interviewers.
+
+Jobs and Interviews are serialised with the name and title of their hiring manager or interviewer. Rather than joining or lazy loading
+the Staff record for each response, the schemas serialise the hiring_manager_id or interviewer_id with the StaffReference field,
+which looks the Staff member up in this cache, keyed by id. Schemas with StaffReference fields extend StaffReferenceSchema, which loads
+every Staff member missing from the cache for the records being serialised in one query before the fields are serialised.
+
+Each worker keeps up to STAFF_CACHE_SIZE Staff members, evicting the least recently used, and reloads an entry once it is STAFF_CACHE_TTL_SECONDS old.
+The staff routes invalidate the entries they change straight away in their own worker, while other workers pick up the change within the TTL.
+"""
+
+from main import db, ma
+from models.staff import Staff
+
+from marshmallow import fields, pre_dump
+from collections import OrderedDict
+import threading
+import time
+
+CACHED_COLUMNS = (Staff.id, Staff.name, Staff.title, Staff.admin)
+
+
+class StaffCache:
+    """The per-worker LRU cache of Staff members' name, title and admin permission."""
+
+    def __init__(self):
+        self.config = None
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        self.config = app.config
+
+    def _fresh(self, staff_id):
+        """Returns the cached entry for an id, or None if it isn't cached or has expired. Must be called with the lock held."""
+        entry = self.entries.get(staff_id)
+        if entry is None:
+            return None
+        expires_at, staff_member = entry
+        if expires_at < time.monotonic():
+            del self.entries[staff_id]
+            return None
+        self.entries.move_to_end(staff_id)
+        return staff_member
+
+    def missing(self, staff_ids):
+        """Returns the ids that aren't cached, so they can be loaded in one query."""
+        with self.lock:
+            return {staff_id for staff_id in staff_ids if staff_id is not None and self._fresh(staff_id) is None}
+
+    def put(self, rows):
+        """Adds Staff members to the cache from rows of CACHED_COLUMNS, evicting the least recently used beyond STAFF_CACHE_SIZE."""
+        expires_at = time.monotonic() + self.config["STAFF_CACHE_TTL_SECONDS"]
+        with self.lock:
+            for row in rows:
+                self.entries[row.id] = (expires_at, {"name": row.name, "title": row.title, "admin": row.admin})
+                self.entries.move_to_end(row.id)
+            while len(self.entries) > self.config["STAFF_CACHE_SIZE"]:
+                self.entries.popitem(last=False)
+
+    def load(self, staff_ids):
+        """Loads any of the Staff members that aren't cached, with one query."""
+        missing = self.missing(staff_ids)
+        if missing:
+            self.put(db.session.execute(db.select(*CACHED_COLUMNS).where(Staff.id.in_(missing))))
+
+    def get(self, staff_id):
+        """Returns a dict of the Staff member's name, title and admin permission, loading it if it isn't cached, or None if there is no such Staff member."""
+        with self.lock:
+            staff_member = self._fresh(staff_id)
+        if staff_member is None:
+            self.load([staff_id])
+            with self.lock:
+                staff_member = self._fresh(staff_id)
+        return staff_member
+
+    def invalidate(self, staff_id):
+        """Removes a Staff member from this worker's cache, after their record has been changed or deleted."""
+        with self.lock:
+            self.entries.pop(staff_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+staff_cache = StaffCache()
+
+
+def referenced_staff_ids(schema, records):
+    """Returns the ids of the Staff members that the schema's StaffReference fields will look up for the records."""
+    attributes = [field.attribute for field in schema.dump_fields.values() if isinstance(field, StaffReference)]
+    return {getattr(record, attribute) for record in records for attribute in attributes}
+
+
+class StaffReference(fields.Field):
+    """Serialises a Staff foreign key as the Staff member's name and title, from the staff cache.
+
+    Used in place of a nested StaffSchema(only=["name", "title"]), with the same output, so the Staff record doesn't need to be loaded with the query.
+    The attribute is the foreign key column, such as hiring_manager_id. Like a nested schema, it can be limited to name or title with the
+    ?fields= query parameter, such as hiring_manager.name.
+    """
+
+    FIELDS = ("name", "title")
+
+    def __init__(self, attribute, **kwargs):
+        super().__init__(attribute=attribute, dump_only=True, **kwargs)
+        self.only = None
+
+    def _serialize(self, value, attr, obj, **kwargs):
+        if value is None:
+            return None
+        staff_member = staff_cache.get(value)
+        if staff_member is None:
+            return None
+        return {name: staff_member[name] for name in self.FIELDS if not self.only or name in self.only}
+
+
+class StaffReferenceSchema(ma.Schema):
+    """Base schema for schemas with StaffReference fields, which loads the Staff members they need into the staff cache with one query before serialising."""
+
+    @pre_dump(pass_many=True)
+    def load_staff(self, data, many, **kwargs):
+        staff_cache.load(referenced_staff_ids(self, data if many else [data]))
+        return data
@@ -0,0 +1,183 @@
+"""Status history of Applications, and the stage duration analytics built on it.
+
+Every status an application has is recorded in the application_status_history table: its first status when it is created, and each change after that.
+Changes are captured from the ORM session when it flushes, like the audit log, but are inserted in the flush itself, so they are committed or rolled back with the change.
+Code that changes statuses with bulk SQL instead of through the ORM must insert its own history rows in the same transaction, as seed_large_dataset does.
+
+The time an application spent in a status is the time from its change to that status until its next change, found with the LEAD window function over each application's changes in order.
+"""
+
+from main import db
+from models.applications import Application
+from models.application_status_history import ApplicationStatusChange
+from audit import current_user_id
+
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, inspect
+from datetime import datetime
+
+SECONDS_PER_DAY = 86400
+PERCENTILES = {"median_days": 0.5, "p75_days": 0.75, "p90_days": 0.9}
+
+
+class StatusHistory:
+    """Records the status changes of Applications in the same transaction as the change."""
+
+    def init_app(self, app):
+        if not event.contains(Session, "after_flush", self.after_flush):
+            event.listen(Session, "after_flush", self.after_flush)
+
+    def after_flush(self, session, flush_context):
+        changed_at = datetime.now()
+        user_id = current_user_id()
+        rows = []
+        for application in session.new:
+            if isinstance(application, Application):
+                rows.append((application, None))
+        for application in session.dirty:
+            if not isinstance(application, Application):
+                continue
+            history = inspect(application).attrs.status.history
+            if history.deleted and history.deleted[0] != application.status:
+                rows.append((application, history.deleted[0]))
+        if rows:
+            # the flush has already sent the changes, so the history is inserted on the same connection, in the same transaction:
+            session.connection().execute(
+                db.insert(ApplicationStatusChange),
+                [
+                    {
+                        "application_id": application.id,
+                        "job_id": application.job_id,
+                        "from_status": from_status,
+                        "to_status": application.status,
+                        "changed_at": changed_at,
+                        "user_id": user_id,
+                    }
+                    for application, from_status in rows
+                ],
+            )
+
+
+status_history = StatusHistory()
+
+
+def backfill_status_history():
+    """Adds a first status change for each application that has no history, such as those created before the history was recorded.
+
+    The change is dated to the application date, as the times of any earlier changes aren't known, so the analytics treat the application as having been in its current status since it was made.
+
+    Returns:
+        The number of applications backfilled.
+    """
+    history = ApplicationStatusChange
+    missing = db.select(
+        Application.id,
+        Application.job_id,
+        Application.status,
+        db.cast(Application.application_date, db.DateTime),
+    ).where(~db.exists().where(history.application_id == Application.id))
+    result = db.session.execute(
+        db.insert(history).from_select(["application_id", "job_id", "to_status", "changed_at"], missing)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def days(seconds):
+    return None if seconds is None else round(float(seconds) / SECONDS_PER_DAY, 2)
+
+
+def duration_stats(seconds):
+    """Builds the count, mean and percentile columns, in seconds, of a duration column."""
+    return [
+        db.func.count(seconds).label("count"),
+        db.func.avg(seconds).label("mean_days"),
+        *(db.func.percentile_cont(fraction).within_group(seconds).label(name) for name, fraction in PERCENTILES.items()),
+    ]
+
+
+def time_in_stage(date_from, date_to, job_id=None):
+    """Summarises how long applications stayed in each status, for the stays that began between two dates.
+
+    Args:
+        date_from: The earliest datetime a stay can begin.
+        date_to: The datetime stays must begin before.
+        job_id: Optionally limits the stays to the applications for one job.
+
+    Returns:
+        A list with a dict for each status, with the number of completed stays, their mean, median, 75th and 90th percentile lengths in days,
+        and the number of applications still in that status (in_progress), which aren't included in the lengths.
+    """
+    history = ApplicationStatusChange
+    # stays beginning before date_from can be left out before the window function, as LEAD only looks at later changes:
+    query = db.select(
+        history.to_status,
+        history.changed_at,
+        db.func.extract(
+            "epoch",
+            db.func.lead(history.changed_at).over(
+                partition_by=history.application_id, order_by=(history.changed_at, history.id)
+            )
+            - history.changed_at,
+        ).label("seconds"),
+    ).where(history.changed_at >= date_from)
+    if job_id is not None:
+        query = query.where(history.job_id == job_id)
+    stays = query.subquery()
+    query = (
+        db.select(
+            stays.c.to_status,
+            *duration_stats(stays.c.seconds),
+            db.func.count().filter(stays.c.seconds.is_(None)).label("in_progress"),
+        )
+        .where(stays.c.changed_at < date_to)
+        .group_by(stays.c.to_status)
+        .order_by(stays.c.to_status)
+    )
+    return [
+        {
+            "status": row.to_status,
+            "count": row.count,
+            "in_progress": row.in_progress,
+            **{name: days(getattr(row, name)) for name in ("mean_days", *PERCENTILES)},
+        }
+        for row in db.session.execute(query)
+    ]
+
+
+def time_to_status(status, date_from, date_to, job_id=None):
+    """Summarises how long applications took to first reach a status, such as Offer, for those that reached it between two dates.
+
+    Args:
+        status: The status to measure the time to.
+        date_from: The earliest datetime the status can have been reached.
+        date_to: The datetime the status must have been reached before.
+        job_id: Optionally limits the applications to those for one job.
+
+    Returns:
+        A dict with the number of applications, and the mean, median, 75th and 90th percentile days from their first status to reaching the status.
+    """
+    history = ApplicationStatusChange
+    reached_at = db.func.min(history.changed_at)
+    # the first time each application reached the status is over all of its history, as one that reached it again within the dates was first reached before them:
+    reached = db.select(history.application_id, reached_at.label("reached_at")).where(history.to_status == status)
+    if job_id is not None:
+        reached = reached.where(history.job_id == job_id)
+    reached = (
+        reached.group_by(history.application_id)
+        .having(reached_at >= date_from, reached_at < date_to)
+        .subquery()
+    )
+    # each application's first change is found through the application_id index, so only the applications that reached the status are read:
+    started = (
+        db.select(db.func.min(history.changed_at).label("started_at"))
+        .where(history.application_id == reached.c.application_id)
+        .lateral()
+    )
+    seconds = db.func.extract("epoch", reached.c.reached_at - started.c.started_at)
+    row = db.session.execute(db.select(*duration_stats(seconds)).select_from(reached).join(started, db.true())).one()
+    return {
+        "status": status,
+        "count": row.count,
+        **{name: days(getattr(row, name)) for name in ("mean_days", *PERCENTILES)},
+    }
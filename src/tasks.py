@@ -0,0 +1,177 @@
+"""Background task queue backed by the tasks table.
+
+Controllers call enqueue() to add a task to the current database session, so the task is committed (or rolled back) in the same transaction as the write that caused it.
+Workers started with the `flask worker` command claim tasks using SELECT ... FOR UPDATE SKIP LOCKED, so any number of worker threads and processes can share the queue without claiming the same task twice.
+Failed tasks are retried with exponential backoff, and are marked as "dead" once they have used up all of their attempts.
+"""
+
+from main import db
+from models.tasks import Task
+
+from flask import current_app
+from datetime import datetime, timedelta
+import multiprocessing
+import signal
+import threading
+import traceback
+
+handlers = {}
+
+
+def task(name):
+    """Registers a function as the handler for tasks with the given name.
+
+    The task's payload is passed to the handler as keyword arguments, and the handler runs inside an app context.
+    """
+
+    def decorator(fn):
+        handlers[name] = fn
+        return fn
+
+    return decorator
+
+
+def enqueue(name, delay=None, **payload):
+    """Adds a task to the current database session without committing it.
+
+    Args:
+        name: The name of a registered task handler.
+        delay: An optional timedelta to wait before the task can run.
+        payload: Keyword arguments for the handler, which must be JSON serialisable.
+
+    Returns:
+        The new Task record.
+    """
+    new_task = Task(
+        name=name,
+        payload=payload,
+        max_attempts=current_app.config["TASK_MAX_ATTEMPTS"],
+        run_at=datetime.now() + (delay or timedelta()),
+    )
+    db.session.add(new_task)
+    return new_task
+
+
+def claim_task():
+    """Claims the next task that is ready to run, and commits the claim.
+
+    Tasks that have been "running" for longer than TASK_VISIBILITY_TIMEOUT seconds are assumed to belong to a worker that stopped, and can be claimed again.
+    A stale task that has already used up all of its attempts is marked as "dead" rather than run again, so a task that keeps killing its worker isn't retried forever.
+
+    Returns:
+        The claimed Task record, or None if no task is ready.
+    """
+    while True:
+        now = datetime.now()
+        stale = now - timedelta(seconds=current_app.config["TASK_VISIBILITY_TIMEOUT"])
+        query = (
+            db.select(Task)
+            .where(
+                Task.status.in_(("queued", "running")),
+                Task.run_at <= now,
+                db.or_(Task.status == "queued", Task.locked_at < stale),
+            )
+            .order_by(Task.run_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        claimed = db.session.scalar(query)
+        if claimed and claimed.status == "running" and claimed.attempts >= claimed.max_attempts:
+            claimed.status = "dead"
+            claimed.locked_at = None
+            claimed.last_error = f"The worker running the task stopped on each of its {claimed.attempts} attempts"
+            db.session.commit()
+            current_app.logger.error(f"Task {claimed.id} ({claimed.name}) is dead after {claimed.attempts} attempts")
+            continue
+        if claimed:
+            claimed.status = "running"
+            claimed.locked_at = now
+            claimed.attempts += 1
+        db.session.commit()
+        return claimed
+
+
+def run_task(claimed):
+    """Runs a claimed task and records the outcome.
+
+    On success the task is marked as "done". On failure the handler's changes are rolled back, and the task is either requeued with exponential backoff or marked as "dead" if it has no attempts left.
+    """
+    task_id = claimed.id
+    try:
+        handler = handlers[claimed.name]
+        handler(**claimed.payload)
+        claimed.status = "done"
+        claimed.locked_at = None
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        failed = db.session.get(Task, task_id)
+        failed.last_error = traceback.format_exc()
+        failed.locked_at = None
+        if failed.attempts >= failed.max_attempts:
+            failed.status = "dead"
+            current_app.logger.error(f"Task {task_id} ({failed.name}) is dead after {failed.attempts} attempts")
+        else:
+            backoff = current_app.config["TASK_RETRY_BACKOFF"] * 2 ** (failed.attempts - 1)
+            failed.status = "queued"
+            failed.run_at = datetime.now() + timedelta(seconds=backoff)
+        db.session.commit()
+
+
+def worker_loop(app, stop, poll_interval):
+    """Claims and runs tasks until the stop event is set, sleeping for poll_interval seconds whenever the queue is empty."""
+    with app.app_context():
+        try:
+            while not stop.is_set():
+                claimed = claim_task()
+                if claimed:
+                    run_task(claimed)
+                else:
+                    stop.wait(poll_interval)
+        finally:
+            db.session.remove()
+
+
+def run_worker_threads(app, threads, poll_interval):
+    """Runs a pool of worker threads in this process until it receives SIGINT or SIGTERM."""
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    pool = [
+        threading.Thread(target=worker_loop, args=(app, stop, poll_interval), daemon=True)
+        for _ in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    while any(thread.is_alive() for thread in pool):
+        for thread in pool:
+            thread.join(timeout=1)
+
+
+def _worker_process(threads, poll_interval):
+    from main import create_app
+
+    run_worker_threads(create_app(), threads, poll_interval)
+
+
+def run_workers(app, processes, threads, poll_interval):
+    """Runs the worker pool, either in this process or across several child processes each with their own threads and database connections."""
+    app.logger.info(f"Starting {processes} worker process(es) with {threads} thread(s) each")
+    if processes <= 1:
+        run_worker_threads(app, threads, poll_interval)
+        return
+    # the parent's connections must not be shared with the children:
+    db.engine.dispose()
+    children = [
+        multiprocessing.Process(target=_worker_process, args=(threads, poll_interval))
+        for _ in range(processes)
+    ]
+    for child in children:
+        child.start()
+    signal.signal(signal.SIGTERM, lambda *args: [child.terminate() for child in children])
+    try:
+        for child in children:
+            child.join()
+    except KeyboardInterrupt:
+        for child in children:
+            child.join()
@@ -0,0 +1,140 @@
+"""Test fixtures for the API, run against a real PostgreSQL database.
+
+The tables are created and seeded once per test session, and every test then runs inside a transaction that is rolled back when it ends,
+so tests always start from the seeded data without recreating anything. The app's session joins that transaction through a savepoint,
+so the commits and rollbacks made by the routes only release or roll back the savepoint, and the test's changes are still undone at the end.
+
+Tests run in parallel with pytest-xdist (`pytest -n auto`), where each worker process has its own database, named after the worker,
+which is created if it doesn't exist. The databases are named after TEST_DATABASE_URL, or DATABASE_URL with a "_test" suffix,
+so the tests never change the development database.
+
+Writes made outside the app's session aren't rolled back: the audit log, Idempotency-Key claims and shared job board responses are written on their own connections,
+so those tables are emptied after any test that adds to them. TestingConfig writes the audit log synchronously, and the audit buffer is also flushed
+before the tables are emptied, in case a test turns write-behind on, so a test's audit rows can't be written after the cleanup and show up in a later test.
+The staff and job board caches are also cleared, as they may hold changes that were rolled back.
+"""
+
+import os
+
+os.environ["FLASK_ENV"] = "testing"
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+import pytest
+
+
+def worker_database_url():
+    """Returns the URL of this worker's test database, creating the database if it doesn't exist."""
+    if os.environ.get("TEST_DATABASE_URL"):
+        url = make_url(os.environ["TEST_DATABASE_URL"])
+    else:
+        url = make_url(os.environ["DATABASE_URL"])
+        url = url.set(database=f"{url.database}_test")
+    worker = os.environ.get("PYTEST_XDIST_WORKER")
+    if worker:
+        url = url.set(database=f"{url.database}_{worker}")
+    engine = create_engine(url.set(database="postgres"), isolation_level="AUTOCOMMIT")
+    with engine.connect() as connection:
+        exists = connection.exec_driver_sql("SELECT 1 FROM pg_database WHERE datname = %s", (url.database,)).scalar()
+        if not exists:
+            connection.exec_driver_sql(f'CREATE DATABASE "{url.database}"')
+    engine.dispose()
+    return url.render_as_string(hide_password=False)
+
+
+# the app reads DATABASE_URL when it is created, so it must be replaced before then:
+os.environ["DATABASE_URL"] = worker_database_url()
+
+from main import create_app, db
+from partitions import create_all_partitions
+from audit import audit_buffer
+from staff_cache import staff_cache
+from job_board_cache import job_board_cache
+from flask_sqlalchemy.session import Session
+from flask_jwt_extended import create_access_token
+
+# tables written on a separate connection, outside the test's transaction:
+UNTRANSACTED_TABLES = ("audit_log", "idempotency_keys", "cached_responses")
+
+ADMIN_EMAIL = "elizabeth.riley@example.com"
+STAFF_EMAIL = "irene.ryan@example.com"
+CANDIDATE_EMAIL = "maurice.bailey@example.com"
+
+
+class BoundSession(Session):
+    """The app's session class, bound to the test's connection instead of looking up the engine for each query."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        return bind if bind is not None else self.bind
+
+
+@pytest.fixture(scope="session")
+def app():
+    """Creates the app, and recreates and seeds the tables once for the test session."""
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        create_all_partitions()
+        result = app.test_cli_runner().invoke(args=["db", "seed"])
+        assert result.exit_code == 0, result.output
+    return app
+
+
+@pytest.fixture(autouse=True)
+def transaction(app):
+    """Runs the test inside a transaction on one connection, which the app's session joins with a savepoint, and rolls it back afterwards.
+
+    Each request still gets its own session, as in the app, but they all share the connection. Tests can check the database
+    from inside `with app.app_context():`, which sees the changes made by their requests.
+    """
+    with app.app_context():
+        connection = db.engine.connect()
+    outer = connection.begin()
+    app_session = db.session
+    db.session = db._make_scoped_session(
+        {"class_": BoundSession, "bind": connection, "join_transaction_mode": "create_savepoint"}
+    )
+    try:
+        yield connection
+    finally:
+        db.session = app_session
+        outer.rollback()
+        connection.close()
+        staff_cache.clear()
+        job_board_cache.invalidate()
+        audit_buffer.flush()
+        with app.app_context(), db.engine.begin() as cleanup:
+            for table in UNTRANSACTED_TABLES:
+                if cleanup.exec_driver_sql(f"SELECT EXISTS (SELECT 1 FROM {table})").scalar():
+                    cleanup.exec_driver_sql(f"TRUNCATE {table}")
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def user_headers(app, email):
+    with app.app_context():
+        user_id = db.session.execute(db.text("SELECT id FROM users WHERE email = :email"), {"email": email}).scalar_one()
+        db.session.remove()
+        return {"Authorization": f"Bearer {create_access_token(identity=str(user_id))}"}
+
+
+@pytest.fixture(scope="session")
+def admin_headers(app):
+    """Authorization headers for a seeded admin Staff user."""
+    return user_headers(app, ADMIN_EMAIL)
+
+
+@pytest.fixture(scope="session")
+def staff_headers(app):
+    """Authorization headers for a seeded Staff user without the admin permission."""
+    return user_headers(app, STAFF_EMAIL)
+
+
+@pytest.fixture(scope="session")
+def candidate_headers(app):
+    """Authorization headers for a seeded Candidate user."""
+    return user_headers(app, CANDIDATE_EMAIL)
@@ -0,0 +1,91 @@
+from main import db
+from models.tasks import Task
+from models.application_status_history import ApplicationStatusChange
+
+from datetime import datetime, timedelta
+
+NEW_APPLICATION = {
+    "job_id": 2,
+    "location": "Sydney",
+    "working_rights": "Citizen",
+    "notice_period": "2 weeks",
+    "salary_expectations": 150000,
+    "resume": "https://www.example.com/resume.pdf",
+}
+
+
+def test_create_application(client, candidate_headers):
+    response = client.post("/applications/", json=NEW_APPLICATION, headers=candidate_headers)
+    assert response.status_code == 201
+    assert response.json["job"]["title"] == "Account Director"
+
+
+def test_create_application_requires_a_candidate(client, staff_headers):
+    response = client.post("/applications/", json=NEW_APPLICATION, headers=staff_headers)
+    assert response.status_code == 401
+
+
+def test_create_application_for_missing_job(client, candidate_headers):
+    response = client.post("/applications/", json={**NEW_APPLICATION, "job_id": 999}, headers=candidate_headers)
+    assert response.status_code == 404
+
+
+def test_applications_are_only_listed_for_admins(client, admin_headers, staff_headers):
+    assert len(client.get("/applications/", headers=admin_headers).json) == 2
+    assert client.get("/applications/", headers=staff_headers).status_code == 403
+
+
+def test_filter_applications(client, admin_headers):
+    response = client.get("/applications/?job_id=2&fields=id", headers=admin_headers)
+    assert response.json == [{"id": 2}]
+    assert client.get("/applications/?status=Hired", headers=admin_headers).status_code == 400
+
+
+def test_update_status_records_history_and_queues_notification(app, client, admin_headers, staff_headers):
+    response = client.patch("/applications/1/", json={"status": "Offer"}, headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json["status"] == "Offer"
+    history = client.get("/applications/1/history/", headers=staff_headers).json
+    assert [(change["from_status"], change["to_status"]) for change in history][-1] == ("To review", "Offer")
+    with app.app_context():
+        tasks = db.session.scalars(db.select(Task).filter_by(name="notify_application_status")).all()
+        assert [task.payload["status"] for task in tasks] == ["Offer"]
+
+
+def test_update_status_requires_admin(client, staff_headers):
+    assert client.patch("/applications/1/", json={"status": "Offer"}, headers=staff_headers).status_code == 403
+
+
+def test_bulk_status_update(client, admin_headers):
+    client.patch("/applications/2/", json={"status": "Rejected"}, headers=admin_headers)
+    response = client.patch(
+        "/applications/status/", json={"ids": [1, 2, 999], "status": "Rejected"}, headers=admin_headers
+    )
+    assert response.status_code == 200
+    assert response.json == {"updated": [1], "unchanged": [2], "not_found": [999]}
+
+
+def test_time_to_offer(client, admin_headers):
+    client.patch("/applications/1/", json={"status": "Offer"}, headers=admin_headers)
+    response = client.get("/applications/analytics/time-to-offer/", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json["count"] == 1
+
+
+def test_time_to_offer_only_counts_the_first_offer(app, client, admin_headers):
+    with app.app_context():
+        db.session.add(
+            ApplicationStatusChange(
+                application_id=1, job_id=1, from_status="To review", to_status="Offer", changed_at=datetime.now() - timedelta(days=800)
+            )
+        )
+        db.session.commit()
+    client.patch("/applications/1/", json={"status": "Offer"}, headers=admin_headers)
+    response = client.get("/applications/analytics/time-to-offer/", headers=admin_headers)
+    assert response.json["count"] == 0
+
+
+def test_delete_application_requires_admin(client, admin_headers, staff_headers):
+    assert client.delete("/applications/2/", headers=staff_headers).status_code == 403
+    assert client.delete("/applications/2/", headers=admin_headers).status_code == 200
+    assert client.get("/applications/2/", headers=staff_headers).status_code == 404
@@ -0,0 +1,61 @@
+from models.revoked_tokens import RevokedToken
+from revocation import denylist
+
+from flask_jwt_extended import decode_token
+from datetime import datetime, timedelta
+
+
+def test_register_and_login(client):
+    credentials = {"email": "new.user@example.com", "password": "Password123"}
+    assert client.post("/auth/register", json=credentials).status_code == 201
+    response = client.post("/auth/login", json=credentials)
+    assert response.status_code == 200
+    assert response.json["token"]
+
+
+def test_register_duplicate_email(client):
+    credentials = {"email": "irene.ryan@example.com", "password": "Password123"}
+    assert client.post("/auth/register", json=credentials).status_code == 409
+
+
+def test_login_with_wrong_password(client):
+    response = client.post("/auth/login", json={"email": "irene.ryan@example.com", "password": "Wrong1234"})
+    assert response.status_code == 401
+
+
+def test_logout_revokes_the_token(client):
+    token = client.post("/auth/login", json={"email": "irene.ryan@example.com", "password": "Turtle76"}).json["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.post("/auth/logout", headers=headers).status_code == 200
+    assert client.get("/applications/1/", headers=headers).status_code == 401
+
+
+def test_logout_only_revokes_its_own_token(client, staff_headers):
+    assert client.get("/applications/1/", headers=staff_headers).status_code == 200
+
+
+def test_revoke_sessions_requires_admin(client, admin_headers, staff_headers):
+    assert client.post("/auth/revoke/1/", headers=staff_headers).status_code == 403
+    token = client.post("/auth/login", json={"email": "irene.ryan@example.com", "password": "Turtle76"}).json["token"]
+    assert client.post("/auth/revoke/2/", headers=admin_headers).status_code == 200
+    assert client.get("/applications/1/", headers={"Authorization": f"Bearer {token}"}).status_code == 401
+
+
+def test_revoked_sessions_are_restored_after_the_test(client, staff_headers):
+    assert client.get("/applications/1/", headers=staff_headers).status_code == 200
+
+
+def test_login_after_revoke_sessions_in_the_same_second(client, admin_headers):
+    assert client.post("/auth/revoke/2/", headers=admin_headers).status_code == 200
+    token = client.post("/auth/login", json={"email": "irene.ryan@example.com", "password": "Turtle76"}).json["token"]
+    assert client.get("/applications/1/", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+
+
+def test_token_issued_earlier_in_the_same_second_as_revoke_sessions(app, client, staff_headers):
+    # tokens without the issued_at claim only have iat, in whole seconds, so a revocation later in the same second still revokes them:
+    with app.app_context():
+        issued_at = datetime.fromtimestamp(decode_token(staff_headers["Authorization"].split()[1])["iat"])
+        denylist.revoke(
+            RevokedToken(user_id=2, revoked_at=issued_at + timedelta(milliseconds=900), expires_at=issued_at + timedelta(days=1))
+        )
+    assert client.get("/applications/1/", headers=staff_headers).status_code == 401
@@ -0,0 +1,35 @@
+from main import db
+from audit import audit_buffer
+
+
+def test_anonymous_users_only_see_jobs(client):
+    response = client.get("/changes/")
+    assert response.status_code == 200
+    assert {change["table"] for change in response.json["changes"]} == {"jobs"}
+
+
+def test_changes_after_cursor(client, admin_headers, staff_headers):
+    cursor = client.get("/changes/cursor/").json["cursor"]
+    client.patch("/jobs/1/", json={"location": "Brisbane"}, headers=staff_headers)
+    client.patch("/applications/1/", json={"status": "Offer"}, headers=admin_headers)
+    response = client.get(f"/changes/?cursor={cursor}", headers=admin_headers)
+    changes = [(change["table"], change["id"], change["action"]) for change in response.json["changes"]]
+    assert changes == [("jobs", 1, "update"), ("applications", 1, "update")]
+    assert client.get(f"/changes/?cursor={cursor}").json["changes"][0]["record"]["location"] == "Brisbane"
+
+
+def test_invalid_cursor(client):
+    assert client.get("/changes/?cursor=nonsense").status_code == 400
+
+
+def test_audit_rows_written_behind_are_flushed_before_cleanup(app, client, admin_headers, monkeypatch):
+    monkeypatch.setitem(app.config, "AUDIT_WRITE_BEHIND", True)
+    # long enough that the background thread won't flush the change before the test ends:
+    monkeypatch.setitem(app.config, "AUDIT_FLUSH_SECONDS", 60)
+    assert client.patch("/applications/1/", json={"status": "Offer"}, headers=admin_headers).status_code == 200
+
+
+def test_audit_log_is_empty_after_the_previous_test(app):
+    with app.app_context():
+        audit_buffer.flush()
+        assert db.session.scalar(db.text("SELECT count(*) FROM audit_log")) == 0
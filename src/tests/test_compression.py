@@ -0,0 +1,30 @@
+from flask import stream_with_context
+from random import Random
+import gzip
+import json
+import pytest
+
+# chunks of a few MB that don't compress well, so the compressor returns data as it processes them, not only when it is flushed:
+random = Random(1)
+CHUNKS = [json.dumps([{"id": i, "token": f"{random.getrandbits(128):032x}"} for i in range(50000)]) for _ in range(3)]
+
+
+def streamed_response(app, encoding):
+    """Sends a streamed JSON response through the Compress extension's after_request hook."""
+    with app.test_request_context(headers={"Accept-Encoding": encoding}):
+        response = app.response_class(stream_with_context(iter(CHUNKS)), mimetype="application/json")
+        response = app.process_response(response)
+        return response.headers.get("Content-Encoding"), b"".join(response.response)
+
+
+def test_streamed_gzip_round_trip(app):
+    encoding, body = streamed_response(app, "gzip")
+    assert encoding == "gzip"
+    assert gzip.decompress(body).decode() == "".join(CHUNKS)
+
+
+def test_streamed_brotli_round_trip(app):
+    brotli = pytest.importorskip("brotli")
+    encoding, body = streamed_response(app, "br")
+    assert encoding == "br"
+    assert brotli.decompress(body).decode() == "".join(CHUNKS)
@@ -0,0 +1,42 @@
+NEW_INTERVIEW = {
+    "application_id": 2,
+    "interviewer_id": 2,
+    "interview_datetime": "2030-08-01 10:30AM",
+    "length_mins": 30,
+    "format": "Video call",
+}
+
+
+def test_staff_see_their_own_interviews(client, staff_headers):
+    response = client.get("/interviews/", headers=staff_headers)
+    assert [interview["id"] for interview in response.json] == [2]
+
+
+def test_candidates_see_their_own_interviews(client, candidate_headers):
+    response = client.get("/interviews/", headers=candidate_headers)
+    assert [interview["id"] for interview in response.json] == [1, 2]
+
+
+def test_create_interview(client, staff_headers):
+    response = client.post("/interviews/", json=NEW_INTERVIEW, headers=staff_headers)
+    assert response.status_code == 201
+    assert len(client.get("/interviews/", headers=staff_headers).json) == 2
+
+
+def test_create_interview_validation(client, staff_headers):
+    response = client.post("/interviews/", json={**NEW_INTERVIEW, "format": "Carrier pigeon"}, headers=staff_headers)
+    assert response.status_code == 400
+
+
+def test_create_interview_for_missing_interviewer(client, staff_headers):
+    response = client.post("/interviews/", json={**NEW_INTERVIEW, "interviewer_id": 999}, headers=staff_headers)
+    assert response.status_code == 409
+
+
+def test_create_interview_requires_staff(client, candidate_headers):
+    assert client.post("/interviews/", json=NEW_INTERVIEW, headers=candidate_headers).status_code == 403
+
+
+def test_get_interview_requires_admin(client, admin_headers, staff_headers):
+    assert client.get("/interviews/1/", headers=admin_headers).status_code == 200
+    assert client.get("/interviews/1/", headers=staff_headers).status_code == 403
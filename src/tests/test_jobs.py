@@ -0,0 +1,123 @@
+from main import db
+from models.jobs import Job
+import job_board_cache as job_board_cache_module
+
+import gzip
+import json
+
+NEW_JOB = {
+    "title": "Data Engineer",
+    "description": "Build and run our data pipelines.",
+    "department": "Engineering",
+    "location": "Melbourne",
+    "salary_budget": 130000,
+    "hiring_manager_id": 2,
+}
+
+
+def test_open_jobs_hide_salary_from_anonymous_users(client):
+    response = client.get("/jobs/")
+    assert response.status_code == 200
+    assert [job["title"] for job in response.json] == ["DevOps Engineer", "Account Director"]
+    assert all("salary_budget" not in job and "hiring_manager" not in job for job in response.json)
+
+
+def test_open_jobs_show_salary_to_admins(client, admin_headers):
+    response = client.get("/jobs/", headers=admin_headers)
+    assert response.json[0]["salary_budget"] == 140000
+    assert response.json[0]["hiring_manager"] == {"name": "Irene Ryan", "title": "Engineering Manager"}
+
+
+def test_sparse_fieldset(client):
+    response = client.get("/jobs/?fields=id,title")
+    assert response.json[0] == {"id": 1, "title": "DevOps Engineer"}
+    assert client.get("/jobs/?fields=salary_budget").status_code == 400
+
+
+def test_get_missing_job(client):
+    assert client.get("/jobs/999/").status_code == 404
+
+
+def test_create_job(app, client, staff_headers):
+    response = client.post("/jobs/", json=NEW_JOB, headers=staff_headers)
+    assert response.status_code == 201
+    assert response.json["title"] == "Data Engineer"
+    assert response.headers["ETag"]
+    with app.app_context():
+        assert db.session.get(Job, response.json["id"]).location == "Melbourne"
+
+
+def test_create_job_is_rolled_back_after_the_test(client):
+    assert len(client.get("/jobs/all/").json) == 2
+
+
+def test_create_job_requires_staff(client, candidate_headers):
+    assert client.post("/jobs/", json=NEW_JOB).status_code == 401
+    assert client.post("/jobs/", json=NEW_JOB, headers=candidate_headers).status_code == 403
+
+
+def test_create_job_validation(client, staff_headers):
+    response = client.post("/jobs/", json={**NEW_JOB, "title": "D!"}, headers=staff_headers)
+    assert response.status_code == 400
+    assert "title" in response.json["error"]
+
+
+def test_create_job_with_missing_hiring_manager(client, staff_headers):
+    response = client.post("/jobs/", json={**NEW_JOB, "hiring_manager_id": 999}, headers=staff_headers)
+    assert response.status_code == 404
+    # the failed insert only rolled back the request's savepoint, so later requests in the test still work:
+    assert client.get("/jobs/1/").status_code == 200
+
+
+def test_create_job_idempotency_key(client, staff_headers):
+    headers = {**staff_headers, "Idempotency-Key": "create-data-engineer"}
+    first = client.post("/jobs/", json=NEW_JOB, headers=headers)
+    retry = client.post("/jobs/", json=NEW_JOB, headers=headers)
+    assert retry.status_code == 201
+    assert retry.json["id"] == first.json["id"]
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.headers["ETag"] == first.headers["ETag"]
+    other = client.post("/jobs/", json={**NEW_JOB, "title": "Data Analyst"}, headers=headers)
+    assert other.status_code == 422
+
+
+def test_update_job_if_match(client, staff_headers):
+    etag = client.get("/jobs/1/").headers["ETag"]
+    response = client.patch("/jobs/1/", json={"location": "Brisbane"}, headers={**staff_headers, "If-Match": etag})
+    assert response.status_code == 200
+    assert response.json["location"] == "Brisbane"
+    stale = client.patch("/jobs/1/", json={"location": "Perth"}, headers={**staff_headers, "If-Match": etag})
+    assert stale.status_code == 412
+
+
+def test_close_job_removes_it_from_open_jobs(client, staff_headers):
+    client.patch("/jobs/1/", json={"status": "Closed"}, headers=staff_headers)
+    assert [job["id"] for job in client.get("/jobs/").json] == [2]
+
+
+def test_delete_job_requires_admin(client, admin_headers, staff_headers):
+    assert client.delete("/jobs/2/", headers=staff_headers).status_code == 403
+    assert client.delete("/jobs/2/", headers=admin_headers).status_code == 200
+    assert client.get("/jobs/2/").status_code == 404
+
+
+def test_open_jobs_cache_is_invalidated_by_updates(client, staff_headers):
+    assert client.get("/jobs/").json[0]["title"] == "DevOps Engineer"
+    client.patch("/jobs/1/", json={"title": "Platform Engineer"}, headers=staff_headers)
+    assert client.get("/jobs/").json[0]["title"] == "Platform Engineer"
+
+
+def test_open_jobs_cache_keeps_compressed_bodies(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, "COMPRESS_MIN_SIZE", 0)
+    compressed = []
+    compress_body = job_board_cache_module.compress_body
+
+    def counted_compress_body(data, encoding, config):
+        compressed.append(encoding)
+        return compress_body(data, encoding, config)
+
+    monkeypatch.setattr(job_board_cache_module, "compress_body", counted_compress_body)
+    responses = [client.get("/jobs/", headers={"Accept-Encoding": "gzip"}) for _ in range(2)]
+    assert compressed == ["gzip"]
+    assert all(response.headers["Content-Encoding"] == "gzip" for response in responses)
+    assert json.loads(gzip.decompress(responses[1].data)) == client.get("/jobs/").json
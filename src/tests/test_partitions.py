@@ -0,0 +1,40 @@
+from main import db
+from partitions import create_partitions, detach_partitions, maintain_partitions
+
+from datetime import date, datetime
+
+
+def add_audit_row(changed_at):
+    db.session.execute(
+        db.text(
+            "INSERT INTO audit_log (changed_at, table_name, record_id, action, changes) "
+            "VALUES (:changed_at, 'jobs', 1, 'update', '{}')"
+        ),
+        {"changed_at": changed_at},
+    )
+
+
+def count_rows(table):
+    return db.session.scalar(db.text(f"SELECT count(*) FROM {table}"))
+
+
+def test_maintain_partitions_moves_rows_into_new_partitions(app):
+    with app.app_context():
+        add_audit_row(datetime(2020, 3, 15))
+        assert maintain_partitions()["audit_log"]["created"] == ["audit_log_2020_03"]
+        assert count_rows("audit_log_2020_03") == 1
+        assert count_rows("audit_log_default") == 0
+
+
+def test_late_rows_for_a_detached_month_are_moved_into_its_table(app):
+    with app.app_context():
+        create_partitions("audit_log", date(2020, 1, 1), 1)
+        add_audit_row(datetime(2020, 1, 10))
+        assert detach_partitions("audit_log", date(2020, 2, 1)) == ["audit_log_2020_01"]
+        # a backdated row for the detached month lands in the DEFAULT partition:
+        add_audit_row(datetime(2020, 1, 20))
+        assert maintain_partitions()["audit_log"]["created"] == []
+        assert count_rows("audit_log_2020_01") == 2
+        assert count_rows("audit_log_default") == 0
+        # and the next run still succeeds:
+        maintain_partitions()
@@ -0,0 +1,45 @@
+from single_flight import SingleFlight
+
+import threading
+
+
+def test_concurrent_calls_share_one_result():
+    single_flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "body"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(single_flight.do("key", compute, 5)))
+    leader.start()
+    started.wait(5)
+    waiters = [threading.Thread(target=lambda: results.append(single_flight.do("key", compute, 5))) for _ in range(5)]
+    for waiter in waiters:
+        waiter.start()
+    release.set()
+    for thread in [leader, *waiters]:
+        thread.join()
+    assert results == ["body"] * 6
+    assert len(calls) == 1
+
+
+def test_waiter_computes_the_result_itself_after_the_timeout():
+    single_flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def stuck():
+        started.set()
+        release.wait(5)
+        return "leader"
+
+    leader = threading.Thread(target=lambda: single_flight.do("key", stuck, 5))
+    leader.start()
+    started.wait(5)
+    assert single_flight.do("key", lambda: "waiter", 0.05) == "waiter"
+    release.set()
+    leader.join()
@@ -0,0 +1,46 @@
+from staff_cache import staff_cache
+
+
+def test_update_staff_refreshes_nested_hiring_manager(client, admin_headers, staff_headers):
+    assert client.get("/jobs/1/", headers=admin_headers).json["hiring_manager"]["title"] == "Engineering Manager"
+    response = client.patch("/staff/", json={"title": "Head of Engineering"}, headers=staff_headers)
+    assert response.status_code == 200
+    assert client.get("/jobs/1/", headers=admin_headers).json["hiring_manager"]["title"] == "Head of Engineering"
+
+
+def test_update_staff_admin_refreshes_nested_interviewer(client, admin_headers):
+    assert client.get("/interviews/2/", headers=admin_headers).json["interviewer"]["name"] == "Irene Ryan"
+    client.put("/staff/2/", json={"name": "Irene Ryan-Smith"}, headers=admin_headers)
+    assert client.get("/interviews/2/", headers=admin_headers).json["interviewer"]["name"] == "Irene Ryan-Smith"
+
+
+def test_staff_changes_are_cleared_from_the_cache_after_the_test(client, admin_headers):
+    assert client.get("/jobs/1/", headers=admin_headers).json["hiring_manager"] == {
+        "name": "Irene Ryan",
+        "title": "Engineering Manager",
+    }
+
+
+def test_nested_staff_fieldset(client, admin_headers):
+    response = client.get("/jobs/1/?fields=id,hiring_manager.name", headers=admin_headers)
+    assert response.json == {"id": 1, "hiring_manager": {"name": "Irene Ryan"}}
+    assert client.get("/jobs/1/?fields=hiring_manager.admin", headers=admin_headers).status_code == 400
+
+
+def test_serialising_fills_the_cache(client, admin_headers):
+    client.get("/interviews/all", headers=admin_headers)
+    assert staff_cache.missing([1, 2]) == set()
+
+
+def test_delete_staff_invalidates_the_cache(app, client, admin_headers):
+    # Staff 3 isn't the hiring manager or interviewer of anything, so can be deleted:
+    with app.app_context():
+        staff_cache.get(3)
+    assert client.delete("/staff/3/", headers=admin_headers).status_code == 200
+    assert staff_cache.missing([3]) == {3}
+
+
+def test_staff_routes_require_admin(client, staff_headers):
+    new_staff = {"user_id": 6, "name": "Alfred Campbell", "title": "Intern", "admin": False}
+    assert client.post("/staff/", json=new_staff, headers=staff_headers).status_code == 403
+    assert client.delete("/staff/3/", headers=staff_headers).status_code == 403
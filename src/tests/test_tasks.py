@@ -0,0 +1,35 @@
+from main import db
+from models.tasks import Task
+from tasks import claim_task
+
+from datetime import datetime, timedelta
+
+
+def add_task(app, **columns):
+    with app.app_context():
+        new_task = Task(name="send_email", payload={}, max_attempts=3, run_at=datetime.now() - timedelta(minutes=1), **columns)
+        db.session.add(new_task)
+        db.session.commit()
+        return new_task.id
+
+
+def test_claim_queued_task(app):
+    task_id = add_task(app)
+    with app.app_context():
+        claimed = claim_task()
+        assert (claimed.id, claimed.status, claimed.attempts) == (task_id, "running", 1)
+
+
+def test_stale_task_is_claimed_again(app):
+    task_id = add_task(app, status="running", attempts=1, locked_at=datetime.now() - timedelta(hours=1))
+    with app.app_context():
+        claimed = claim_task()
+        assert (claimed.id, claimed.attempts) == (task_id, 2)
+
+
+def test_stale_task_without_attempts_left_is_dead(app):
+    dead_id = add_task(app, status="running", attempts=3, locked_at=datetime.now() - timedelta(hours=1))
+    with app.app_context():
+        assert claim_task() is None
+        dead = db.session.get(Task, dead_id)
+        assert (dead.status, dead.attempts, dead.locked_at) == ("dead", 3, None)
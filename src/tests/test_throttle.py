@@ -0,0 +1,52 @@
+from werkzeug.middleware.proxy_fix import ProxyFix
+import pytest
+
+BAD_LOGIN = {"email": "irene.ryan@example.com", "password": "Wrong1234"}
+GOOD_LOGIN = {"email": "maurice.bailey@example.com", "password": "Namaste55"}
+
+
+@pytest.fixture(autouse=True)
+def throttle(app, tmp_path, monkeypatch):
+    """Turns login throttling on for the test, with buckets in a new SQLite file."""
+    monkeypatch.setitem(app.config, "LOGIN_THROTTLE_ENABLED", True)
+    monkeypatch.setitem(app.config, "LOGIN_THROTTLE_PATH", str(tmp_path / "throttle.sqlite3"))
+
+
+def login(client, credentials, ip="127.0.0.1"):
+    return client.post("/auth/login", json=credentials, environ_base={"REMOTE_ADDR": ip})
+
+
+def test_email_is_throttled_after_its_burst(app, client):
+    for _ in range(app.config["LOGIN_EMAIL_BURST"]):
+        assert login(client, BAD_LOGIN).status_code == 401
+    response = login(client, BAD_LOGIN)
+    assert response.status_code == 429
+    # the bucket is empty, so the next token is a whole refill interval away:
+    assert response.headers["Retry-After"] == str(60 // app.config["LOGIN_EMAIL_PER_MINUTE"])
+    # the email stays throttled from another IP address, even with the right password:
+    assert login(client, {**BAD_LOGIN, "password": "Turtle76"}, ip="10.0.0.2").status_code == 429
+
+
+def test_throttled_email_does_not_affect_other_emails(app, client):
+    for _ in range(app.config["LOGIN_EMAIL_BURST"] + 1):
+        login(client, BAD_LOGIN)
+    assert login(client, GOOD_LOGIN).status_code == 200
+
+
+def test_ip_is_throttled_after_its_burst(app, client):
+    for attempt in range(app.config["LOGIN_IP_BURST"]):
+        assert login(client, {"email": f"user{attempt}@example.com", "password": "Wrong1234"}, ip="10.0.0.1").status_code == 401
+    response = login(client, GOOD_LOGIN, ip="10.0.0.1")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == str(60 // app.config["LOGIN_IP_PER_MINUTE"])
+    assert login(client, GOOD_LOGIN, ip="10.0.0.2").status_code == 200
+
+
+def test_clients_behind_a_proxy_have_their_own_buckets(app, client, monkeypatch):
+    # as create_app does with TRUSTED_PROXY_COUNT set to 1:
+    monkeypatch.setattr(app, "wsgi_app", ProxyFix(app.wsgi_app, x_for=1))
+    for attempt in range(app.config["LOGIN_IP_BURST"]):
+        credentials = {"email": f"user{attempt}@example.com", "password": "Wrong1234"}
+        client.post("/auth/login", json=credentials, headers={"X-Forwarded-For": "203.0.113.1"})
+    assert client.post("/auth/login", json=GOOD_LOGIN, headers={"X-Forwarded-For": "203.0.113.1"}).status_code == 429
+    assert client.post("/auth/login", json=GOOD_LOGIN, headers={"X-Forwarded-For": "203.0.113.2"}).status_code == 200
@@ -0,0 +1,112 @@
+"""Token bucket throttling for login attempts.
+
+Buckets are kept in a small SQLite file on local disk, so every worker process on the host shares the same counts without a round trip to Postgres.
+Each attempt takes one token from the bucket for its key, and tokens refill at a steady rate up to the bucket's capacity.
+"""
+
+from flask import current_app, request
+import functools
+import math
+import random
+import sqlite3
+import threading
+import time
+
+_local = threading.local()
+
+
+def _connection():
+    """Returns this thread's connection to the bucket store, creating the store if needed."""
+    path = current_app.config["LOGIN_THROTTLE_PATH"]
+    connection = getattr(_local, "connection", None)
+    if connection is None or _local.path != path:
+        connection = sqlite3.connect(path, timeout=1, isolation_level=None)
+        # the buckets can be safely lost on a crash, so writes don't need to wait for the disk:
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=OFF")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        _local.connection = connection
+        _local.path = path
+    return connection
+
+
+def take_tokens(buckets):
+    """Takes a token from each bucket in turn, in one transaction, stopping at the first bucket that is empty.
+
+    Args:
+        buckets: (key, capacity, per_minute) tuples, where key is the identity being throttled, such as an email address or IP address,
+            capacity is the maximum number of tokens in the bucket, which is the largest burst allowed,
+            and per_minute is the number of tokens added back to the bucket each minute.
+
+    Returns:
+        0 if a token was taken from every bucket, otherwise the number of seconds until a token will be available in the empty bucket.
+    """
+    connection = _connection()
+    now = time.time()
+    retry_after = 0
+    # one write transaction for all the buckets, as rejected attempts are most of the traffic during an attack:
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        for key, capacity, per_minute in buckets:
+            row = connection.execute(
+                "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * per_minute / 60)
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                retry_after = (1 - tokens) * 60 / per_minute
+            connection.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+            if retry_after:
+                break
+        # buckets idle for an hour are full again, so they can be removed occasionally to keep the store small:
+        if random.random() < 0.001:
+            connection.execute("DELETE FROM buckets WHERE updated < ?", (now - 3600,))
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    return retry_after
+
+
+def throttle_login(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        """Wrapper function for throttling login attempts by client IP address and by email.
+
+        Runs before the login route looks up the user or checks their password, so that a burst of attempts can't use up the workers' CPU on password hashing.
+        Behind reverse proxies, TRUSTED_PROXY_COUNT must be set so that the client's address is taken from X-Forwarded-For, otherwise every client shares the proxy's bucket.
+        If the bucket store can't be reached, the attempt is allowed rather than locking every user out.
+
+        Errors:
+            429: Displayed if there have been too many recent attempts from the IP address or for the email, with a Retry-After header.
+        """
+        config = current_app.config
+        if not config["LOGIN_THROTTLE_ENABLED"]:
+            return fn(*args, **kwargs)
+        body_data = request.get_json(silent=True) or {}
+        email = str(body_data.get("email", "")).strip().lower()
+        try:
+            retry_after = take_tokens(
+                [
+                    (f"ip:{request.remote_addr}", config["LOGIN_IP_BURST"], config["LOGIN_IP_PER_MINUTE"]),
+                    (f"email:{email}", config["LOGIN_EMAIL_BURST"], config["LOGIN_EMAIL_PER_MINUTE"]),
+                ]
+            )
+        except sqlite3.Error as err:
+            current_app.logger.warning(f"Login throttle unavailable: {err}")
+            retry_after = 0
+        if retry_after:
+            return (
+                {"error": "Too many login attempts, please try again later."},
+                429,
+                {"Retry-After": str(math.ceil(retry_after))},
+            )
+        return fn(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,258 @@
+"""Lightweight request tracing, exported in the OpenTelemetry (OTLP) JSON format.
+
+A sampled request is recorded as a trace of spans:
+    one span for the request itself,
+    one span for each SQL statement, with the statement text as it is sent with placeholders, so parameter values are never recorded,
+    one span for each schema dump, so lazy loads triggered while serialising show up as SQL spans inside the dump,
+    one span for each bcrypt hash or check.
+A W3C traceparent header on the incoming request is continued, so the spans join the caller's trace, and its sampled flag is honoured.
+Requests without one are sampled at TRACE_SAMPLE_RATE. Tracing is turned off entirely when the rate is 0 (the default), and unsampled requests only cost a context variable lookup.
+
+Each finished trace is appended to TRACE_EXPORT_PATH as one line of OTLP JSON (an ExportTraceServiceRequest),
+which can be read with the OpenTelemetry Collector's otlpjsonfile receiver, or by any tool that reads the OTLP file exporter's format.
+"""
+
+from flask import g, request
+from marshmallow import Schema
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from contextvars import ContextVar
+import functools
+import json
+import os
+import random
+import re
+import threading
+import time
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_ERROR = 2
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span = ContextVar("current_span", default=None)
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """A timed operation within a trace."""
+
+    __slots__ = ("trace", "span_id", "parent_span_id", "name", "kind", "attributes", "start", "end", "error")
+
+    def __init__(self, trace, name, kind, parent_span_id, attributes):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent_span_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start = time.time_ns()
+        self.end = None
+        self.error = None
+
+    def child(self, name, kind=SPAN_KIND_INTERNAL, **attributes):
+        return Span(self.trace, name, kind, self.span_id, attributes)
+
+    def finish(self, error=None):
+        self.end = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self.trace.spans.append(self)
+
+    def to_otlp(self):
+        data = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [{"key": key, "value": otlp_value(value)} for key, value in self.attributes.items()],
+        }
+        if self.parent_span_id:
+            data["parentSpanId"] = self.parent_span_id
+        if self.error:
+            data["status"] = {"code": STATUS_ERROR, "message": self.error}
+        return data
+
+
+class Trace:
+    """The finished spans of one sampled request."""
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.spans = []
+
+
+def traced(name, fn):
+    """Wraps a function so each call is recorded as a span when the current request is being traced."""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        parent = _current_span.get()
+        if parent is None:
+            return fn(*args, **kwargs)
+        span = parent.child(name)
+        token = _current_span.set(span)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as err:
+            span.finish(err)
+            raise
+        finally:
+            _current_span.reset(token)
+        span.finish()
+        return result
+
+    return wrapper
+
+
+def traced_dump(dump):
+    """Wraps Schema.dump so each top-level dump is recorded as a span named after the schema."""
+
+    @functools.wraps(dump)
+    def wrapper(self, obj, *args, **kwargs):
+        parent = _current_span.get()
+        # nested schemas are dumped once per record, so they are timed as part of the outer dump:
+        if parent is None or parent.name.endswith(".dump"):
+            return dump(self, obj, *args, **kwargs)
+        span = parent.child(f"{type(self).__name__}.dump", **{"schema.many": bool(self.many)})
+        token = _current_span.set(span)
+        try:
+            result = dump(self, obj, *args, **kwargs)
+        except Exception as err:
+            span.finish(err)
+            raise
+        finally:
+            _current_span.reset(token)
+        span.finish()
+        return result
+
+    return wrapper
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    parent = _current_span.get()
+    if parent is not None and context is not None:
+        # only the statement text is recorded, with placeholders where the parameter values go:
+        context._trace_span = parent.child(
+            "db.query",
+            SPAN_KIND_CLIENT,
+            **{"db.system": "postgresql", "db.statement": statement, "db.executemany": executemany},
+        )
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    span = getattr(context, "_trace_span", None)
+    if span is not None:
+        span.attributes["db.rows"] = cursor.rowcount
+        span.finish()
+        context._trace_span = None
+
+
+def handle_error(exception_context):
+    span = getattr(exception_context.execution_context, "_trace_span", None)
+    if span is not None:
+        span.finish(exception_context.original_exception)
+        exception_context.execution_context._trace_span = None
+
+
+class Tracer:
+    """Flask extension that traces sampled requests and exports them to TRACE_EXPORT_PATH."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def init_app(self, app, bcrypt=None):
+        self.config = app.config
+        if self.config["TRACE_SAMPLE_RATE"] <= 0:
+            return
+        self.resource = {
+            "attributes": [{"key": "service.name", "value": otlp_value(self.config["TRACE_SERVICE_NAME"])}]
+        }
+        app.before_request(self.start_request)
+        app.after_request(self.record_response)
+        app.teardown_request(self.end_request)
+        for name, listener in (
+            ("before_cursor_execute", before_cursor_execute),
+            ("after_cursor_execute", after_cursor_execute),
+            ("handle_error", handle_error),
+        ):
+            if not event.contains(Engine, name, listener):
+                event.listen(Engine, name, listener)
+        # the wrappers are only installed once, even if several apps are created:
+        if not hasattr(Schema.dump, "__wrapped__"):
+            Schema.dump = traced_dump(Schema.dump)
+        if bcrypt is not None:
+            for name in ("generate_password_hash", "check_password_hash"):
+                method = getattr(bcrypt, name)
+                if not hasattr(method, "__wrapped__"):
+                    setattr(bcrypt, name, traced(f"bcrypt.{name}", method))
+
+    def start_request(self):
+        """Starts a span for the request if it is sampled, continuing the trace from a traceparent header."""
+        match = TRACEPARENT.match(request.headers.get("traceparent", "").strip().lower())
+        if match and match.group(1) != "0" * 32 and match.group(2) != "0" * 16:
+            trace_id, parent_span_id = match.group(1), match.group(2)
+            sampled = bool(int(match.group(3), 16) & 1)
+        else:
+            trace_id, parent_span_id = os.urandom(16).hex(), None
+            sampled = random.random() < self.config["TRACE_SAMPLE_RATE"]
+        if not sampled:
+            return
+        span = Span(
+            Trace(trace_id),
+            f"{request.method} {request.url_rule.rule if request.url_rule else request.path}",
+            SPAN_KIND_SERVER,
+            parent_span_id,
+            {"http.method": request.method, "http.target": request.path},
+        )
+        g.trace_span = span
+        g.trace_token = _current_span.set(span)
+
+    def record_response(self, response):
+        span = g.get("trace_span")
+        if span is not None:
+            span.attributes["http.status_code"] = response.status_code
+            # the trace context level 2 response header, so a client can look up the trace of its request:
+            response.headers["traceresponse"] = f"00-{span.trace.trace_id}-{span.span_id}-01"
+        return response
+
+    def end_request(self, error=None):
+        span = g.pop("trace_span", None)
+        if span is None:
+            return
+        _current_span.reset(g.pop("trace_token"))
+        span.finish(error)
+        self.export(span.trace)
+
+    def export(self, trace):
+        """Appends a trace to TRACE_EXPORT_PATH as one line of OTLP JSON."""
+        line = json.dumps(
+            {
+                "resourceSpans": [
+                    {
+                        "resource": self.resource,
+                        "scopeSpans": [
+                            {"scope": {"name": "tracing"}, "spans": [span.to_otlp() for span in trace.spans]}
+                        ],
+                    }
+                ]
+            }
+        )
+        with self.lock, open(self.config["TRACE_EXPORT_PATH"], "a") as file:
+            file.write(line + "\n")
+
+
+tracer = Tracer()
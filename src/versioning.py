@@ -0,0 +1,38 @@
+"""Optimistic concurrency control for updates to Jobs, Applications, Interviews and Scorecards.
+
+Each of these models has a version column, set up as SQLAlchemy's version_id_col, which is incremented by every UPDATE.
+The version is sent as the ETag of the record, and a client that sends it back in an If-Match header has its update rejected with a 412 error if the record has changed since.
+Each UPDATE is also made with "WHERE version = <the version that was read>", so an update that races another one between the read and the commit fails
+with a StaleDataError (returned as a 412 error) instead of overwriting it, without any rows being locked.
+If-Match is optional unless REQUIRE_IF_MATCH is turned on.
+"""
+
+from flask import current_app, make_response, request
+
+
+def with_etag(response, record):
+    """Returns a response with the record's version as its ETag."""
+    response = make_response(response)
+    response.set_etag(str(record.version))
+    return response
+
+
+def check_if_match(record):
+    """Checks the request's If-Match header against the record's version before it is updated.
+
+    Returns:
+        None if the update can go ahead, otherwise an error and status code to return instead.
+
+    Errors:
+        412: Returned if the If-Match header doesn't match the record's current ETag.
+        428: Returned if REQUIRE_IF_MATCH is turned on and no If-Match header is provided.
+    """
+    if "If-Match" not in request.headers:
+        if current_app.config["REQUIRE_IF_MATCH"]:
+            return {"error": "An If-Match header with the record's ETag is required to update it"}, 428
+        return None
+    if request.if_match.contains(str(record.version)):
+        return None
+    return {
+        "error": "The record has been changed since it was retrieved, please retrieve it again and retry"
+    }, 412
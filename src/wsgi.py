@@ -0,0 +1,14 @@
+"""Production WSGI entry point.
+
+Run with the settings in gunicorn.conf.py:
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Creating the app imports every model, schema and controller, and the mappers are configured here rather than on the first query, so that with preload_app they are all built once in the master process and shared with the forked workers.
+"""
+
+from main import create_app
+
+from sqlalchemy.orm import configure_mappers
+
+app = create_app()
+configure_mappers()